@@ -0,0 +1,85 @@
+import logging
+import os
+import threading
+from datetime import datetime
+
+from database import save_user_activity
+
+# Как часто сбрасывать накопленную активность пользователей в БД (секунды)
+ACTIVITY_FLUSH_INTERVAL = int(os.getenv("ACTIVITY_FLUSH_INTERVAL", "5"))
+# При таком количестве пользователей в буфере сбрасываем его, не дожидаясь таймера
+ACTIVITY_FLUSH_SIZE = int(os.getenv("ACTIVITY_FLUSH_SIZE", "500"))
+
+
+class ActivityBuffer:
+    """
+    Буфер активности пользователей.
+    Вместо записи в users на каждое сообщение запоминает последние данные
+    каждого пользователя и записывает их одной пачкой.
+    """
+
+    def __init__(self, flush_size, writer=save_user_activity):
+        self.flush_size = flush_size
+        self.writer = writer
+        self._pending = {}  # user_id → данные пользователя
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def record(self, user_data):
+        """
+        Запоминает активность пользователя.
+
+        :param user_data: Данные пользователя (как для add_or_update_user)
+        """
+        user_id = user_data["user_id"]
+        entry = {**user_data, "last_activity": datetime.now()}
+
+        with self._lock:
+            previous = self._pending.get(user_id)
+            # Телефон известен не в каждом сообщении — не теряем его
+            if previous and not entry.get("phone_number"):
+                entry["phone_number"] = previous.get("phone_number")
+            self._pending[user_id] = entry
+            size = len(self._pending)
+
+        if size >= self.flush_size:
+            self.flush(wait=False)
+
+    def flush(self, wait=True):
+        """
+        Записывает накопленную активность в БД.
+        При ошибке записи данные возвращаются в буфер до следующей попытки.
+
+        :param wait: Ждать, если сброс уже выполняется в другом потоке
+        :return: Количество записанных пользователей
+        """
+        if not self._flush_lock.acquire(blocking=wait):
+            return 0
+
+        try:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+
+            if not batch:
+                return 0
+
+            try:
+                self.writer(list(batch.values()))
+            except Exception as e:
+                logging.error(f"Ошибка при сохранении активности пользователей: {e}")
+                with self._lock:
+                    # Более свежие данные, пришедшие во время записи, важнее
+                    for user_id, entry in batch.items():
+                        self._pending.setdefault(user_id, entry)
+                return 0
+
+            return len(batch)
+        finally:
+            self._flush_lock.release()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+
+user_activity = ActivityBuffer(flush_size=ACTIVITY_FLUSH_SIZE)
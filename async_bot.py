@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import os
+import random
+import signal
+
+try:
+    import aiohttp
+    from telebot import util
+    from telebot.async_telebot import AsyncTeleBot
+except ImportError:  # aiohttp не установлен — доступен только синхронный режим
+    aiohttp = None
+
+from http_client import (
+    HTTP_BACKOFF,
+    HTTP_HOST_CONCURRENCY,
+    HTTP_RETRIES,
+    HTTP_TIMEOUT,
+    RETRY_STATUSES,
+)
+from listing_cache import cache_listing, get_cached_listing
+from marketplaces import get_adapter
+
+# Общий лимит открытых соединений aiohttp; на один хост — HTTP_HOST_CONCURRENCY
+ASYNC_HTTP_POOL_SIZE = int(os.getenv("ASYNC_HTTP_POOL_SIZE", "100"))
+
+_session = None
+
+
+def get_session():
+    """Общая aiohttp-сессия для запросов к площадкам (создаётся в цикле событий)."""
+    global _session
+
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=ASYNC_HTTP_POOL_SIZE, limit_per_host=HTTP_HOST_CONCURRENCY
+            ),
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+        )
+    return _session
+
+
+async def close_session():
+    global _session
+
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+async def fetch_text(url, headers=None):
+    """
+    GET-запрос с теми же повторами, что и http_client.request.
+
+    :param url: Адрес запроса
+    :param headers: Заголовки запроса
+    :return: Кортеж (HTTP-статус, тело ответа); сетевые ошибки последней
+             попытки пробрасываются
+    """
+    session = get_session()
+
+    for attempt in range(HTTP_RETRIES + 1):
+        try:
+            async with session.get(url, headers=headers) as response:
+                text = await response.text(errors="replace")
+                if response.status not in RETRY_STATUSES or attempt == HTTP_RETRIES:
+                    return response.status, text
+                logging.warning(
+                    f"{response.url.host} ответил {response.status}, "
+                    f"повтор ({attempt + 1}/{HTTP_RETRIES})"
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt == HTTP_RETRIES:
+                raise
+            logging.warning(
+                f"Ошибка запроса к {url}, повтор ({attempt + 1}/{HTTP_RETRIES}): {e}"
+            )
+
+        await asyncio.sleep(random.uniform(0, HTTP_BACKOFF * 2**attempt))
+
+
+async def get_listing_async(adapter, car_id):
+    """
+    Асинхронный вариант marketplaces.get_listing: тот же кеш и тот же разбор,
+    но запрос к площадке не занимает поток.
+
+    :param adapter: Адаптер площадки
+    :param car_id: ID объявления на площадке
+    :return: Listing или None
+    """
+    listing = get_cached_listing(adapter.source, car_id)
+    if listing is not None:
+        return listing
+
+    try:
+        status_code, text = await fetch_text(
+            adapter.listing_url(car_id), adapter.headers
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.error(f"Request error while fetching {adapter.name} data: {e}")
+        return None
+
+    # Разбор HTML занимает процессор — выполняем его вне цикла событий
+    listing = await asyncio.to_thread(adapter.parse, status_code, text, car_id)
+    if listing is not None:
+        cache_listing(listing)
+    return listing
+
+
+async def prefetch_listings(urls):
+    """
+    Загружает в кеш объявления по ссылкам. Обработчик расчёта после этого
+    берёт их из кеша и не ждёт площадки в потоке.
+
+    :param urls: Ссылки на объявления
+    """
+
+    async def prefetch(url):
+        adapter = get_adapter(url)
+        if adapter is None:
+            return
+        # Короткие ссылки KBChaCha разворачиваются синхронным запросом; ID
+        # остаётся в кеше marketplaces, и расчёт не повторяет редирект
+        car_id = await asyncio.to_thread(adapter.parse_car_id, url)
+        if car_id:
+            await get_listing_async(adapter, car_id)
+
+    results = await asyncio.gather(
+        *(prefetch(url) for url in urls), return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logging.error(f"Ошибка предварительной загрузки объявления: {result}")
+
+
+async def in_chat_order(tails, chat_id, handle):
+    """
+    Выполняет handle() после того, как завершились предыдущие обновления
+    этого чата. Обновления разных чатов друг друга не ждут.
+
+    Без этого ответ на следующий шаг диалога мог бы попасть к обработчикам
+    раньше сообщения со ссылкой, которое ещё ждёт загрузки объявления.
+
+    :param tails: Словарь chat_id → Future последнего обновления чата
+    :param chat_id: ID чата
+    :param handle: Корутинная функция обработки обновления
+    """
+    previous = tails.get(chat_id)
+    done = asyncio.get_running_loop().create_future()
+    tails[chat_id] = done
+
+    try:
+        if previous is not None:
+            # shield: отмена этого обновления не должна отменять предыдущее
+            await asyncio.shield(previous)
+        await handle()
+    finally:
+        done.set_result(None)
+        if tails.get(chat_id) is done:
+            del tails[chat_id]
+
+
+def run_async_bot(sync_bot, prefetch_links):
+    """
+    Запускает бота с асинхронной предзагрузкой объявлений (BOT_MODE=async).
+
+    Обновления получает AsyncTeleBot, а объявления по ссылкам заранее
+    загружаются в кеш через aiohttp. Сам расчёт остаётся синхронным: таможня,
+    курсы, фото и ответы в Telegram выполняются обработчиками синхронного бота
+    в его пуле потоков (BOT_NUM_THREADS). Поэтому одновременно выполняется не
+    больше BOT_NUM_THREADS расчётов, как и в синхронном режиме; предзагрузка
+    лишь не занимает эти потоки ожиданием площадки. Обновления одного чата
+    передаются обработчикам в порядке поступления. Бот и проверка доступа
+    передаются параметрами, чтобы не импортировать main повторно.
+
+    :param sync_bot: TeleBot с зарегистрированными обработчиками
+    :param prefetch_links: Функция message → список ссылок для предзагрузки;
+                           пустой, если пользователь не получит расчёт
+    """
+    if aiohttp is None:
+        raise RuntimeError("Для BOT_MODE=async нужен пакет aiohttp")
+
+    asyncio.run(_poll(sync_bot, prefetch_links))
+
+
+async def _poll(sync_bot, prefetch_links):
+    bot = AsyncTeleBot(sync_bot.token)
+    chat_tails = {}
+
+    @bot.message_handler(content_types=util.content_type_media)
+    async def dispatch_message(message):
+        async def handle():
+            if message.text:
+                # Лимит и подписка проверяются до загрузки объявлений
+                links = await asyncio.to_thread(prefetch_links, message)
+                if links:
+                    await prefetch_listings(links)
+            await asyncio.to_thread(sync_bot.process_new_messages, [message])
+
+        await in_chat_order(chat_tails, message.chat.id, handle)
+
+    @bot.callback_query_handler(func=lambda call: True)
+    async def dispatch_callback_query(call):
+        async def handle():
+            await asyncio.to_thread(sync_bot.process_new_callback_query, [call])
+
+        await in_chat_order(chat_tails, call.message.chat.id, handle)
+
+    print("Бот запущен с асинхронной предзагрузкой объявлений")
+
+    polling = asyncio.ensure_future(bot.polling(non_stop=True))
+    # По SIGTERM (остановка worker на Heroku) прекращаем получать обновления;
+    # накопленные данные после выхода из run_async_bot сохраняет shutdown в main
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, polling.cancel)
+
+    try:
+        await polling
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await close_session()
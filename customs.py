@@ -0,0 +1,215 @@
+import datetime
+import logging
+import os
+import threading
+import time
+
+import requests
+
+import http_client
+
+# Курсы ЦБ РФ (EUR и KRW к рублю) — нужны для пересчёта цены и ставок в евро
+CBR_DAILY_URL = "https://www.cbr-xml-daily.ru/daily_json.js"
+
+# Версионированные таблицы ставок для физлиц (личное пользование).
+# Новая версия добавляется в начало списка с датой вступления в силу,
+# старые остаются для воспроизводимости расчётов.
+RATE_TABLES = [
+    {
+        "version": "2025-01",
+        "effective_from": datetime.date(2025, 1, 1),
+        # Таможенный сбор за оформление: (верхняя граница стоимости в ₽, сбор в ₽)
+        "clearance_fee": [
+            (200000, 1067),
+            (450000, 2134),
+            (1200000, 4269),
+            (2700000, 11746),
+            (4200000, 16524),
+            (5500000, 21344),
+            (7000000, 27540),
+            (None, 30000),
+        ],
+        # Авто до 3 лет: (верхняя граница стоимости в €, % от стоимости, минимум €/см³)
+        "duty_new": [
+            (8500, 0.54, 2.5),
+            (16700, 0.48, 3.5),
+            (42300, 0.48, 5.5),
+            (84500, 0.48, 7.5),
+            (169000, 0.48, 15.0),
+            (None, 0.48, 20.0),
+        ],
+        # Авто от 3 до 5 лет: (верхняя граница объёма в см³, €/см³)
+        "duty_3_5": [
+            (1000, 1.5),
+            (1500, 1.7),
+            (1800, 2.5),
+            (2300, 2.7),
+            (3000, 3.0),
+            (None, 3.6),
+        ],
+        # Авто старше 5 лет: (верхняя граница объёма в см³, €/см³)
+        "duty_over_5": [
+            (1000, 3.0),
+            (1500, 3.2),
+            (1800, 3.5),
+            (2300, 4.8),
+            (3000, 5.0),
+            (None, 5.7),
+        ],
+        # Утилизационный сбор: (верхняя граница объёма, до 3 лет ₽, старше 3 лет ₽)
+        "util": [
+            (3000, 3400, 5200),
+            (3500, 2153400, 3296800),
+            (None, 2742200, 3604800),
+        ],
+    },
+]
+
+# Типы двигателя, которые считаются по ставкам для ДВС
+# (1 - бензин, 2 - дизель, 3 - гибрид). Электромобили считаются через calcus.ru.
+SUPPORTED_ENGINE_TYPES = {1, 2, 3}
+
+# После неудачного запроса к ЦБ РФ следующая попытка — не раньше чем через (секунды)
+CBR_RETRY_INTERVAL = int(os.getenv("CBR_RETRY_INTERVAL", "300"))
+
+_cbr_rates = {}
+_cbr_rates_date = None
+_cbr_failed_at = None
+_cbr_refreshing = False
+_cbr_lock = threading.Lock()
+
+
+def get_rate_table(on_date=None):
+    """
+    Возвращает таблицу ставок, действующую на указанную дату.
+
+    :param on_date: Дата расчёта (по умолчанию — сегодня)
+    :return: Словарь с таблицами ставок
+    """
+    on_date = on_date or datetime.date.today()
+    for table in RATE_TABLES:
+        if table["effective_from"] <= on_date:
+            return table
+    return RATE_TABLES[-1]
+
+
+def _pick_bracket(brackets, value):
+    """Находит первую строку таблицы, верхняя граница которой не меньше value."""
+    for bracket in brackets:
+        if bracket[0] is None or value <= bracket[0]:
+            return bracket
+    return brackets[-1]
+
+
+def get_cbr_rates():
+    """
+    Получает курсы EUR и KRW к рублю от ЦБ РФ. Курсы кешируются на текущий день.
+
+    Запрос выполняется вне блокировки и только одним потоком: остальные расчёты
+    в это время используют прежние курсы. После ошибки ЦБ РФ не опрашивается
+    CBR_RETRY_INTERVAL секунд, чтобы расчёты не ждали недоступный сервис.
+
+    :return: Словарь {"EUR": ₽ за 1 €, "KRW": ₽ за 1 ₩} или None при ошибке
+    """
+    global _cbr_rates, _cbr_rates_date, _cbr_failed_at, _cbr_refreshing
+
+    today = datetime.date.today()
+
+    with _cbr_lock:
+        if _cbr_rates_date == today and _cbr_rates:
+            return _cbr_rates
+
+        retry_pending = (
+            _cbr_failed_at is not None
+            and time.monotonic() - _cbr_failed_at < CBR_RETRY_INTERVAL
+        )
+        if _cbr_refreshing or retry_pending:
+            # Если курсы уже были получены ранее — используем их
+            return _cbr_rates or None
+
+        _cbr_refreshing = True
+
+    try:
+        response = http_client.get(CBR_DAILY_URL)
+        response.raise_for_status()
+        valutes = response.json()["Valute"]
+
+        rates = {
+            code: valutes[code]["Value"] / valutes[code]["Nominal"]
+            for code in ("EUR", "KRW")
+        }
+    except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+        logging.error(f"Ошибка при получении курсов ЦБ РФ: {e}")
+        with _cbr_lock:
+            _cbr_failed_at = time.monotonic()
+            return _cbr_rates or None
+    else:
+        with _cbr_lock:
+            _cbr_rates = rates
+            _cbr_rates_date = today
+            _cbr_failed_at = None
+    finally:
+        with _cbr_lock:
+            _cbr_refreshing = False
+
+    logging.info(f"Курсы ЦБ РФ: EUR → {rates['EUR']}, KRW → {rates['KRW']}")
+    return rates
+
+
+def format_amount(value):
+    """Форматирует сумму так же, как её возвращает calcus.ru (например, "4 269.00")."""
+    return f"{value:,.2f}".replace(",", " ")
+
+
+def calculate_customs(
+    engine_volume, car_price, car_age, engine_type=1, rates=None, on_date=None
+):
+    """
+    Рассчитывает таможенные платежи для физлица без обращения к calcus.ru.
+
+    :param engine_volume: Объём двигателя (куб. см)
+    :param car_price: Цена авто в вонах
+    :param car_age: Возрастная категория ("0-3", "3-5", "5-7", "7-0")
+    :param engine_type: Тип двигателя (1 - бензин, 2 - дизель, 3 - гибрид, 4 - электромобиль)
+    :param rates: Курсы {"EUR": ..., "KRW": ...} в рублях (по умолчанию — курсы ЦБ РФ)
+    :param on_date: Дата, на которую берётся таблица ставок
+    :return: Словарь в формате calcus.ru ("sbor", "tax", "util", "total")
+             или None, если расчёт локально невозможен
+    """
+    if int(engine_type) not in SUPPORTED_ENGINE_TYPES:
+        return None
+
+    rates = rates or get_cbr_rates()
+    if not rates:
+        return None
+
+    table = get_rate_table(on_date)
+    engine_volume = int(engine_volume)
+
+    price_rub = int(car_price) * rates["KRW"]
+    price_eur = price_rub / rates["EUR"]
+
+    # Таможенный сбор за оформление
+    sbor = _pick_bracket(table["clearance_fee"], price_rub)[1]
+
+    # Единая таможенная ставка
+    if car_age == "0-3":
+        _, percent, min_per_cc = _pick_bracket(table["duty_new"], price_eur)
+        tax_eur = max(price_eur * percent, engine_volume * min_per_cc)
+    elif car_age == "3-5":
+        tax_eur = engine_volume * _pick_bracket(table["duty_3_5"], engine_volume)[1]
+    else:
+        tax_eur = engine_volume * _pick_bracket(table["duty_over_5"], engine_volume)[1]
+    tax = tax_eur * rates["EUR"]
+
+    # Утилизационный сбор
+    util_bracket = _pick_bracket(table["util"], engine_volume)
+    util = util_bracket[1] if car_age == "0-3" else util_bracket[2]
+
+    return {
+        "sbor": format_amount(sbor),
+        "tax": format_amount(tax),
+        "util": format_amount(util),
+        "total": format_amount(sbor + tax + util),
+        "rates_version": table["version"],
+    }
@@ -1,98 +1,168 @@
 import os
+import re
+import threading
+import time
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from contextlib import contextmanager
+from psycopg2 import extensions, pool
+from psycopg2.extras import RealDictCursor, execute_values
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")  # Берём из переменных окружения
 
+# Настройки пула соединений
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_MAX_LIFETIME = int(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))  # Секунды
+# Соединение, простаивавшее дольше этого времени, проверяется перед выдачей
+DB_POOL_HEALTH_CHECK_IDLE = int(os.getenv("DB_POOL_HEALTH_CHECK_IDLE", "30"))
+
+_pool = None
+_pool_lock = threading.Lock()
+# Пул psycopg2 не ждёт освобождения соединений, поэтому ограничиваем выдачу сами
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+# id(соединения) → [время создания, время последнего использования]
+_connection_times = {}
+
+# Каталог миграций схемы и ключ advisory-блокировки на время их применения
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATIONS_LOCK_ID = 80412001
+
+
+def get_pool():
+    """Создаёт пул соединений при первом обращении."""
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = pool.ThreadedConnectionPool(
+                DB_POOL_MIN,
+                DB_POOL_MAX,
+                DATABASE_URL,
+                cursor_factory=RealDictCursor,
+            )
+        return _pool
 
-def connect_db():
-    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
 
+def _discard_connection(db_pool, conn):
+    _connection_times.pop(id(conn), None)
+    db_pool.putconn(conn, close=True)
 
-def create_tables():
-    """Создаём таблицу заказов, если её нет."""
-    with connect_db() as conn:
-        with conn.cursor() as cur:
-            # Таблица пользователей
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id BIGINT PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    phone_number TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-                """
-            )
 
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS orders (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT NOT NULL,
-                    car_id TEXT NOT NULL,  -- ✅ Добавили car_id
-                    title TEXT NOT NULL,
-                    price TEXT,
-                    link TEXT NOT NULL,
-                    year TEXT,
-                    month TEXT,
-                    mileage TEXT,
-                    engine_volume INT,
-                    transmission TEXT,
-                    user_name TEXT,
-                    full_name TEXT,
-                    phone_number TEXT,
-                    images TEXT[],
-                    status TEXT DEFAULT '🔄 Не заказано',
-                    total_cost_usd FLOAT,
-                    total_cost_krw FLOAT,
-                    total_cost_rub FLOAT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """
-            )
+def _checkout_connection(db_pool):
+    """Выдаёт живое соединение из пула, заменяя устаревшие и оборванные."""
+    while True:
+        conn = db_pool.getconn()
+        now = time.monotonic()
+        created_at, last_used = _connection_times.setdefault(id(conn), [now, now])
 
-            # Добавляем поле created_at для существующей таблицы, если его еще нет
-            cur.execute(
-                """
-                DO $$
-                BEGIN
-                    IF NOT EXISTS (
-                        SELECT 1 
-                        FROM information_schema.columns 
-                        WHERE table_name='orders' AND column_name='created_at'
-                    ) THEN
-                        ALTER TABLE orders ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
-                    END IF;
-                END$$;
-                """
-            )
+        if conn.closed or now - created_at > DB_POOL_MAX_LIFETIME:
+            _discard_connection(db_pool, conn)
+            continue
 
-            # ✅ Добавляем таблицу расчётов
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS calculations (
-                    user_id BIGINT PRIMARY KEY,
-                    count INT DEFAULT 0
-                );
-            """
-            )
+        if now - last_used > DB_POOL_HEALTH_CHECK_IDLE:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                _discard_connection(db_pool, conn)
+                continue
+
+        return conn
 
-            # ✅ Таблица подписок
+
+def _checkin_connection(db_pool, conn):
+    """Возвращает соединение в пул или закрывает его, если оно в плохом состоянии."""
+    if (
+        conn.closed
+        or conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE
+    ):
+        _discard_connection(db_pool, conn)
+        return
+
+    _connection_times[id(conn)][1] = time.monotonic()
+    db_pool.putconn(conn)
+
+
+@contextmanager
+def connect_db():
+    """
+    Берёт соединение из пула. При выходе фиксирует транзакцию
+    (или откатывает при ошибке) и возвращает соединение в пул.
+    """
+    db_pool = get_pool()
+
+    with _pool_slots:
+        conn = _checkout_connection(db_pool)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+            raise
+        finally:
+            _checkin_connection(db_pool, conn)
+
+
+def close_db_pool():
+    """Закрывает все соединения пула (при остановке бота); повторный вызов безопасен."""
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _connection_times.clear()
+
+
+def run_migrations(path=MIGRATIONS_DIR):
+    """
+    Применяет ещё не выполненные миграции из каталога migrations.
+
+    Файлы называются NNNN_описание.sql и выполняются по возрастанию номера.
+    Все миграции применяются в одной транзакции под advisory-блокировкой,
+    поэтому одновременный запуск нескольких экземпляров бота безопасен.
+
+    :param path: Каталог с SQL-файлами миграций
+    """
+    migrations = sorted(
+        (int(match.group(1)), filename)
+        for filename in os.listdir(path)
+        if (match := re.match(r"^(\d+)_.+\.sql$", filename))
+    )
+
+    with connect_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATIONS_LOCK_ID,))
             cur.execute(
                 """
-                CREATE TABLE IF NOT EXISTS subscriptions (
-                    user_id BIGINT PRIMARY KEY,
-                    status BOOLEAN DEFAULT FALSE
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
                 """
             )
+            cur.execute("SELECT version FROM schema_migrations;")
+            applied = {row["version"] for row in cur.fetchall()}
+
+            for version, filename in migrations:
+                if version in applied:
+                    continue
+
+                with open(os.path.join(path, filename), encoding="utf-8") as f:
+                    cur.execute(f.read())
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s);",
+                    (version, filename),
+                )
+                print(f"✅ Применена миграция {filename}")
 
             conn.commit()
 
@@ -106,6 +176,7 @@ def add_order(order):
                 INSERT INTO orders (user_id, car_id, title, price, link, year, month, mileage, engine_volume, 
                                     transmission, user_name, phone_number, images, status, total_cost_usd, total_cost_krw, total_cost_rub)
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (user_id, car_id) DO NOTHING
                 RETURNING id;
             """,
                 (
@@ -133,41 +204,37 @@ def add_order(order):
 
 def get_orders(user_id):
     """Получает список заказов пользователя из базы данных"""
-    conn = psycopg2.connect(DATABASE_URL)
-    cur = conn.cursor()
-
-    cur.execute(
-        """
-        SELECT id, car_id, title, status, link, year, month, mileage, engine_volume, transmission,
-               total_cost_usd, total_cost_krw, total_cost_rub, user_name, full_name
-        FROM orders
-        WHERE user_id = %s
-    """,
-        (user_id,),
-    )
-
-    orders = cur.fetchall()
-    cur.close()
-    conn.close()
+    with connect_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT id, car_id, title, status, link, year, month, mileage, engine_volume, transmission,
+                       total_cost_usd, total_cost_krw, total_cost_rub, user_name, full_name
+                FROM orders
+                WHERE user_id = %s
+            """,
+                (user_id,),
+            )
+            orders = cur.fetchall()
 
     # Преобразуем в список словарей
     return [
         {
-            "id": order[1],  # ✅ car_id теперь вместо id
-            "car_id": order[1],
-            "title": order[2],
-            "status": order[3],
-            "link": order[4],
-            "year": order[5],
-            "month": order[6],
-            "mileage": order[7],
-            "engine_volume": order[8],
-            "transmission": order[9],
-            "total_cost_usd": order[10],
-            "total_cost_krw": order[11],
-            "total_cost_rub": order[12],
-            "user_name": order[13],
-            "full_name": order[14],  # ✅ ФИО клиента теперь загружается
+            "id": order["car_id"],  # ✅ car_id теперь вместо id
+            "car_id": order["car_id"],
+            "title": order["title"],
+            "status": order["status"],
+            "link": order["link"],
+            "year": order["year"],
+            "month": order["month"],
+            "mileage": order["mileage"],
+            "engine_volume": order["engine_volume"],
+            "transmission": order["transmission"],
+            "total_cost_usd": order["total_cost_usd"],
+            "total_cost_krw": order["total_cost_krw"],
+            "total_cost_rub": order["total_cost_rub"],
+            "user_name": order["user_name"],
+            "full_name": order["full_name"],  # ✅ ФИО клиента теперь загружается
         }
         for order in orders
     ]
@@ -192,15 +259,101 @@ def get_all_orders():
     return orders  # Теперь `orders` — список словарей, а не кортежей!
 
 
+def get_orders_page(after_id=None, limit=10, status_filter=None, before_id=None):
+    """
+    Возвращает одну страницу заказов для менеджеров (keyset-пагинация по id).
+
+    :param after_id: Следующая страница — заказы с id больше указанного
+    :param limit: Размер страницы
+    :param status_filter: Показывать только заказы с этим статусом
+    :param before_id: Предыдущая страница — заказы с id меньше указанного
+    :return: Словарь {"orders": [...], "has_prev": bool, "has_next": bool}
+    """
+    conditions = []
+    params = []
+
+    if status_filter is not None:
+        conditions.append("status = %s")
+        params.append(status_filter)
+
+    if before_id is not None:
+        conditions.append("id < %s")
+        params.append(before_id)
+        direction = "DESC"
+    else:
+        if after_id is not None:
+            conditions.append("id > %s")
+            params.append(after_id)
+        direction = "ASC"
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    with connect_db() as conn:
+        with conn.cursor() as cur:
+            # Берём на одну строку больше, чтобы узнать, есть ли ещё страница
+            cur.execute(
+                f"""
+                SELECT id, car_id, user_id, user_name, phone_number, title, status, link,
+                       year, month, mileage, engine_volume, transmission,
+                       total_cost_usd, total_cost_krw, total_cost_rub, full_name
+                FROM orders
+                {where}
+                ORDER BY id {direction}
+                LIMIT %s
+                """,
+                (*params, limit + 1),
+            )
+            orders = cur.fetchall()
+
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+
+    if before_id is not None:
+        # Дошли до начала списка — показываем полную первую страницу
+        if not has_more:
+            return get_orders_page(limit=limit, status_filter=status_filter)
+        orders.reverse()
+        return {"orders": orders, "has_prev": True, "has_next": True}
+
+    return {"orders": orders, "has_prev": after_id is not None, "has_next": has_more}
+
+
+def get_order_by_id(order_id):
+    """Получает заказ по его id или None, если заказа нет."""
+    with connect_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT id, car_id, user_id, user_name, phone_number, title, status, link,
+                       year, month, mileage, engine_volume, transmission,
+                       total_cost_usd, total_cost_krw, total_cost_rub, full_name
+                FROM orders
+                WHERE id = %s;
+                """,
+                (order_id,),
+            )
+            return cur.fetchone()
+
+
 def update_order_status_in_db(order_id, new_status):
-    """Обновляет статус заказа в базе данных"""
+    """
+    Обновляет статус заказа в базе данных.
+
+    :return: Обновлённый заказ (id, user_id, car_id, title, link, status)
+             или None, если заказа нет
+    """
     with connect_db() as conn:
         with conn.cursor() as cur:
             cur.execute(
-                "UPDATE orders SET status = %s WHERE id = %s;",  # ❗ Используем `id`
+                """
+                UPDATE orders SET status = %s WHERE id = %s
+                RETURNING id, user_id, car_id, title, link, status;
+                """,  # ❗ Используем `id`
                 (new_status, order_id),
             )
+            order = cur.fetchone()
             conn.commit()
+    return order
 
 
 def update_user_phone(user_id, phone_number, car_id):
@@ -298,18 +451,120 @@ def check_user_subscription(user_id):
             return result["status"] if result else False
 
 
+def consume_quote(user_data, free_limit, free_access=False):
+    """
+    Одним запросом регистрирует пользователя, проверяет подписку и списывает расчёт.
+
+    Счётчик увеличивается, только если бесплатные расчёты ещё есть, есть подписка
+    или у пользователя свободный доступ. Проверка и увеличение выполняются
+    атомарно, поэтому два одновременных запроса не получат лишний расчёт.
+
+    :param user_data: Данные пользователя (как для add_or_update_user)
+    :param free_limit: Количество бесплатных расчётов
+    :param free_access: Пользователь считает без ограничений
+    :return: Словарь {"subscribed", "count", "allowed"}. Для отклонённого
+        расчёта count — значение на момент начала запроса: при одновременных
+        запросах оно может быть меньше итогового
+    """
+    with connect_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                WITH upsert_user AS (
+                    INSERT INTO users (user_id, username, first_name, last_name, phone_number)
+                    VALUES (%(user_id)s, %(username)s, %(first_name)s, %(last_name)s, %(phone_number)s)
+                    ON CONFLICT (user_id)
+                    DO UPDATE SET
+                        username = EXCLUDED.username,
+                        first_name = EXCLUDED.first_name,
+                        last_name = EXCLUDED.last_name,
+                        last_activity = CURRENT_TIMESTAMP
+                ),
+                sub AS (
+                    SELECT COALESCE(
+                        (SELECT status FROM subscriptions WHERE user_id = %(user_id)s),
+                        FALSE
+                    ) AS subscribed
+                ),
+                calc AS (
+                    INSERT INTO calculations (user_id, count)
+                    SELECT %(user_id)s, 1 FROM sub
+                    WHERE %(free_limit)s > 0 OR sub.subscribed OR %(free_access)s
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET count = calculations.count + 1
+                    WHERE calculations.count < %(free_limit)s
+                       OR %(free_access)s
+                       OR (SELECT subscribed FROM sub)
+                    RETURNING count
+                )
+                SELECT
+                    sub.subscribed,
+                    COALESCE(
+                        (SELECT count FROM calc),
+                        (SELECT count FROM calculations WHERE user_id = %(user_id)s),
+                        0
+                    ) AS count,
+                    EXISTS (SELECT 1 FROM calc) AS allowed
+                FROM sub;
+                """,
+                {
+                    "user_id": user_data["user_id"],
+                    "username": user_data.get("username", None),
+                    "first_name": user_data.get("first_name", None),
+                    "last_name": user_data.get("last_name", None),
+                    "phone_number": user_data.get("phone_number", None),
+                    "free_limit": free_limit,
+                    "free_access": free_access,
+                },
+            )
+            return cur.fetchone()
+
+
+def quote_available(user_id, free_limit):
+    """
+    Проверяет без списания, остались ли у пользователя расчёты: бесплатные
+    или по подписке, записанной в БД. Окончательное решение принимает
+    consume_quote.
+
+    :param user_id: ID пользователя
+    :param free_limit: Количество бесплатных расчётов
+    :return: True, если расчёт будет разрешён
+    """
+    with connect_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT COALESCE(
+                    (SELECT status FROM subscriptions WHERE user_id = %(user_id)s),
+                    FALSE
+                ) OR COALESCE(
+                    (SELECT count FROM calculations WHERE user_id = %(user_id)s),
+                    0
+                ) < %(free_limit)s AS available;
+                """,
+                {"user_id": user_id, "free_limit": free_limit},
+            )
+            return cur.fetchone()["available"]
+
+
 def get_all_users():
     """Получает список всех уникальных пользователей бота из базы данных"""
     with connect_db() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 """
-                SELECT DISTINCT ON (user_id) user_id, user_name, phone_number, 
-                       (SELECT count FROM calculations WHERE calculations.user_id = orders.user_id) as calc_count,
-                       (SELECT status FROM subscriptions WHERE subscriptions.user_id = orders.user_id) as subscription,
-                       (SELECT created_at FROM orders o WHERE o.user_id = orders.user_id ORDER BY id ASC LIMIT 1) as first_activity
-                FROM orders
-                ORDER BY user_id, id ASC
+                SELECT first_order.user_id, first_order.user_name, first_order.phone_number,
+                       calculations.count as calc_count,
+                       subscriptions.status as subscription,
+                       first_order.created_at as first_activity
+                FROM (
+                    SELECT DISTINCT ON (user_id) user_id, user_name, phone_number, created_at
+                    FROM orders
+                    ORDER BY user_id, id ASC
+                ) first_order
+                LEFT JOIN calculations ON calculations.user_id = first_order.user_id
+                LEFT JOIN subscriptions ON subscriptions.user_id = first_order.user_id
+                ORDER BY first_order.user_id
                 """
             )
             users = cur.fetchall()
@@ -351,18 +606,134 @@ def add_or_update_user(user_data):
             conn.commit()
 
 
+def save_user_activity(users):
+    """
+    Добавляет или обновляет пачку пользователей одним запросом.
+
+    :param users: Список данных пользователей (user_id, username, first_name,
+                  last_name, phone_number, last_activity)
+    """
+    if not users:
+        return
+
+    # Одинаковый порядок строк во всех пачках исключает взаимные блокировки
+    users = sorted(users, key=lambda user: user["user_id"])
+
+    with connect_db() as conn:
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                """
+                INSERT INTO users (user_id, username, first_name, last_name, phone_number, last_activity)
+                VALUES %s
+                ON CONFLICT (user_id)
+                DO UPDATE SET
+                    username = EXCLUDED.username,
+                    first_name = EXCLUDED.first_name,
+                    last_name = EXCLUDED.last_name,
+                    last_activity = GREATEST(users.last_activity, EXCLUDED.last_activity)
+                """,
+                [
+                    (
+                        user["user_id"],
+                        user.get("username", None),
+                        user.get("first_name", None),
+                        user.get("last_name", None),
+                        user.get("phone_number", None),
+                        user["last_activity"],
+                    )
+                    for user in users
+                ],
+            )
+            conn.commit()
+
+
 def get_all_bot_users():
     """Получает список всех пользователей бота из таблицы users"""
     with connect_db() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 """
-                SELECT user_id, username, first_name, last_name, phone_number, created_at, last_activity,
-                       (SELECT count FROM calculations WHERE calculations.user_id = users.user_id) as calc_count,
-                       (SELECT status FROM subscriptions WHERE subscriptions.user_id = users.user_id) as subscription
+                SELECT users.user_id, username, first_name, last_name, phone_number,
+                       created_at, last_activity,
+                       calculations.count as calc_count,
+                       subscriptions.status as subscription
                 FROM users
-                ORDER BY created_at DESC
+                LEFT JOIN calculations ON calculations.user_id = users.user_id
+                LEFT JOIN subscriptions ON subscriptions.user_id = users.user_id
+                ORDER BY users.created_at DESC
                 """
             )
             users = cur.fetchall()
     return users
+
+
+def get_photo_file_ids(urls):
+    """Возвращает сохранённые file_id для URL фото и отмечает их использование."""
+    if not urls:
+        return {}
+
+    with connect_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE photo_file_ids
+                SET last_used = CURRENT_TIMESTAMP
+                WHERE url = ANY(%s)
+                RETURNING url, file_id
+                """,
+                (list(urls),),
+            )
+            rows = cur.fetchall()
+            conn.commit()
+    return {row["url"]: row["file_id"] for row in rows}
+
+
+def save_photo_file_ids(file_ids):
+    """Сохраняет соответствие URL фото → file_id в Telegram."""
+    if not file_ids:
+        return
+
+    with connect_db() as conn:
+        with conn.cursor() as cur:
+            cur.executemany(
+                """
+                INSERT INTO photo_file_ids (url, file_id)
+                VALUES (%s, %s)
+                ON CONFLICT (url) DO UPDATE
+                SET file_id = EXCLUDED.file_id,
+                    last_used = CURRENT_TIMESTAMP;
+                """,
+                list(file_ids.items()),
+            )
+            conn.commit()
+
+
+def delete_photo_file_ids(urls):
+    """Удаляет file_id, которые Telegram больше не принимает."""
+    with connect_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM photo_file_ids WHERE url = ANY(%s);", (list(urls),)
+            )
+            conn.commit()
+
+
+def evict_photo_file_ids(limit):
+    """Оставляет в кеше file_id только limit последних использованных записей."""
+    with connect_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM photo_file_ids
+                WHERE url IN (
+                    SELECT url FROM photo_file_ids
+                    ORDER BY last_used DESC
+                    OFFSET %s
+                );
+                """,
+                (limit,),
+            )
+            deleted = cur.rowcount
+            conn.commit()
+    print(f"🧹 Удалено устаревших file_id фото: {deleted}")
@@ -0,0 +1,91 @@
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Таймаут по умолчанию для всех внешних запросов (секунды)
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+# Повторы идемпотентных запросов (GET) при сетевых ошибках и ответах 5xx/429
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))  # Базовая пауза (секунды)
+# Размер пула keep-alive соединений и лимит одновременных запросов на хост
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_HOST_CONCURRENCY = int(os.getenv("HTTP_HOST_CONCURRENCY", "8"))
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_sessions = {}
+_host_slots = {}
+_lock = threading.Lock()
+
+
+def get_session(host):
+    """Возвращает общую keep-alive сессию хоста (api.encar.com, calcus.ru и т.д.)."""
+    with _lock:
+        session = _sessions.get(host)
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[host] = session
+            _host_slots[host] = threading.BoundedSemaphore(HTTP_HOST_CONCURRENCY)
+
+        return session
+
+
+def _backoff(attempt):
+    """Пауза перед повтором: экспоненциальная, со случайным разбросом."""
+    time.sleep(random.uniform(0, HTTP_BACKOFF * 2**attempt))
+
+
+def request(method, url, retries=None, **kwargs):
+    """
+    Выполняет запрос через общую сессию хоста.
+
+    :param method: HTTP-метод
+    :param url: Адрес запроса
+    :param retries: Количество повторов (по умолчанию HTTP_RETRIES для GET,
+                    для остальных методов повторов нет)
+    :return: requests.Response; сетевые ошибки последней попытки пробрасываются
+    """
+    method = method.upper()
+    host = urlparse(url).netloc
+    session = get_session(host)
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+
+    if retries is None:
+        retries = HTTP_RETRIES if method in IDEMPOTENT_METHODS else 0
+
+    for attempt in range(retries + 1):
+        try:
+            with _host_slots[host]:
+                response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == retries:
+                raise
+            print(f"Ошибка запроса к {host}, повтор ({attempt + 1}/{retries}): {e}")
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            print(
+                f"{host} ответил {response.status_code}, "
+                f"повтор ({attempt + 1}/{retries})"
+            )
+            response.close()
+
+        _backoff(attempt)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
@@ -0,0 +1,40 @@
+import os
+
+from utils import TTLCache
+
+# Кеш разобранных объявлений (Encar, KBChaCha, Chutcha)
+LISTING_CACHE_SIZE = int(os.getenv("LISTING_CACHE_SIZE", "2000"))
+LISTING_CACHE_TTL = int(os.getenv("LISTING_CACHE_TTL", "900"))  # Секунды
+LISTING_CACHE_MAX_BYTES = int(os.getenv("LISTING_CACHE_MAX_BYTES", str(16 * 1024**2)))
+
+
+def _listing_size(listing):
+    """Примерный размер объявления в байтах (по его текстовому представлению)."""
+    return len(repr(listing).encode())
+
+
+# (площадка, ID объявления) → Listing
+listing_cache = TTLCache(
+    maxsize=LISTING_CACHE_SIZE,
+    ttl=LISTING_CACHE_TTL,
+    maxbytes=LISTING_CACHE_MAX_BYTES,
+    sizeof=_listing_size,
+)
+
+
+def get_cached_listing(source, car_id):
+    """Возвращает объявление из кеша или None, если записи нет."""
+    return listing_cache.get((source, str(car_id)))
+
+
+def cache_listing(listing):
+    """Сохраняет объявление. Listing неизменяем, поэтому копия не нужна."""
+    listing_cache.set((listing.source, listing.car_id), listing)
+
+
+def log_listing_cache_stats():
+    stats = listing_cache.stats()
+    print(
+        f"Кеш объявлений: {stats['size']} записей, {stats['bytes']} байт, "
+        f"{stats['hit_ratio']:.0%} попаданий"
+    )
@@ -2,54 +2,97 @@ import json
 import telebot
 import os
 import re
+import signal
 import requests
+import http_client
 import locale
 import logging
 import urllib.parse
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html import escape
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from database import (
-    create_tables,
+    run_migrations,
     get_orders,
-    get_all_orders,
+    get_orders_page,
+    get_order_by_id,
     add_order,
     update_user_phone,
     update_order_status_in_db,
     delete_order_from_db,
     update_user_name,
     update_user_name,
-    get_calculation_count,
     increment_calculation_count,
-    check_user_subscription,
     update_user_subscription,
+    consume_quote,
+    quote_available,
     get_all_users,
-    add_or_update_user,
     user_exists,
     get_all_bot_users,
+    evict_photo_file_ids,
+    close_db_pool,
 )
-from bs4 import BeautifulSoup
-from io import BytesIO
 from telebot import types
+from telebot.apihelper import ApiTelegramException
 from dotenv import load_dotenv
 from types import SimpleNamespace
-from urllib.parse import urlparse, parse_qs
+from photos import PHOTO_FILE_ID_LIMIT, PhotoAlbum, send_local_photo
+from activity import ACTIVITY_FLUSH_INTERVAL, user_activity
+from quote_context import QuoteContext, quote_contexts
+from listing_cache import log_listing_cache_stats
+from marketplaces import extract_listing_urls, get_adapter, get_listing
+from subscriptions import SubscriptionCache
+from telegram_api import setup_telegram_client
 from utils import (
-    generate_encar_photo_url,
     clean_number,
     get_customs_fees,
     calculate_age,
     format_number,
+    format_batch_table,
     get_customs_fees_manual,
+    load_customs_cache,
+    save_customs_cache,
+    StageTimer,
 )
 
 CALCULATE_CAR_TEXT = "Рассчитать Автомобиль (Encar, KBChaCha, ChutCha)"
+# Сообщение-ссылка на одно объявление, по которому запускается расчёт
+CALCULATE_LINK_PATTERN = (
+    r"^https?://(www|fem)\.encar\.com/.*"
+    r"|^https?://(www\.)?kbchachacha\.com/.*"
+    r"|^https?://m\.kbchachacha\.com/.*"
+    r"|^https?://(web\.)?chutcha\.net/.*"
+)
 CHANNEL_USERNAME = "dey_trading"
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
 load_dotenv()
 bot_token = os.getenv("BOT_TOKEN")
-bot = telebot.TeleBot(bot_token)
+# Количество потоков обработки сообщений
+BOT_NUM_THREADS = int(os.getenv("BOT_NUM_THREADS", "8"))
+# Режим получения обновлений: sync — TeleBot, async — AsyncTeleBot с предзагрузкой
+# объявлений через aiohttp (сам расчёт в обоих режимах синхронный)
+BOT_MODE = os.getenv("BOT_MODE", "sync")
+setup_telegram_client()
+bot = telebot.TeleBot(bot_token, num_threads=BOT_NUM_THREADS)
+
+# Общий пул потоков для параллельных этапов расчёта (загрузка фото и т.п.)
+QUOTE_WORKERS = int(os.getenv("QUOTE_WORKERS", "16"))
+quote_executor = ThreadPoolExecutor(
+    max_workers=QUOTE_WORKERS, thread_name_prefix="quote"
+)
+
+# Пакетный расчёт: сколько ссылок считаем за раз и какой файл со ссылками принимаем
+BATCH_MAX_LINKS = int(os.getenv("BATCH_MAX_LINKS", "20"))
+# Отдельный небольшой пул для пакетных расчётов, чтобы пакет из BATCH_MAX_LINKS
+# ссылок не занимал потоки quote_executor, в которых загружаются фото
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+batch_executor = ThreadPoolExecutor(
+    max_workers=BATCH_WORKERS, thread_name_prefix="batch"
+)
+BATCH_MAX_FILE_SIZE = int(os.getenv("BATCH_MAX_FILE_SIZE", str(256 * 1024)))
 
 # Set locale for number formatting
 locale.setlocale(locale.LC_ALL, "en_US.UTF-8")
@@ -58,8 +101,6 @@ locale.setlocale(locale.LC_ALL, "en_US.UTF-8")
 last_error_message_id = {}
 
 # global variables
-car_data = {}
-car_id_external = ""
 total_car_price = 0
 krw_rub_rate = 0
 rub_to_krw_rate = 0
@@ -67,12 +108,6 @@ usd_rate = 0
 users = set()
 user_data = {}
 
-car_month = None
-car_year = None
-
-vehicle_id = None
-vehicle_no = None
-
 usd_to_krw_rate = 0
 usd_to_rub_rate = 0
 
@@ -89,6 +124,9 @@ MANAGERS = [728438182, 627689711]
 
 FREE_ACCESS_USERS = {728438182, 627689711}
 
+# Количество бесплатных расчётов без подписки
+FREE_CALCULATIONS = int(os.getenv("FREE_CALCULATIONS", "2"))
+
 ORDER_STATUSES = {
     "1": "🚗 Авто выкуплен (на базе)",
     "2": "🚢 Отправлен в порт г. Пусан на погрузку",
@@ -98,11 +136,25 @@ ORDER_STATUSES = {
     "6": "🚛 Доставляется клиенту",
 }
 
+# Фильтры списка заказов у менеджера: код → статус в БД (None — все заказы).
+# "fav" — авто в избранном, ещё не заказанные; "wait" — заказы, ждущие менеджера
+ORDER_FILTERS = {
+    "all": None,
+    "fav": "🔄 Не заказано",
+    "wait": "🕒 Ожидает подтверждения",
+    **ORDER_STATUSES,
+}
+ORDERS_PAGE_SIZE = int(os.getenv("ORDERS_PAGE_SIZE", "5"))
+
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("add_favorite_"))
 def add_favorite_car(call):
-    global car_data
     user_id = call.message.chat.id
+    car_id = call.data[len("add_favorite_") :]
+
+    # Берём расчёт именно той машины, под которой нажата кнопка
+    ctx = quote_contexts.get((user_id, car_id))
+    car_data = ctx.car_data if ctx else {}
 
     if not car_data or "name" not in car_data:
         bot.answer_callback_query(
@@ -519,72 +571,207 @@ def process_order(user_id, car_id, username, phone_number):
     )
 
 
-@bot.message_handler(commands=["orders"])
-def show_orders(message):
-    manager_id = message.chat.id
-
-    # Проверяем, является ли пользователь менеджером
-    if manager_id not in MANAGERS:
-        bot.send_message(manager_id, "❌ У вас нет доступа к заказам.")
-        return
+def render_orders_page(status_code="all", after_id=None, before_id=None):
+    """
+    Формирует одну страницу списка заказов для менеджера.
+
+    :param status_code: Код фильтра из ORDER_FILTERS
+    :param after_id: Показать заказы после этого id
+    :param before_id: Показать заказы до этого id
+    :return: Текст сообщения и клавиатура
+    """
+    # Кнопки фильтров из старых сообщений могут ссылаться на удалённые коды
+    if status_code not in ORDER_FILTERS:
+        status_code = "all"
+
+    page = get_orders_page(
+        after_id=after_id,
+        limit=ORDERS_PAGE_SIZE,
+        status_filter=ORDER_FILTERS.get(status_code),
+        before_id=before_id,
+    )
+    orders = page["orders"]
 
-    # Загружаем все заказы из базы данных
-    orders = get_all_orders()
+    keyboard = types.InlineKeyboardMarkup()
 
     if not orders:
-        bot.send_message(manager_id, "📭 Нет активных заказов.")
-        return
+        response_text = "📭 Нет активных заказов."
+    else:
+        # Страница открывается заново с заказов после anchor (0 — первая страница)
+        anchor = orders[0]["id"] - 1 if page["has_prev"] else 0
+        blocks = []
+        for order in orders:
+            order_id = order["id"]
+            # Название, имя и телефон вводят пользователи — экранируем для HTML
+            car_title = escape(order.get("title") or "Без названия")
+            user_id = order.get("user_id")
+            user_name = escape(order.get("user_name") or "Неизвестный")
+            phone_number = escape(order.get("phone_number") or "Неизвестно")
+            car_status = escape(order.get("status") or "🔄 Не заказано")
+            car_link = escape(order.get("link") or "#")
+            car_id = escape(str(order.get("car_id") or "Неизвестно"))
+
+            user_mention = (
+                f"<a href='tg://user?id={user_id}'>{user_name}</a>"
+                if user_id
+                else user_name
+            )
 
-    for idx, order in enumerate(orders, start=1):
-        order_id = order.get("id", "Неизвестно")
-        car_title = order.get("title", "Без названия")
-        user_id = order.get("user_id")
-        user_name = order.get("user_name", "Неизвестный")
-        phone_number = order.get("phone_number", "Неизвестно")
-        car_status = order.get("status", "🕒 Ожидает подтверждения")
-        car_link = order.get("link", "#")
-        car_id = order.get("car_id", "Неизвестно")
+            blocks.append(
+                f"📦 <b>Заказ #{order_id}</b>\n"
+                f"🚗 <b>{car_title}</b> (ID: {car_id})\n"
+                f"👤 Заказчик: {user_mention}\n"
+                f"📞 Телефон: <b>{phone_number}</b>\n"
+                f"📌 <b>Статус:</b> {car_status}\n"
+                f"<a href='{car_link}'>🔗 Ссылка на автомобиль</a>"
+            )
 
-        if car_status == "🔄 Не заказано":
-            car_status = "🕒 Ожидает подтверждения"
+            keyboard.add(
+                types.InlineKeyboardButton(
+                    f"📌 Статус #{order_id}",
+                    callback_data=f"update_status_{order_id}_{status_code}_{anchor}",
+                ),
+                types.InlineKeyboardButton(
+                    f"🗑 Удалить #{order_id}",
+                    callback_data=f"delete_order_{order_id}",
+                ),
+            )
 
-        user_mention = (
-            f"[{user_name}](tg://user?id={user_id})" if user_id else user_name
+        response_text = "📋 <b>Заказы</b>\n\n" + "\n\n".join(blocks)
+
+        # Кнопки навигации по страницам
+        navigation = []
+        if page["has_prev"]:
+            navigation.append(
+                types.InlineKeyboardButton(
+                    "⬅️ Назад",
+                    callback_data=f"orders_prev_{status_code}_{orders[0]['id']}",
+                )
+            )
+        if page["has_next"]:
+            navigation.append(
+                types.InlineKeyboardButton(
+                    "Вперёд ➡️",
+                    callback_data=f"orders_next_{status_code}_{orders[-1]['id']}",
+                )
+            )
+        if navigation:
+            keyboard.row(*navigation)
+
+    # Кнопки фильтра по статусу
+    filters = []
+    for code, status in ORDER_FILTERS.items():
+        label = status or "Все заказы"
+        if code == status_code:
+            label = f"✔️ {label}"
+        filters.append(
+            types.InlineKeyboardButton(label, callback_data=f"orders_filter_{code}")
         )
+    for i in range(0, len(filters), 2):
+        keyboard.row(*filters[i : i + 2])
 
-        response_text = (
-            # f"📦 *Заказ #{idx}*\n"
-            f"🚗 *{car_title}* (ID: {car_id})\n\n"
-            f"👤 Заказчик: {user_mention}\n"
-            f"📞 Телефон: *{phone_number}*\n\n"
-            f"📌 *Статус:* {car_status}\n\n"
-            f"[🔗 Ссылка на автомобиль]({car_link})"
+    keyboard.add(
+        types.InlineKeyboardButton(
+            "Вернуться в главное меню ", callback_data="main_menu"
         )
+    )
 
-        # Создаем клавиатуру
-        keyboard = types.InlineKeyboardMarkup()
+    return response_text, keyboard
+
+
+def status_picker_keyboard(order_id, page=None):
+    """
+    Клавиатура выбора нового статуса заказа.
+
+    :param order_id: id заказа
+    :param page: (код фильтра, якорь страницы), если выбор открыт из списка заказов
+    """
+    suffix = f"_{page[0]}_{page[1]}" if page else ""
+
+    keyboard = types.InlineKeyboardMarkup()
+    for status_code, status_text in ORDER_STATUSES.items():
         keyboard.add(
             types.InlineKeyboardButton(
-                f"📌 Обновить статус ({car_title})",
-                callback_data=f"update_status_{order_id}",
-            ),
-            types.InlineKeyboardButton(
-                f"🗑 Удалить заказ ({car_title})",
-                callback_data=f"delete_order_{order_id}",
-            ),
+                status_text,
+                callback_data=f"set_status_{order_id}_{status_code}{suffix}",
+            )
         )
+    if page:
         keyboard.add(
             types.InlineKeyboardButton(
-                "Вернуться в главное меню ", callback_data="main_menu"
+                "⬅️ Отмена", callback_data=f"orders_page_{page[0]}_{page[1]}"
             )
         )
+    return keyboard
 
-        bot.send_message(
-            manager_id,
+
+def edit_orders_page(call, response_text, keyboard):
+    """Заменяет страницу списка заказов в сообщении, по которому нажата кнопка."""
+    try:
+        bot.edit_message_text(
             response_text,
-            parse_mode="Markdown",
+            call.message.chat.id,
+            call.message.message_id,
+            parse_mode="HTML",
             reply_markup=keyboard,
+            disable_web_page_preview=True,
         )
+    except ApiTelegramException as e:
+        # Повторное нажатие на тот же фильтр не меняет сообщение
+        if "message is not modified" not in str(e):
+            raise
+
+
+@bot.message_handler(commands=["orders"])
+def show_orders(message):
+    manager_id = message.chat.id
+
+    # Проверяем, является ли пользователь менеджером
+    if manager_id not in MANAGERS:
+        bot.send_message(manager_id, "❌ У вас нет доступа к заказам.")
+        return
+
+    # Одно сообщение с первой страницей; дальше оно редактируется кнопками
+    response_text, keyboard = render_orders_page()
+    bot.send_message(
+        manager_id,
+        response_text,
+        parse_mode="HTML",
+        reply_markup=keyboard,
+        disable_web_page_preview=True,
+    )
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("orders_"))
+def orders_page_callback(call):
+    """Листает список заказов и переключает фильтр в том же сообщении."""
+    manager_id = call.message.chat.id
+
+    if manager_id not in MANAGERS:
+        bot.answer_callback_query(call.id, "❌ У вас нет доступа к заказам.")
+        return
+
+    parts = call.data.split("_")
+    action = parts[1]
+
+    if action == "filter":
+        response_text, keyboard = render_orders_page(status_code=parts[2])
+    elif action == "page":
+        # Возврат к странице, например после выбора статуса
+        response_text, keyboard = render_orders_page(
+            status_code=parts[2], after_id=int(parts[3]) or None
+        )
+    elif action == "next":
+        response_text, keyboard = render_orders_page(
+            status_code=parts[2], after_id=int(parts[3])
+        )
+    else:
+        response_text, keyboard = render_orders_page(
+            status_code=parts[2], before_id=int(parts[3])
+        )
+
+    edit_orders_page(call, response_text, keyboard)
+    bot.answer_callback_query(call.id)
 
 
 @bot.message_handler(commands=["stats"])
@@ -675,38 +862,26 @@ def show_stats(message):
 @bot.callback_query_handler(func=lambda call: call.data.startswith("update_status_"))
 def update_order_status(call):
     manager_id = call.message.chat.id
-    order_id = call.data.split("_")[-1]  # ❗ Здесь приходит ID заказа, а не car_id
 
-    print(f"🔍 Менеджер {manager_id} пытается обновить статус заказа {order_id}")
+    # update_status_{id заказа}, из списка заказов — ещё _{фильтр}_{якорь страницы}
+    order_id, *page = call.data[len("update_status_") :].split("_")
 
-    # Получаем заказы из базы
-    orders = get_all_orders()  # ✅ Загружаем все заказы
-    # print(f"📦 Все заказы из базы: {orders}")  # Логируем заказы
+    print(f"🔍 Менеджер {manager_id} пытается обновить статус заказа {order_id}")
 
-    # 🛠 Теперь ищем по `id`, а не по `car_id`
-    order_found = next(
-        (order for order in orders if str(order["id"]) == str(order_id)), None
-    )
+    order_found = get_order_by_id(order_id) if order_id.isdigit() else None
 
     if not order_found:
         print(f"❌ Ошибка: заказ {order_id} не найден!")
         bot.answer_callback_query(call.id, "❌ Ошибка: заказ не найден.")
         return
 
-    user_id = order_found["user_id"]
-    car_id = order_found["car_id"]  # ✅ Берём car_id
-
-    # 🔥 Генерируем кнопки статусов
-    keyboard = types.InlineKeyboardMarkup()
-    for status_code, status_text in ORDER_STATUSES.items():
-        keyboard.add(
-            types.InlineKeyboardButton(
-                status_text,
-                callback_data=f"set_status_{user_id}_{order_id}_{status_code}",
-            )
-        )
-
-    bot.send_message(manager_id, "📌 Выберите новый статус:", reply_markup=keyboard)
+    # Кнопки статусов показываются в том же сообщении вместо прежних
+    bot.edit_message_reply_markup(
+        manager_id,
+        call.message.message_id,
+        reply_markup=status_picker_keyboard(order_id, page or None),
+    )
+    bot.answer_callback_query(call.id, f"📌 Выберите новый статус заказа #{order_id}")
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("delete_order_"))
@@ -729,15 +904,13 @@ def set_new_status(call):
 
     print(f"🔄 Получен `callback_data`: {call.data}")  # Логирование данных
 
-    # Разбиваем callback_data
-    _, _, user_id, order_id, status_code = call.data.split("_", 4)
-
-    if not user_id.isdigit():
-        print(f"❌ Ошибка: user_id некорректный: {user_id}")
-        bot.answer_callback_query(call.id, "❌ Ошибка: неверный ID пользователя.")
-        return
-
-    user_id = int(user_id)
+    # set_status_{id заказа}_{код статуса}, из списка заказов — ещё
+    # _{фильтр}_{якорь страницы}. Кнопки из старых сообщений:
+    # set_status_{user_id}_{id заказа}_{код статуса}
+    parts = call.data[len("set_status_") :].split("_")
+    if len(parts) == 3:
+        parts = parts[1:]
+    order_id, status_code, *page = parts
 
     # Проверяем статус
     if status_code not in ORDER_STATUSES:
@@ -747,17 +920,11 @@ def set_new_status(call):
 
     new_status = ORDER_STATUSES[status_code]  # Получаем текст статуса по коду
 
-    print(
-        f"🔄 Менеджер {manager_id} меняет статус заказа {order_id} для {user_id} на {new_status}"
-    )
+    print(f"🔄 Менеджер {manager_id} меняет статус заказа {order_id} на {new_status}")
 
-    # Получаем все заказы
-    orders = get_all_orders()
-    # print(f"📦 Все заказы пользователя {user_id}: {orders}")  # Логируем
-
-    # 🛠 Ищем заказ по `id`
-    order_found = next(
-        (order for order in orders if str(order["id"]) == str(order_id)), None
+    # Обновляем статус заказа в БД и сразу получаем заказ
+    order_found = (
+        update_order_status_in_db(order_id, new_status) if order_id.isdigit() else None
     )
 
     if not order_found:
@@ -765,23 +932,33 @@ def set_new_status(call):
         bot.answer_callback_query(call.id, "❌ Ошибка: заказ не найден.")
         return
 
-    # Обновляем статус заказа в БД
-    update_order_status_in_db(order_id, new_status)
-
     # Уведомляем клиента
+    car_link = escape(order_found["link"])
     bot.send_message(
-        user_id,
-        f"📢 *Обновление статуса заказа!*\n\n"
-        f"🚗 [{order_found['title']}]({order_found['link']})\n"
-        f"📌 Новый статус:\n*{new_status}*",
-        parse_mode="Markdown",
+        order_found["user_id"],
+        f"📢 <b>Обновление статуса заказа!</b>\n\n"
+        f"🚗 <a href='{car_link}'>{escape(order_found['title'])}</a>\n"
+        f"📌 Новый статус:\n<b>{new_status}</b>",
+        parse_mode="HTML",
     )
 
-    # Подтверждаем менеджеру
     bot.answer_callback_query(call.id, f"✅ Статус обновлён на {new_status}!")
 
-    # Обновляем заказы у менеджеров
-    show_orders(call.message)
+    # В том же сообщении снова показываем страницу заказов — уже с новым статусом
+    if page:
+        filter_code, anchor = page
+        response_text, keyboard = render_orders_page(
+            status_code=filter_code, after_id=int(anchor) or None
+        )
+        edit_orders_page(call, response_text, keyboard)
+        return
+
+    bot.edit_message_text(
+        f"✅ Заказ #{order_found['id']} ({order_found['title']})\n"
+        f"📌 Новый статус: {new_status}",
+        manager_id,
+        call.message.message_id,
+    )
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("place_order_"))
@@ -845,8 +1022,12 @@ def place_order(call):
 def check_subscription(call):
     user_id = call.from_user.id
     chat_member = bot.get_chat_member(f"@{CHANNEL_USERNAME}", user_id)
+    subscribed = chat_member.status in ["member", "administrator", "creator"]
+
+    # Пользователь сам сообщил о подписке — заменяем закешированный результат
+    subscription_cache.set(user_id, subscribed)
 
-    if chat_member.status in ["member", "administrator", "creator"]:
+    if subscribed:
         bot.answer_callback_query(
             call.id, "✅ Подписка оформлена! Вы можете продолжить расчёты."
         )
@@ -861,30 +1042,19 @@ def check_subscription(call):
 
 def is_user_subscribed(user_id):
     """Проверяет, подписан ли пользователь на канал."""
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/getChatMember?chat_id={CHANNEL_USERNAME}&user_id={user_id}"
-
     try:
-        http_response = requests.get(url, timeout=5)
-        http_response.raise_for_status()
-        response = http_response.json()
-
-        return response.get("ok") and response.get("result", {}).get("status") in [
-            "member",
-            "administrator",
-            "creator",
-        ]
-    except requests.exceptions.Timeout:
-        logging.error(f"Timeout checking subscription for user {user_id}")
+        chat_member = bot.get_chat_member(f"@{CHANNEL_USERNAME}", user_id)
+        return chat_member.status in ["member", "administrator", "creator"]
+    except ApiTelegramException as e:
+        logging.error(f"Telegram error checking subscription for user {user_id}: {e}")
         return False
     except requests.exceptions.RequestException as e:
         logging.error(f"Request error checking subscription: {e}")
         return False
-    except json.JSONDecodeError as e:
-        logging.error(f"JSON decode error checking subscription: {e}")
-        return False
-    except Exception as e:
-        logging.error(f"Unexpected error in is_user_subscribed: {e}")
-        return False
+
+
+# Результаты is_user_subscribed, чтобы не спрашивать Telegram на каждый расчёт
+subscription_cache = SubscriptionCache(is_user_subscribed)
 
 
 def print_message(message):
@@ -904,7 +1074,7 @@ def set_bot_commands():
     ]
 
     # Проверяем, является ли пользователь менеджером
-    user_id = bot.get_me().id
+    user_id = bot.user.id
     if user_id in MANAGERS:
         commands.extend(
             [
@@ -923,7 +1093,7 @@ def get_usdt_to_krw_rate():
     url = "https://api.coinbase.com/v2/exchange-rates?currency=USDT"
 
     try:
-        response = requests.get(url, timeout=10)
+        response = http_client.get(url)
         response.raise_for_status()
         data = response.json()
 
@@ -959,7 +1129,7 @@ def get_rub_to_krw_rate():
     url = "https://cdn.jsdelivr.net/npm/@fawazahmed0/currency-api@latest/v1/currencies/rub.json"
 
     try:
-        response = requests.get(url, timeout=10)
+        response = http_client.get(url)
         response.raise_for_status()  # Проверяем, что запрос успешный (код 200)
         data = response.json()
 
@@ -1011,7 +1181,7 @@ def get_usd_to_krw_rate():
     url = "https://api.manana.kr/exchange/rate/KRW/USD.json"
 
     try:
-        response = requests.get(url, timeout=10)
+        response = http_client.get(url)
         response.raise_for_status()  # Проверяем успешность запроса
         data = response.json()
 
@@ -1046,7 +1216,7 @@ def get_usd_to_rub_rate():
     }
 
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = http_client.get(url, headers=headers)
         response.raise_for_status()  # Проверяем успешность запроса
         data = response.json()
 
@@ -1132,7 +1302,7 @@ def send_welcome(message):
         "last_name": message.from_user.last_name,
         "phone_number": user_contacts.get(message.from_user.id, None),
     }
-    add_or_update_user(user_data)
+    user_activity.record(user_data)
 
     welcome_message = (
         f"Здравствуйте, {user_first_name}!\n\n"
@@ -1143,11 +1313,7 @@ def send_welcome(message):
     # Логотип компании
     logo_path = "assets/logo.png"
 
-    with open(logo_path, "rb") as logo_file:
-        bot.send_photo(
-        message.chat.id,
-        photo=types.InputFile(logo_file),
-    )
+    send_local_photo(bot, message.chat.id, logo_path)
 
     # Отправляем приветственное сообщение
     bot.send_message(message.chat.id, welcome_message, reply_markup=main_menu())
@@ -1170,336 +1336,102 @@ def send_error_message(message, error_text):
     logging.error(f"Error sent to user {message.chat.id}: {error_text}")
 
 
-def get_car_info(url):
-    global car_id_external, vehicle_no, vehicle_id, car_year, car_month
-
-    if "fem.encar.com" in url:
-        car_id_match = re.findall(r"\d+", url)
-        car_id = car_id_match[0]
-        car_id_external = car_id
-
-        url = f"https://api.encar.com/v1/readside/vehicle/{car_id}"
-
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-            "Referer": "http://www.encar.com/",
-            "Accept": "application/json",
-            "Accept-Language": "ko-KR,ko;q=0.9,en-US;q=0.8,en;q=0.7",
-            "Cache-Control": "max-age=0",
-            "Connection": "keep-alive",
-        }
-
-        try:
-            # Make HTTP request with timeout
-            http_response = requests.get(url, headers=headers, timeout=10)
-
-            # Log response status and content for debugging
-            logging.info(f"Encar API Response Status: {http_response.status_code}")
-
-            # Check if request was successful
-            if http_response.status_code != 200:
-                logging.error(f"Encar API returned status code {http_response.status_code}")
-                logging.error(f"Response content: {http_response.text[:500]}")
-                return None
-
-            # Try to parse JSON
-            response = http_response.json()
-
-        except requests.exceptions.Timeout:
-            logging.error(f"Timeout while requesting Encar API for car_id: {car_id}")
-            return None
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Request error while fetching Encar data: {e}")
-            return None
-        except json.JSONDecodeError as e:
-            logging.error(f"JSON decode error for Encar API. Response was: {http_response.text[:500]}")
-            logging.error(f"Error details: {e}")
-            return None
-        except Exception as e:
-            logging.error(f"Unexpected error in get_car_info (Encar): {e}")
-            return None
-
-        # Validate response structure
-        try:
-            # Информация об автомобиле
-            car_make = response["category"]["manufacturerEnglishName"]  # Марка
-            car_model = response["category"]["modelGroupEnglishName"]  # Модель
-            car_trim = response["category"]["gradeDetailEnglishName"] or ""  # Комплектация
-        except (KeyError, TypeError) as e:
-            logging.error(f"Invalid response structure from Encar API: {e}")
-            logging.error(f"Response keys: {response.keys() if isinstance(response, dict) else 'Not a dict'}")
-            return None
-
-        try:
-            car_title = f"{car_make} {car_model} {car_trim}"  # Заголовок
-
-            # Получаем все необходимые данные по автомобилю
-            car_price = str(response["advertisement"]["price"])
-            car_date = response["category"]["yearMonth"]
-            year = car_date[2:4]
-            month = car_date[4:]
-            car_year = year
-            car_month = month
-
-            # Пробег (форматирование)
-            mileage = response["spec"]["mileage"]
-            formatted_mileage = f"{mileage:,} км"
-
-            # Тип КПП
-            transmission = response["spec"]["transmissionName"]
-            formatted_transmission = "Автомат" if "오토" in transmission else "Механика"
-
-            car_engine_displacement = str(response["spec"]["displacement"])
-            car_type = response["spec"]["bodyName"]
-
-            # Список фотографий (берем первые 10)
-            car_photos = [
-                generate_encar_photo_url(photo["path"]) for photo in response["photos"][:10]
-            ]
-            car_photos = [url for url in car_photos if url]
-
-            # Дополнительные данные
-            vehicle_no = response["vehicleNo"]
-            vehicle_id = response["vehicleId"]
-
-            # Форматируем
-            formatted_car_date = f"01{month}{year}"
-            formatted_car_type = "crossover" if car_type == "SUV" else "sedan"
-
-            print_message(
-                f"ID: {car_id}\nType: {formatted_car_type}\nDate: {formatted_car_date}\nCar Engine Displacement: {car_engine_displacement}\nPrice: {car_price} KRW"
-            )
-
-            return [
-                car_price,
-                car_engine_displacement,
-                formatted_car_date,
-                car_title,
-                formatted_mileage,
-                formatted_transmission,
-                car_photos,
-                year,
-                month,
-            ]
-        except (KeyError, TypeError, IndexError) as e:
-            logging.error(f"Error extracting car data from Encar response: {e}")
-            return None
-    elif "kbchachacha.com" in url:
-        url = f"https://www.kbchachacha.com/public/car/detail.kbc?carSeq={car_id_external}"
-
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-            "Accept-Language": "en,ru;q=0.9,en-CA;q=0.8,la;q=0.7,fr;q=0.6,ko;q=0.5",
-            "Connection": "keep-alive",
-        }
-
-        response = requests.get(url=url, headers=headers)
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        # Находим JSON в <script type="application/ld+json">
-        json_script = soup.find("script", {"type": "application/ld+json"})
-        if json_script:
-            json_data = json.loads(json_script.text.strip())
-
-            # Извлекаем данные
-            car_name = json_data.get("name", "Неизвестная модель")
-            car_images = json_data.get("image", [])[:10]  # Берем первые 10 фото
-            car_price = json_data.get("offers", {}).get("price", "Не указано")
-
-            # Находим таблицу с информацией
-            table = soup.find("table", {"class": "detail-info-table"})
-            if table:
-                rows = table.find_all("tr")
-
-                # Достаём данные
-                car_number = None
-                car_year = None
-                car_mileage = None
-                car_fuel = None
-                car_engine_displacement = None
-
-                for row in rows:
-                    headers = row.find_all("th")
-                    values = row.find_all("td")
-
-                    for th, td in zip(headers, values):
-                        header_text = th.text.strip()
-                        value_text = td.text.strip()
-
-                        if header_text == "차량정보":  # Номер машины
-                            car_number = value_text
-                        elif header_text == "연식":  # Год выпуска
-                            car_year = value_text
-                        elif header_text == "주행거리":  # Пробег
-                            car_mileage = value_text
-                        elif header_text == "연료":  # Топливо
-                            car_fuel = value_text
-                        elif header_text == "배기량":  # Объем двигателя
-                            car_engine_displacement = value_text
-            else:
-                print("❌ Таблица информации не найдена")
-
-            # Если объем двигателя не найден или равен 0, пытаемся извлечь из названия
-            if not car_engine_displacement or car_engine_displacement == "0cc":
-                # Ищем числа с точкой (например, 2.0) в названии автомобиля
-                engine_match = re.search(r"(\d+\.\d+)", car_name)
-                if engine_match:
-                    # Преобразуем, например, 2.0 в 2000cc
-                    engine_size = float(engine_match.group(1))
-                    car_engine_displacement = f"{int(engine_size * 1000)}cc"
-                    print(
-                        f"✅ Извлечен объем двигателя из названия: {car_engine_displacement}"
-                    )
-                else:
-                    # Ищем просто числа (например, 2000) в названии
-                    engine_match = re.search(r"(\d{3,4})", car_name)
-                    if engine_match and 500 <= int(engine_match.group(1)) <= 9000:
-                        car_engine_displacement = f"{engine_match.group(1)}cc"
-                        print(
-                            f"✅ Извлечен объем двигателя из названия: {car_engine_displacement}"
-                        )
-
-            car_info = {
-                "name": car_name,
-                "car_price": car_price,
-                "images": car_images,
-                "number": car_number,
-                "year": car_year,
-                "mileage": car_mileage,
-                "fuel": car_fuel,
-                "engine_volume": car_engine_displacement,
-                "transmission": "오토",
-            }
-
-            return car_info
-        else:
-            print(
-                "❌ Не удалось найти JSON-данные в <script type='application/ld+json'>"
-            )
-    elif "chutcha" in url:
-        print("🔍 Парсим Chutcha.net...")
+def subscription_keyboard():
+    """Кнопки оформления и проверки подписки на канал."""
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.add(
+        types.InlineKeyboardButton(
+            "🚀 Оформить подписку", url=f"https://t.me/{CHANNEL_USERNAME}"
+        )
+    )
+    keyboard.add(
+        types.InlineKeyboardButton("✅ Готово", callback_data="check_subscription")
+    )
+    return keyboard
 
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-            "Accept-Language": "en,ru;q=0.9,en-CA;q=0.8,la;q=0.7,fr;q=0.6,ko;q=0.5",
-            "Referer": "https://web.chutcha.net/bmc/search?brandGroup=1&modelTree=%7B%7D&priceRange=0%2C0&mileage=0%2C0&year=&saleType=&accident=&fuel=&transmission=&region=&color=&option=&cpo=&theme=&sort=1&currPage=&carType=",
-        }
 
-        response = requests.get(url, headers=headers)
+def calculate_total_cost_rub(
+    price_krw, customs_fee, customs_duty, recycling_fee, usd_to_krw, usd_to_rub
+):
+    """
+    Считает итоговую стоимость автомобиля под ключ в рублях.
+
+    :param price_krw: Цена авто в вонах
+    :param customs_fee: Таможенный сбор (₽)
+    :param customs_duty: Таможенная пошлина (₽)
+    :param recycling_fee: Утилизационный сбор (₽)
+    :param usd_to_krw: Курс USD → KRW
+    :param usd_to_rub: Курс USD → RUB
+    :return: Стоимость в рублях
+    """
+    price_rub = price_krw / usd_to_krw * usd_to_rub
+    return (
+        price_rub
+        + ((1400000 / usd_to_krw) * usd_to_rub)
+        + ((300000 / usd_to_krw) * usd_to_rub)
+        + ((440000 / usd_to_krw) * usd_to_rub)
+        + 100000
+        + customs_fee
+        + customs_duty
+        + recycling_fee
+        + 13000
+        + 200000
+    )
 
-        soup = BeautifulSoup(response.text, "lxml")
 
-        # Extract JSON data from <script type="application/ld+json">
-        script_tag = soup.find("script", {"type": "application/json"})
-        vehicle_data = None
+def calculate_total_costs(
+    price_krw, customs_fee, customs_duty, recycling_fee, usd_to_krw, usd_to_rub
+):
+    """
+    Считает итоговую стоимость автомобиля под ключ в рублях, вонах и долларах.
 
-        if not script_tag:
-            return "Error: JSON data not found"
+    Параметры те же, что у calculate_total_cost_rub.
 
-        try:
-            data = json.loads(script_tag.string)
-        except json.JSONDecodeError:
-            return "Error: Failed to parse JSON"
-
-        # Перемещение к ldJson (содержит основную информацию о машине)
-        vehicle_data = (
-            data.get("props", {})
-            .get("pageProps", {})
-            .get("dehydratedState", {})
-            .get("queries", [])[0]
-            .get("state", {})
-            .get("data", {})
-        )
-
-        # Получение изображений
-        img_list_data = vehicle_data.get("img_list", [])
-        img_list = []
-        for query in img_list_data:
-            img_list.append(
-                f"https://imgsc.chutcha.kr{query.get('img_path','').replace('.jpg', '_ori.jpg')}?s=1024x768&t=crop"
-            )
+    :return: Кортеж (стоимость в ₽, стоимость в ₩, стоимость в $)
+    """
+    total_cost_rub = calculate_total_cost_rub(
+        price_krw, customs_fee, customs_duty, recycling_fee, usd_to_krw, usd_to_rub
+    )
 
-        name = (
-            vehicle_data.get("base_info", {}).get("brand_name", "")
-            + " "
-            + vehicle_data.get("base_info", {}).get("model_name", "")
-            + " "
-            + vehicle_data.get("base_info", {}).get("sub_model_name", "")
-            + " "
-            + vehicle_data.get("base_info", {}).get("grade_name", "")
-        )
-        car_price = vehicle_data.get("base_info", {}).get("plain_price", "")
-        car_number = vehicle_data.get("base_info", {}).get("number_plate", "")
-        car_year = vehicle_data.get("base_info", {}).get("first_reg_year", "")[2:]
-        car_month = str(
-            vehicle_data.get("base_info", {}).get("first_reg_month", "")
-        ).zfill(2)
-        car_mileage = vehicle_data.get("base_info", {}).get("plain_mileage", "")
-        car_fuel = vehicle_data.get("base_info", {}).get("fuel_name", "")
-        car_engine_displacement = vehicle_data.get("base_info", {}).get(
-            "displacement", ""
-        )
-        car_transmission = vehicle_data.get("base_info", {}).get(
-            "transmission_name", ""
-        )
-
-        # Список всех страховых
-        car_history = (
-            vehicle_data.get("safe_info", {})
-            .get("carhistory_safe", {})
-            .get("insurance", {})
-            .get("list", [])
-        )
-
-        # Инициализация сумм страховых выплат
-        own_damage_total = 0  # Выплаты по текущему авто
-        other_damage_total = 0  # Выплаты по другим авто
-
-        # Обработка выплат, если они есть
-        if car_history or len(car_history.get("price", "")) > 0:
-            for claim in car_history:
-                claim_type = claim.get("type")
-                claim_price = (
-                    int(claim["price"])
-                    if claim.get("price") and claim["price"].isdigit()
-                    else 0
-                )
+    total_cost_krw = (
+        price_krw
+        + 300000
+        + 440000
+        + (1400000 / usd_to_krw)
+        + (100000 / usd_to_rub) * usd_to_krw
+        + (customs_fee / usd_to_rub) * usd_to_krw
+        + (customs_duty / usd_to_rub) * usd_to_krw
+        + (recycling_fee / usd_to_rub) * usd_to_krw
+        + (13000 / usd_to_rub) * usd_to_krw
+        + (200000 / usd_to_rub) * usd_to_krw
+    )
 
-                if claim_type == "1":  # Выплаты по текущему авто
-                    own_damage_total += claim_price
-                elif claim_type == "2":  # Выплаты по другим авто
-                    other_damage_total += claim_price
-
-        # Формирование итогового JSON
-        car_info = {
-            "name": name,
-            "car_price": car_price,
-            "images": img_list,
-            "number": car_number,
-            "year": car_year,
-            "month": car_month,
-            "mileage": car_mileage,
-            "fuel": car_fuel,
-            "engine_volume": car_engine_displacement,
-            "transmission": car_transmission,
-            "insurance_claims": {
-                "own_damage_total": own_damage_total if car_history else "Недоступно",
-                "other_damage_total": (
-                    other_damage_total if car_history else "Недоступно"
-                ),
-            },
-        }
+    total_cost_usd = (
+        price_krw / usd_to_krw
+        + (1400000 / usd_to_krw)
+        + (300000 / usd_to_krw)
+        + (440000 / usd_to_krw)
+        + (100000 / usd_to_rub)
+        + (customs_fee / usd_to_rub)
+        + (customs_duty / usd_to_rub)
+        + (recycling_fee / usd_to_rub)
+        + (13000 / usd_to_rub)
+        + (200000 / usd_to_rub)
+    )
 
-        return car_info
+    return total_cost_rub, total_cost_krw, total_cost_usd
 
 
 # Function to calculate the total cost
 def calculate_cost(link, message):
-    global car_data, car_id_external, car_month, car_year, krw_rub_rate, eur_rub_rate, rub_to_krw_rate, usd_rate, usdt_to_krw_rate
+    global krw_rub_rate, eur_rub_rate, rub_to_krw_rate, usd_rate, usdt_to_krw_rate
 
     user_id = message.chat.id
+    timer = StageTimer(f"Расчёт {link}")
+
+    # Данные этого расчёта — отдельно для каждого запроса
+    ctx = QuoteContext(chat_id=message.chat.id, link=link)
+    car_data = ctx.car_data
 
     # Добавляем пользователя в базу данных
     user_data = {
@@ -1509,44 +1441,26 @@ def calculate_cost(link, message):
         "last_name": message.from_user.last_name,
         "phone_number": user_contacts.get(message.from_user.id, None),
     }
-    add_or_update_user(user_data)
-
-    # Если пользователь в списке FREE_ACCESS_USERS, он получает бесконечные расчёты
-    if user_id in FREE_ACCESS_USERS:
-        user_subscription = True
-    else:
-        # Проверяем подписку в БД
-        user_subscription = check_user_subscription(user_id)
 
-        # Если в БД нет подписки – проверяем через API
-        if not user_subscription:
-            user_subscription = is_user_subscribed(user_id)
-            if user_subscription:
-                update_user_subscription(user_id, True)  # ✅ Обновляем подписку в БД
-
-    # Проверяем количество расчётов
-    user_calc_count = get_calculation_count(user_id)
-
-    if user_calc_count >= 2 and not user_subscription:
-        keyboard = types.InlineKeyboardMarkup()
-        keyboard.add(
-            types.InlineKeyboardButton(
-                "🚀 Оформить подписку", url=f"https://t.me/{CHANNEL_USERNAME}"
-            )
-        )
-        keyboard.add(
-            types.InlineKeyboardButton("✅ Готово", callback_data="check_subscription")
-        )
+    # Регистрируем пользователя, проверяем подписку и списываем расчёт одним запросом.
+    # FREE_ACCESS_USERS получают бесконечные расчёты
+    quote = consume_quote(
+        user_data, FREE_CALCULATIONS, free_access=user_id in FREE_ACCESS_USERS
+    )
 
+    # Бесплатные расчёты закончились и в БД нет подписки – проверяем через API
+    if not quote["allowed"] and subscription_cache.is_subscribed(user_id):
+        update_user_subscription(user_id, True)  # ✅ Обновляем подписку в БД
+        increment_calculation_count(user_id)
+    elif not quote["allowed"]:
         bot.send_message(
             message.chat.id,
             "🚫 У вас закончились бесплатные расчёты. Чтобы продолжить, оформите подписку.",
-            reply_markup=keyboard,
+            reply_markup=subscription_keyboard(),
         )
         return
 
-    # Увеличиваем счётчик расчётов
-    increment_calculation_count(user_id)
+    timer.mark("лимиты")
 
     print_message("ЗАПРОС НА РАСЧЁТ АВТОМОБИЛЯ")
 
@@ -1555,250 +1469,78 @@ def calculate_cost(link, message):
         message.chat.id, "Обрабатываю данные. Пожалуйста подождите ⏳"
     )
 
-    car_id = None
-    car_title = ""
+    # Площадка определяется по хосту ссылки
+    adapter = get_adapter(link)
+    car_id = adapter.parse_car_id(link) if adapter else None
 
-    if "fem.encar.com" in link:
-        car_id_match = re.findall(r"\d+", link)
-        if car_id_match:
-            car_id = car_id_match[0]  # Use the first match of digits
-            car_id_external = car_id
-            link = f"https://fem.encar.com/cars/detail/{car_id}"
-        else:
-            send_error_message(message, "🚫 Не удалось извлечь carid из ссылки.")
-            return
-
-    elif "kbchachacha.com" in link or "m.kbchachacha.com" in link:
-        parsed_url = urlparse(link)
-        query_params = parse_qs(parsed_url.query)
-
-        # Попытка 1: обычный carSeq в параметрах
-        car_id = query_params.get("carSeq", [None])[0]
-
-        # Попытка 2: если есть параметр `c=...`, надо выполнить редирект
-        if not car_id and query_params.get("c"):
-            try:
-                response = requests.get(link, allow_redirects=True, timeout=5)
-                redirected_url = response.url
-                redirected_query = parse_qs(urlparse(redirected_url).query)
-                car_id = redirected_query.get("carSeq", [None])[0]
-            except Exception as e:
-                print(f"Ошибка при обработке редиректа KBChaCha: {e}")
-                send_error_message(message, "🚫 Ошибка при обработке ссылки KBChaCha.")
-                return
-
-        if car_id:
-            car_id_external = car_id
-            link = f"https://www.kbchachacha.com/public/car/detail.kbc?carSeq={car_id}"
-        else:
-            send_error_message(message, "🚫 Не удалось извлечь carSeq из ссылки.")
-            return
-
-    elif "web.chutcha.net" in link:
-        parsed_url = urlparse(link)
-        path_parts = parsed_url.path.split("/")
-
-        if len(path_parts) >= 4 and path_parts[-2] == "detail":
-            car_id = path_parts[-1]  # Берём последний элемент из пути
-            car_id_external = car_id
-            link = f"https://web.chutcha.net/bmc/detail/{car_id}"
-        else:
-            send_error_message(
-                message, "🚫 Не удалось извлечь ID автомобиля из ссылки Chutcha.net."
-            )
-            return
-
-    else:
-        # Извлекаем carid с URL encar
-        parsed_url = urlparse(link)
-        query_params = parse_qs(parsed_url.query)
-        car_id = query_params.get("carid", [None])[0]
-
-    # Если ссылка с encar
-    if "fem.encar.com" in link:
-        result = get_car_info(link)
-
-        # Check if API request failed
-        if result is None:
-            bot.delete_message(message.chat.id, processing_message.message_id)
-            keyboard = types.InlineKeyboardMarkup()
-            keyboard.add(
-                types.InlineKeyboardButton(
-                    "Попробовать ещё раз",
-                    callback_data="calculate_another",
-                )
-            )
-            keyboard.add(
-                types.InlineKeyboardButton(
-                    "Связаться с менеджером", url="https://t.me/DeyTrading6"
-                )
-            )
-            bot.send_message(
-                message.chat.id,
-                "❌ Не удалось загрузить данные автомобиля с Encar.\n\n"
-                "Возможные причины:\n"
-                "• Автомобиль уже продан\n"
-                "• Временные проблемы с API\n"
-                "• Неверная ссылка\n\n"
-                "Пожалуйста, попробуйте другой автомобиль или свяжитесь с менеджером.",
-                reply_markup=keyboard,
-            )
-            return
-
-        (
-            car_price,
-            car_engine_displacement,
-            formatted_car_date,
-            car_title,
-            formatted_mileage,
-            formatted_transmission,
-            car_photos,
-            year,
-            month,
-        ) = result
-
-        preview_link = f"https://fem.encar.com/cars/detail/{car_id}"
-
-    # Если ссылка с kbchacha
-    if "kbchachacha.com" in link:
-        result = get_car_info(link)
-
-        # Check if parsing failed
-        if result is None:
-            bot.delete_message(message.chat.id, processing_message.message_id)
-            keyboard = types.InlineKeyboardMarkup()
-            keyboard.add(
-                types.InlineKeyboardButton(
-                    "Попробовать ещё раз",
-                    callback_data="calculate_another",
-                )
-            )
-            keyboard.add(
-                types.InlineKeyboardButton(
-                    "Связаться с менеджером", url="https://t.me/DeyTrading6"
-                )
-            )
-            bot.send_message(
-                message.chat.id,
-                "❌ Не удалось загрузить данные автомобиля с KBChaCha.\n\n"
-                "Пожалуйста, попробуйте другой автомобиль или свяжитесь с менеджером.",
-                reply_markup=keyboard,
-            )
-            return
-
-        car_title = result["name"]
-
-        match = re.search(r"(\d{2})년(\d{2})월", result["year"])
-        if match:
-            car_year = match.group(1)
-            car_month = match.group(2)  # Получаем двухзначный месяц
-        else:
-            car_year = "Не найдено"
-            car_month = "Не найдено"
-
-        month = car_month
-        year = car_year
-
-        car_engine_displacement = re.sub(r"[^\d]", "", result["engine_volume"])
-        car_price = int(result["car_price"]) / 10000
-        formatted_car_date = f"01{car_month}{match.group(1)}"
-        formatted_mileage = result["mileage"]
-        formatted_transmission = (
-            "Автомат" if "오토" in result["transmission"] else "Механика"
-        )
-        car_photos = result["images"]
-
-        preview_link = (
-            f"https://www.kbchachacha.com/public/car/detail.kbc?carSeq={car_id}"
-        )
-
-    if "web.chutcha.net" in link:
-        result = get_car_info(link)
-
-        # Check if parsing failed
-        if result is None or isinstance(result, str):  # get_car_info returns error string for Chutcha
-            bot.delete_message(message.chat.id, processing_message.message_id)
-            keyboard = types.InlineKeyboardMarkup()
-            keyboard.add(
-                types.InlineKeyboardButton(
-                    "Попробовать ещё раз",
-                    callback_data="calculate_another",
-                )
-            )
-            keyboard.add(
-                types.InlineKeyboardButton(
-                    "Связаться с менеджером", url="https://t.me/DeyTrading6"
-                )
-            )
-            bot.send_message(
-                message.chat.id,
-                "❌ Не удалось загрузить данные автомобиля с Chutcha.\n\n"
-                "Пожалуйста, попробуйте другой автомобиль или свяжитесь с менеджером.",
-                reply_markup=keyboard,
-            )
-            return
-
-        car_title = result["name"]
-
-        month = result["year"]
-        year = result["month"]
-
-        # Очищаем объём двигателя от "cc"
-        car_engine_displacement = re.sub(r"\D+", "", result["engine_volume"])
-
-        # Преобразуем цену из формата "3,450만원 / 월 62만원"
-        car_price = result["car_price"]
-
-        # Форматируем дату
-        formatted_car_date = (
-            f"01{car_month}{car_year[-2:]}"
-            if car_year != "Не найдено"
-            else "Не найдено"
-        )
-
-        # Форматируем пробег
-        formatted_mileage = format_number(result["mileage"]) + " км"
-
-        # Определяем КПП
-        formatted_transmission = (
-            "Автомат" if "오토" in result["transmission"] else "Механика"
-        )
-
-        # Получаем фотографии автомобиля
-        car_photos = result["images"]
-
-        preview_link = f"https://web.chutcha.net/bmc/detail/{car_id}"
+    if not car_id:
+        send_error_message(message, "🚫 Не удалось извлечь ID автомобиля из ссылки.")
+        bot.delete_message(message.chat.id, processing_message.message_id)
+        return
 
-        own_car_insurance_payments = result["insurance_claims"]["own_damage_total"]
-        other_car_insurance_payments = result["insurance_claims"]["other_damage_total"]
+    ctx.car_id = car_id
+    listing = get_listing(adapter, car_id)
 
-    if not car_price and car_engine_displacement and formatted_car_date:
+    if listing is None:
+        bot.delete_message(message.chat.id, processing_message.message_id)
         keyboard = types.InlineKeyboardMarkup()
         keyboard.add(
             types.InlineKeyboardButton(
-                "Написать менеджеру", url="https://t.me/DeyTrading6"
+                "Попробовать ещё раз",
+                callback_data="calculate_another",
             )
         )
         keyboard.add(
             types.InlineKeyboardButton(
-                "Рассчитать стоимость другого автомобиля",
-                callback_data="calculate_another",
+                "Связаться с менеджером", url="https://t.me/DeyTrading6"
             )
         )
         bot.send_message(
-            message.chat.id, "Ошибка", parse_mode="Markdown", reply_markup=keyboard
+            message.chat.id,
+            f"❌ Не удалось загрузить данные автомобиля с {adapter.name}.\n\n"
+            "Возможные причины:\n"
+            "• Автомобиль уже продан\n"
+            "• Временные проблемы с сайтом\n"
+            "• Неверная ссылка\n\n"
+            "Пожалуйста, попробуйте другой автомобиль или свяжитесь с менеджером.",
+            reply_markup=keyboard,
+        )
+        return
+
+    timer.mark("объявление")
+
+    if not listing.is_complete:
+        send_error_message(
+            message,
+            "🚫 Произошла ошибка при получении данных. Проверьте ссылку и попробуйте снова.",
         )
         bot.delete_message(message.chat.id, processing_message.message_id)
         return
 
-    if car_price and car_engine_displacement and formatted_car_date:
-        car_engine_displacement = int(car_engine_displacement)
+    # Данные для кнопок под расчётом (год и месяц — две цифры)
+    ctx.car_year = f"{listing.year % 100:02d}"
+    ctx.car_month = f"{listing.month:02d}"
+    ctx.vehicle_id = listing.vehicle_id
+    ctx.vehicle_no = listing.vehicle_no
+
+    # Фото начинают загружаться сразу, параллельно с расчётом таможни
+    # Порядок фото — как на площадке: первым идёт главное фото объявления
+    car_photos = listing.photo_urls
+    photo_album = PhotoAlbum(car_photos, quote_executor)
+
+    # Загрузки фото и их буферы освобождаются при любом исходе расчёта
+    try:
+        car_engine_displacement = listing.engine_volume
 
         # Форматирование данных
-        formatted_car_year = f"20{car_year}"
         engine_volume_formatted = f"{format_number(car_engine_displacement)} cc"
+        formatted_mileage = (
+            f"{format_number(listing.mileage_km)} км"
+            if listing.mileage_km is not None
+            else "Не указан"
+        )
 
-        age = calculate_age(int(formatted_car_year), car_month)
+        age = calculate_age(listing.year, listing.month)
 
         age_formatted = (
             "до 3 лет"
@@ -1811,66 +1553,47 @@ def calculate_cost(link, message):
         )
 
         # Конвертируем стоимость авто в рубли
-        price_krw = int(car_price) * 10000
+        price_krw = listing.price_krw
         price_usd = price_krw / usd_to_krw_rate
         price_rub = price_usd * usd_to_rub_rate
 
-        print(car_engine_displacement)
-        print(price_krw)
-        print(int(formatted_car_year))
-        print(car_month)
+        print_message(
+            f"ID: {listing.source}:{car_id}\nDate: {listing.month:02d}/{listing.year}\n"
+            f"Car Engine Displacement: {car_engine_displacement}\n"
+            f"Price: {price_krw} KRW"
+        )
 
         response = get_customs_fees(
             car_engine_displacement,
             price_krw,
-            int(formatted_car_year),
-            car_month,
+            listing.year,
+            listing.month,
             engine_type=1,
         )
 
+        timer.mark("таможня")
+
+        if response is None:
+            send_error_message(
+                message,
+                "🚫 Не удалось рассчитать таможенные платежи. Попробуйте позже.",
+            )
+            bot.delete_message(message.chat.id, processing_message.message_id)
+            return
+
         # Таможенный сбор
         customs_fee = clean_number(response["sbor"])
         customs_duty = clean_number(response["tax"])
         recycling_fee = clean_number(response["util"])
 
-        # Расчет итоговой стоимости автомобиля в рублях
-        total_cost = (
-            price_rub
-            + ((1400000 / usd_to_krw_rate) * usd_to_rub_rate)
-            + ((300000 / usd_to_krw_rate) * usd_to_rub_rate)
-            + ((440000 / usd_to_krw_rate) * usd_to_rub_rate)
-            + 100000
-            + customs_fee
-            + customs_duty
-            + recycling_fee
-            + 13000
-            + 200000
-        )
-
-        total_cost_krw = (
-            price_krw
-            + 300000
-            + 440000
-            + (1400000 / usd_to_krw_rate)
-            + (100000 / usd_to_rub_rate) * usd_to_krw_rate
-            + (customs_fee / usd_to_rub_rate) * usd_to_krw_rate
-            + (customs_duty / usd_to_rub_rate) * usd_to_krw_rate
-            + (recycling_fee / usd_to_rub_rate) * usd_to_krw_rate
-            + (13000 / usd_to_rub_rate) * usd_to_krw_rate
-            + (200000 / usd_to_rub_rate) * usd_to_krw_rate
-        )
-
-        total_cost_usd = (
-            price_usd
-            + (1400000 / usd_to_krw_rate)
-            + (300000 / usd_to_krw_rate)
-            + (440000 / usd_to_krw_rate)
-            + (100000 / usd_to_rub_rate)
-            + (customs_fee / usd_to_rub_rate)
-            + (customs_duty / usd_to_rub_rate)
-            + (recycling_fee / usd_to_rub_rate)
-            + (13000 / usd_to_rub_rate)
-            + (200000 / usd_to_rub_rate)
+        # Расчет итоговой стоимости автомобиля в рублях, вонах и долларах
+        total_cost, total_cost_krw, total_cost_usd = calculate_total_costs(
+            price_krw,
+            customs_fee,
+            customs_duty,
+            recycling_fee,
+            usd_to_krw_rate,
+            usd_to_rub_rate,
         )
 
         car_data["total_cost_usd"] = total_cost_usd
@@ -2027,15 +1750,15 @@ def calculate_cost(link, message):
         )
 
         car_insurance_payments_chutcha = ""
-        if "web.chutcha.net" in link:
+        if listing.source == "chutcha":
             own_insurance_text = (
-                f"₩{format_number(own_car_insurance_payments)}"
-                if isinstance(own_car_insurance_payments, int)
+                f"₩{format_number(listing.own_damage_total)}"
+                if listing.own_damage_total is not None
                 else "Нет"
             )
             other_insurance_text = (
-                f"₩{format_number(other_car_insurance_payments)}"
-                if isinstance(other_car_insurance_payments, int)
+                f"₩{format_number(listing.other_damage_total)}"
+                if listing.other_damage_total is not None
                 else "Нет"
             )
 
@@ -2046,16 +1769,17 @@ def calculate_cost(link, message):
 
         # Формирование сообщения результата
         result_message = (
-            f"{car_title}\n\n"
-            f"Возраст: {age_formatted} (дата регистрации: {month}/{year})\n"
+            f"{listing.title}\n\n"
+            f"Возраст: {age_formatted} "
+            f"(дата регистрации: {ctx.car_month}/{ctx.car_year})\n"
             f"Пробег: {formatted_mileage}\n"
             f"Объём двигателя: {engine_volume_formatted}\n"
-            f"КПП: {formatted_transmission}\n\n"
+            f"КПП: {listing.transmission}\n\n"
             f"Стоимость автомобиля в Корее: ₩{format_number(price_krw)}\n"
             f"Стоимость автомобиля под ключ до Владивостока: \n<b>${format_number(total_cost_usd)} </b> | <b>₩{format_number(total_cost_krw)} </b> | <b>{format_number(total_cost)} ₽</b>\n\n"
             f"{car_insurance_payments_chutcha}"
             f"💵 <b>Курс USDT к Воне: ₩{format_number(usdt_to_krw_rate)}</b>\n\n"
-            f"🔗 <a href='{preview_link}'>Ссылка на автомобиль</a>\n\n"
+            f"🔗 <a href='{listing.url}'>Ссылка на автомобиль</a>\n\n"
             "Если данное авто попадает под санкции, пожалуйста уточните возможность отправки в вашу страну у наших менеджеров:\n\n"
             f"▪️ +82-10-8855-0386 (Андрей)\n"
             # f"▪️ +82 10-5128-8082 (Александр) \n\n"
@@ -2065,27 +1789,30 @@ def calculate_cost(link, message):
         # Клавиатура с дальнейшими действиями
         keyboard = types.InlineKeyboardMarkup()
         keyboard.add(
-            types.InlineKeyboardButton("Детали расчёта", callback_data="detail")
+            types.InlineKeyboardButton(
+                "Детали расчёта", callback_data=f"detail_{ctx.car_id}"
+            )
         )
 
         # Кнопка для добавления в избранное
         keyboard.add(
             types.InlineKeyboardButton(
                 "⭐ Добавить в избранное",
-                callback_data=f"add_favorite_{car_id_external}",
+                callback_data=f"add_favorite_{ctx.car_id}",
             )
         )
 
-        if "fem.encar.com" in link:
+        if listing.source == "encar":
             keyboard.add(
                 types.InlineKeyboardButton(
-                    "Технический Отчёт об Автомобиле", callback_data="technical_card"
+                    "Технический Отчёт об Автомобиле",
+                    callback_data=f"technical_card_{ctx.car_id}",
                 )
             )
             keyboard.add(
                 types.InlineKeyboardButton(
                     "Выплаты по ДТП",
-                    callback_data="technical_report",
+                    callback_data=f"technical_report_{ctx.car_id}",
                 )
             )
         keyboard.add(
@@ -2106,44 +1833,24 @@ def calculate_cost(link, message):
             )
         )
 
-        # Отправляем до 10 фотографий
-        media_group = []
-        for photo_url in sorted(car_photos):
-            try:
-                response = requests.get(photo_url)
-                if response.status_code == 200:
-                    photo = BytesIO(response.content)  # Загружаем фото в память
-                    media_group.append(
-                        types.InputMediaPhoto(photo)
-                    )  # Добавляем в список
-
-                    # Если набрали 10 фото, отправляем альбом
-                    if len(media_group) == 10:
-                        bot.send_media_group(message.chat.id, media_group)
-                        media_group.clear()  # Очищаем список для следующей группы
-                else:
-                    print(f"Ошибка загрузки фото: {photo_url} - {response.status_code}")
-            except Exception as e:
-                print(f"Ошибка при обработке фото {photo_url}: {e}")
-
-        # Отправка оставшихся фото, если их меньше 10
-        if media_group:
-            bot.send_media_group(message.chat.id, media_group)
-
         car_data["car_id"] = car_id
-        car_data["name"] = car_title
-        car_data["images"] = car_photos if isinstance(car_photos, list) else []
-        car_data["link"] = preview_link
-        car_data["year"] = year
-        car_data["month"] = month
+        car_data["name"] = listing.title
+        # Список, а не кортеж: psycopg2 передаёт список как массив TEXT[]
+        car_data["images"] = list(car_photos)
+        car_data["link"] = listing.url
+        car_data["year"] = ctx.car_year
+        car_data["month"] = ctx.car_month
         car_data["mileage"] = formatted_mileage
         car_data["engine_volume"] = car_engine_displacement
-        car_data["transmission"] = formatted_transmission
+        car_data["transmission"] = listing.transmission
         car_data["car_price"] = price_krw
         car_data["user_name"] = message.from_user.username
         car_data["first_name"] = message.from_user.first_name
         car_data["last_name"] = message.from_user.last_name
 
+        # Сохраняем расчёт для кнопок под сообщением
+        quote_contexts.set((message.chat.id, ctx.car_id), ctx)
+
         bot.send_message(
             message.chat.id,
             result_message,
@@ -2154,23 +1861,170 @@ def calculate_cost(link, message):
         bot.delete_message(
             message.chat.id, processing_message.message_id
         )  # Удаляем сообщение о передаче данных в обработку
+        timer.mark("ответ")
+
+        # Отправляем фото после текста, альбомами по 10 штук
+        photo_album.send(bot, message.chat.id)
+
+        timer.mark("фото")
+        timer.log()
+    finally:
+        photo_album.close()
+
+
+def quote_listing(link, usd_to_krw, usd_to_rub):
+    """
+    Считает стоимость одного объявления для пакетного расчёта.
+
+    :param link: Ссылка на объявление
+    :param usd_to_krw: Курс USD → KRW (общий для всего пакета)
+    :param usd_to_rub: Курс USD → RUB (общий для всего пакета)
+    :return: Кортеж (Listing, стоимость в ₽) или None, если посчитать не удалось
+    """
+    adapter = get_adapter(link)
+    car_id = adapter.parse_car_id(link) if adapter else None
+    if not car_id:
+        return None
+
+    listing = get_listing(adapter, car_id)
+    if listing is None or not listing.is_complete:
+        return None
+
+    response = get_customs_fees(
+        listing.engine_volume,
+        listing.price_krw,
+        listing.year,
+        listing.month,
+        engine_type=1,
+    )
+    if not response:
+        return None
+
+    total_cost = calculate_total_cost_rub(
+        listing.price_krw,
+        clean_number(response["sbor"]),
+        clean_number(response["tax"]),
+        clean_number(response["util"]),
+        usd_to_krw,
+        usd_to_rub,
+    )
+    return listing, total_cost
 
-    else:
+
+def calculate_batch(links, message):
+    """
+    Считает несколько объявлений сразу и отвечает одной таблицей,
+    отсортированной по итоговой стоимости в рублях.
+
+    :param links: Ссылки на объявления
+    :param message: Сообщение пользователя
+    """
+    user_id = message.chat.id
+    timer = StageTimer(f"Пакетный расчёт ({len(links)} ссылок)")
+
+    # Пакетный расчёт доступен только подписчикам канала
+    if user_id not in FREE_ACCESS_USERS and not subscription_cache.is_subscribed(
+        user_id
+    ):
+        bot.send_message(
+            message.chat.id,
+            "🚫 Расчёт нескольких автомобилей сразу доступен подписчикам канала.",
+            reply_markup=subscription_keyboard(),
+        )
+        return
+
+    user_data = {
+        "user_id": message.from_user.id,
+        "username": message.from_user.username,
+        "first_name": message.from_user.first_name,
+        "last_name": message.from_user.last_name,
+        "phone_number": user_contacts.get(message.from_user.id, None),
+    }
+
+    # Списываем расчёт тем же запросом, что и при расчёте одной ссылки
+    quote = consume_quote(
+        user_data, FREE_CALCULATIONS, free_access=user_id in FREE_ACCESS_USERS
+    )
+
+    # Подписка подтверждена через API, но ещё не записана в БД
+    if not quote["allowed"]:
+        update_user_subscription(user_id, True)
+        increment_calculation_count(user_id)
+
+    skipped = len(links) - BATCH_MAX_LINKS
+    links = links[:BATCH_MAX_LINKS]
+
+    print_message(f"ПАКЕТНЫЙ РАСЧЁТ: {len(links)} ССЫЛОК")
+
+    processing_message = bot.send_message(
+        message.chat.id,
+        f"Считаю автомобили ({len(links)}). Пожалуйста подождите ⏳",
+    )
+
+    # Все строки таблицы считаются по одним и тем же курсам
+    usd_to_krw, usd_to_rub = usd_to_krw_rate, usd_to_rub_rate
+
+    futures = {
+        batch_executor.submit(quote_listing, link, usd_to_krw, usd_to_rub): link
+        for link in links
+    }
+
+    quotes = []
+    failed_links = []
+    for future in as_completed(futures):
+        try:
+            result = future.result()
+        except Exception as e:
+            logging.error(f"Ошибка пакетного расчёта {futures[future]}: {e}")
+            result = None
+
+        if result is None:
+            failed_links.append(futures[future])
+        else:
+            quotes.append(result)
+
+    timer.mark("объявления")
+
+    bot.delete_message(message.chat.id, processing_message.message_id)
+
+    if not quotes:
         send_error_message(
             message,
-            "🚫 Произошла ошибка при получении данных. Проверьте ссылку и попробуйте снова.",
+            "🚫 Не удалось посчитать ни один автомобиль. Проверьте ссылки и попробуйте снова.",
         )
-        bot.delete_message(message.chat.id, processing_message.message_id)
+        return
 
+    quotes.sort(key=lambda quote: quote[1])
 
-# Function to get insurance total
-def get_insurance_total():
-    global car_id_external, vehicle_no, vehicle_id
+    result_message = format_batch_table(quotes)
+    if failed_links:
+        result_message += "\n\n❌ Не удалось посчитать:\n" + "\n".join(
+            escape(link) for link in failed_links
+        )
+    if skipped > 0:
+        result_message += (
+            f"\n\nℹ️ За раз считается не больше {BATCH_MAX_LINKS} ссылок, "
+            f"пропущено: {skipped}."
+        )
 
+    bot.send_message(
+        message.chat.id,
+        result_message,
+        parse_mode="HTML",
+        disable_web_page_preview=True,
+        reply_markup=main_menu(),
+    )
+
+    timer.mark("ответ")
+    timer.log()
+
+
+# Function to get insurance total
+def get_insurance_total(ctx):
     print_message("[ЗАПРОС] ТЕХНИЧЕСКИЙ ОТЧËТ ОБ АВТОМОБИЛЕ")
 
-    formatted_vehicle_no = urllib.parse.quote(str(vehicle_no).strip())
-    url = f"https://api.encar.com/v1/readside/record/vehicle/{str(vehicle_id)}/open?vehicleNo={formatted_vehicle_no}"
+    formatted_vehicle_no = urllib.parse.quote(str(ctx.vehicle_no).strip())
+    url = f"https://api.encar.com/v1/readside/record/vehicle/{str(ctx.vehicle_id)}/open?vehicleNo={formatted_vehicle_no}"
 
     try:
         headers = {
@@ -2180,7 +2034,7 @@ def get_insurance_total():
             "Connection": "keep-alive",
         }
 
-        response = requests.get(url, headers, timeout=10)
+        response = http_client.get(url, headers=headers)
 
         # Check status code before parsing
         if response.status_code != 200:
@@ -2217,10 +2071,8 @@ def get_insurance_total():
         return ["", ""]
 
 
-def get_technical_card():
-    global vehicle_id
-
-    url = f"https://api.encar.com/v1/readside/inspection/vehicle/{vehicle_id}"
+def get_technical_card(ctx):
+    url = f"https://api.encar.com/v1/readside/inspection/vehicle/{ctx.vehicle_id}"
 
     try:
         headers = {
@@ -2230,7 +2082,7 @@ def get_technical_card():
             "Connection": "keep-alive",
         }
 
-        response = requests.get(url, headers=headers, timeout=10)
+        response = http_client.get(url, headers=headers)
 
         if response.status_code != 200:
             logging.error(f"Technical card API returned status {response.status_code}")
@@ -2354,14 +2206,37 @@ def get_technical_card():
         return f"❌ Непредвиденная ошибка: {e}"
 
 
+def get_quote_context(call, prefix):
+    """
+    Возвращает расчёт машины, под которой нажата кнопка, или сообщает,
+    что он устарел. ID машины передаётся в callback_data после prefix.
+    """
+    car_id = call.data[len(prefix) :]
+    ctx = quote_contexts.get((call.message.chat.id, car_id))
+
+    if ctx is None:
+        bot.answer_callback_query(
+            call.id,
+            "🚫 Данные расчёта не найдены. Пожалуйста, рассчитайте автомобиль заново.",
+            show_alert=True,
+        )
+
+    return ctx
+
+
 # Callback query handler
 @bot.callback_query_handler(func=lambda call: True)
 def handle_callback_query(call):
-    global car_data, car_id_external, usd_rate
+    global usd_rate
 
-    if call.data.startswith("detail"):
+    if call.data.startswith("detail_"):
         print_message("[ЗАПРОС] ДЕТАЛИЗАЦИЯ РАСЧËТА")
 
+        ctx = get_quote_context(call, "detail_")
+        if ctx is None:
+            return
+        car_data = ctx.car_data
+
         detail_message = (
             f"<i>ПЕРВАЯ ЧАСТЬ ОПЛАТЫ (КОРЕЯ)</i>:\n\n"
             f"Стоимость автомобиля:\n<b>${format_number(car_data['car_price_usd'])}</b> | <b>₩{format_number(car_data['car_price_krw'])}</b> | <b>{format_number(car_data['car_price_rub'])} ₽</b>\n\n"
@@ -2385,20 +2260,12 @@ def handle_callback_query(call):
         # Inline buttons for further actions
         keyboard = types.InlineKeyboardMarkup()
 
-        if call.data.startswith("detail_manual"):
-            keyboard.add(
-                types.InlineKeyboardButton(
-                    "Рассчитать стоимость другого автомобиля",
-                    callback_data="calculate_another_manual",
-                )
-            )
-        else:
-            keyboard.add(
-                types.InlineKeyboardButton(
-                    "Рассчитать стоимость другого автомобиля",
-                    callback_data="calculate_another",
-                )
+        keyboard.add(
+            types.InlineKeyboardButton(
+                "Рассчитать стоимость другого автомобиля",
+                callback_data="calculate_another",
             )
+        )
 
         keyboard.add(
             types.InlineKeyboardButton("Главное меню", callback_data="main_menu")
@@ -2411,10 +2278,14 @@ def handle_callback_query(call):
             reply_markup=keyboard,
         )
 
-    elif call.data == "technical_card":
+    elif call.data.startswith("technical_card_"):
         print_message("[ЗАПРОС] ТЕХНИЧЕСКАЯ ОТЧËТ ОБ АВТОМОБИЛЕ")
 
-        technical_card_output = get_technical_card()
+        ctx = get_quote_context(call, "technical_card_")
+        if ctx is None:
+            return
+
+        technical_card_output = get_technical_card(ctx)
 
         bot.send_message(
             call.message.chat.id,
@@ -2444,14 +2315,18 @@ def handle_callback_query(call):
             reply_markup=keyboard,
         )
 
-    elif call.data == "technical_report":
+    elif call.data.startswith("technical_report_"):
+        ctx = get_quote_context(call, "technical_report_")
+        if ctx is None:
+            return
+
         bot.send_message(
             call.message.chat.id,
             "Запрашиваю отчёт по ДТП. Пожалуйста подождите ⏳",
         )
 
         # Retrieve insurance information
-        insurance_info = get_insurance_total()
+        insurance_info = get_insurance_total(ctx)
 
         # Проверка на наличие ошибки
         if (
@@ -2461,7 +2336,7 @@ def handle_callback_query(call):
         ):
             error_message = (
                 "Не удалось получить данные о страховых выплатах. \n\n"
-                f'<a href="https://fem.encar.com/cars/report/accident/{car_id_external}">🔗 Посмотреть страховую историю вручную 🔗</a>\n\n\n'
+                f'<a href="https://fem.encar.com/cars/report/accident/{ctx.car_id}">🔗 Посмотреть страховую историю вручную 🔗</a>\n\n\n'
                 f"<b>Найдите две строки:</b>\n\n"
                 f"보험사고 이력 (내차 피해) - Выплаты по представленному автомобилю\n"
                 f"보험사고 이력 (타차 가해) - Выплаты другим участникам ДТП"
@@ -2500,7 +2375,7 @@ def handle_callback_query(call):
             tech_report_message = (
                 f"Страховые выплаты по представленному автомобилю: \n<b>{current_car_insurance_payments} ₩</b>\n\n"
                 f"Страховые выплаты другим участникам ДТП: \n<b>{other_car_insurance_payments} ₩</b>\n\n"
-                f'<a href="https://fem.encar.com/cars/report/inspect/{car_id_external}">🔗 Ссылка на схему повреждений кузовных элементов 🔗</a>'
+                f'<a href="https://fem.encar.com/cars/report/inspect/{ctx.car_id}">🔗 Ссылка на схему повреждений кузовных элементов 🔗</a>'
             )
 
             # Inline buttons for further actions
@@ -2527,6 +2402,14 @@ def handle_callback_query(call):
                 reply_markup=keyboard,
             )
 
+    elif call.data in ("detail", "technical_card", "technical_report"):
+        # Кнопки из сообщений, отправленных до появления ID машины в callback_data
+        bot.answer_callback_query(
+            call.id,
+            "🚫 Данные расчёта не найдены. Пожалуйста, рассчитайте автомобиль заново.",
+            show_alert=True,
+        )
+
     elif call.data == "calculate_another":
         bot.send_message(
             call.message.chat.id,
@@ -2611,7 +2494,7 @@ def process_car_price(message):
         "last_name": message.from_user.last_name,
         "phone_number": user_contacts.get(message.from_user.id, None),
     }
-    add_or_update_user(user_data_db)
+    user_activity.record(user_data_db)
 
     # Проверяем, что введено число
     if not user_input.isdigit():
@@ -2645,6 +2528,10 @@ def process_car_price(message):
     engine_volume = user_data[user_id]["engine_volume"]
     car_price_krw = user_data[user_id]["car_price_krw"]
 
+    # Ручной расчёт не сохраняется в quote_contexts: вся детализация уже
+    # в сообщении, а кнопок, ссылающихся на расчёт, у него нет
+    car_data = {}
+
     # Конвертируем стоимость автомобиля в USD и RUB
     price_krw = int(car_price_krw)
     price_usd = price_krw / usd_to_krw_rate
@@ -2657,49 +2544,25 @@ def process_car_price(message):
         engine_type=1,
     )
 
+    if response is None:
+        send_error_message(
+            message, "🚫 Не удалось рассчитать таможенные платежи. Попробуйте позже."
+        )
+        return
+
     # Таможенный сбор
     customs_fee = clean_number(response["sbor"])
     customs_duty = clean_number(response["tax"])
     recycling_fee = clean_number(response["util"])
 
-    # Расчет итоговой стоимости автомобиля в рублях
-    total_cost = (
-        price_rub
-        + ((1400000 / usd_to_krw_rate) * usd_to_rub_rate)
-        + ((300000 / usd_to_krw_rate) * usd_to_rub_rate)
-        + ((440000 / usd_to_krw_rate) * usd_to_rub_rate)
-        + 100000
-        + customs_fee
-        + customs_duty
-        + recycling_fee
-        + 13000
-        + 200000
-    )
-
-    total_cost_krw = (
-        price_krw
-        + 300000
-        + 440000
-        + (1400000 / usd_to_krw_rate)
-        + (100000 / usd_to_rub_rate) * usd_to_krw_rate
-        + (customs_fee / usd_to_rub_rate) * usd_to_krw_rate
-        + (customs_duty / usd_to_rub_rate) * usd_to_krw_rate
-        + (recycling_fee / usd_to_rub_rate) * usd_to_krw_rate
-        + (13000 / usd_to_rub_rate) * usd_to_krw_rate
-        + (200000 / usd_to_rub_rate) * usd_to_krw_rate
-    )
-
-    total_cost_usd = (
-        price_usd
-        + (1400000 / usd_to_krw_rate)
-        + (300000 / usd_to_krw_rate)
-        + (440000 / usd_to_krw_rate)
-        + (100000 / usd_to_rub_rate)
-        + (customs_fee / usd_to_rub_rate)
-        + (customs_duty / usd_to_rub_rate)
-        + (recycling_fee / usd_to_rub_rate)
-        + (13000 / usd_to_rub_rate)
-        + (200000 / usd_to_rub_rate)
+    # Расчет итоговой стоимости автомобиля в рублях, вонах и долларах
+    total_cost, total_cost_krw, total_cost_usd = calculate_total_costs(
+        price_krw,
+        customs_fee,
+        customs_duty,
+        recycling_fee,
+        usd_to_krw_rate,
+        usd_to_rub_rate,
     )
 
     car_data["total_cost_usd"] = total_cost_usd
@@ -2907,6 +2770,69 @@ def process_car_price(message):
     del user_data[message.chat.id]
 
 
+@bot.message_handler(content_types=["document"])
+def handle_links_document(message):
+    """Пакетный расчёт по ссылкам из файла .txt или .csv."""
+    document = message.document
+    file_name = (document.file_name or "").lower()
+
+    if not file_name.endswith((".txt", ".csv")):
+        bot.reply_to(message, "Пришлите список ссылок файлом .txt или .csv.")
+        return
+
+    if document.file_size and document.file_size > BATCH_MAX_FILE_SIZE:
+        bot.reply_to(message, "🚫 Файл слишком большой для списка ссылок.")
+        return
+
+    try:
+        file_info = bot.get_file(document.file_id)
+        content = bot.download_file(file_info.file_path)
+    except ApiTelegramException as e:
+        logging.error(f"Ошибка при загрузке файла со ссылками: {e}")
+        send_error_message(message, "🚫 Не удалось загрузить файл. Попробуйте снова.")
+        return
+
+    links = extract_listing_urls(content.decode("utf-8-sig", errors="replace"))
+    if not links:
+        bot.reply_to(
+            message,
+            "В файле не найдено ссылок на encar.com, kbchachacha.com или chutcha.net.",
+        )
+        return
+
+    calculate_batch(links, message)
+
+
+def prefetch_links(message):
+    """
+    Ссылки, объявления по которым загрузит расчёт этого сообщения. Лимит и
+    подписка проверяются без списания расчёта: в BOT_MODE=async объявления
+    заранее загружаются только для пользователей, которые получат расчёт.
+
+    :param message: Сообщение пользователя
+    :return: Список ссылок; пустой, если расчёта не будет
+    """
+    user_message = (message.text or "").strip()
+    user_id = message.chat.id
+    links = extract_listing_urls(user_message)
+
+    if len(links) > 1:
+        # Пакетный расчёт — только для подписчиков
+        if user_id in FREE_ACCESS_USERS or subscription_cache.is_subscribed(user_id):
+            return links[:BATCH_MAX_LINKS]
+        return []
+
+    if not re.match(CALCULATE_LINK_PATTERN, user_message):
+        return []
+    if (
+        user_id in FREE_ACCESS_USERS
+        or quote_available(message.from_user.id, FREE_CALCULATIONS)
+        or subscription_cache.is_subscribed(user_id)
+    ):
+        return [user_message]
+    return []
+
+
 @bot.message_handler(func=lambda message: True)
 def handle_message(message):
     user_message = message.text.strip()
@@ -2919,7 +2845,9 @@ def handle_message(message):
         "last_name": message.from_user.last_name,
         "phone_number": user_contacts.get(message.from_user.id, None),
     }
-    add_or_update_user(user_data)
+    user_activity.record(user_data)
+
+    links = extract_listing_urls(user_message)
 
     # Проверяем нажатие кнопки "Рассчитать автомобиль"
     if user_message == CALCULATE_CAR_TEXT:
@@ -2949,11 +2877,12 @@ def handle_message(message):
             "Для оформления заявки на заказ запчастей пожалуйста напишите нашему менеджеру\n@KHAN_ALEX2022",
         )
 
+    # Несколько ссылок в одном сообщении — пакетный расчёт
+    elif len(links) > 1:
+        calculate_batch(links, message)
+
     # Проверка на корректность ссылки
-    elif re.match(
-        r"^https?://(www|fem)\.encar\.com/.*|^https?://(www\.)?kbchachacha\.com/.*|^https?://m\.kbchachacha\.com/.*|^https?://(web\.)?chutcha\.net/.*",
-        user_message,
-    ):
+    elif re.match(CALCULATE_LINK_PATTERN, user_message):
         calculate_cost(user_message, message)
 
     # Проверка на другие команды
@@ -3028,8 +2957,41 @@ def handle_message(message):
 
 
 # Run the bot
+def flush_state():
+    """Сохраняет накопленную активность и кеш таможни, затем закрывает пул БД."""
+    user_activity.flush()
+    save_customs_cache()
+    close_db_pool()
+
+
+def handle_sigterm(signum, frame):
+    """
+    Heroku останавливает worker сигналом SIGTERM: прекращаем получать
+    обновления. Данные сохраняет shutdown после выхода из polling.
+    """
+    print("Получен SIGTERM, останавливаем бота")
+    bot.stop_polling()
+
+
+def shutdown(scheduler):
+    """
+    Останавливает фоновые задачи, дожидается обработчиков, которые ещё
+    выполняются, и только затем сохраняет данные и закрывает пул БД. Иначе
+    обработчик мог бы записать активность после сброса или заново открыть пул.
+
+    :param scheduler: Планировщик фоновых задач
+    """
+    scheduler.shutdown(wait=True)
+    bot.worker_pool.close()
+    batch_executor.shutdown(wait=True)
+    quote_executor.shutdown(wait=True)
+    flush_state()
+
+
 if __name__ == "__main__":
-    create_tables()
+    run_migrations()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    load_customs_cache()
     set_bot_commands()
     get_currency_rates()
     get_rub_to_krw_rate()
@@ -3038,6 +3000,25 @@ if __name__ == "__main__":
     # Обновляем курс каждые 12 часов
     scheduler = BackgroundScheduler()
     scheduler.add_job(get_usdt_to_krw_rate, "interval", hours=12)
+    # Периодически сохраняем кеш таможенных платежей
+    scheduler.add_job(save_customs_cache, "interval", minutes=10)
+    # Пачками записываем активность пользователей
+    scheduler.add_job(user_activity.flush, "interval", seconds=ACTIVITY_FLUSH_INTERVAL)
+    # Раз в час пишем в лог эффективность кешей подписок и объявлений
+    scheduler.add_job(subscription_cache.log_stats, "interval", hours=1)
+    scheduler.add_job(log_listing_cache_stats, "interval", hours=1)
+    # Чистим кеш file_id фото, оставляя последние использованные
+    scheduler.add_job(
+        evict_photo_file_ids, "interval", hours=1, args=[PHOTO_FILE_ID_LIMIT]
+    )
     scheduler.start()
 
-    bot.polling(non_stop=True)
+    try:
+        if BOT_MODE == "async":
+            from async_bot import run_async_bot
+
+            run_async_bot(bot, prefetch_links)
+        else:
+            bot.polling(non_stop=True)
+    finally:
+        shutdown(scheduler)
@@ -0,0 +1,241 @@
+import json
+import logging
+import re
+from abc import ABC, abstractmethod
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+import http_client
+from listing_cache import LISTING_CACHE_TTL, cache_listing, get_cached_listing
+from parsers import parse_chutcha_page, parse_encar_vehicle, parse_kbchacha_page
+from utils import TTLCache
+
+# Короткая ссылка KBChaCha (параметр c=...) → carSeq после редиректа.
+# В BOT_MODE=async ссылку разворачивает предзагрузка, а расчёт берёт готовый ID
+kbchacha_short_links = TTLCache(maxsize=2000, ttl=LISTING_CACHE_TTL)
+
+
+class ListingAdapter(ABC):
+    """
+    Площадка с объявлениями. Загрузка разделена на адрес запроса (listing_url)
+    и разбор ответа (parse), чтобы синхронный и асинхронный режимы бота
+    отличались только HTTP-клиентом.
+    """
+
+    source = ""
+    name = ""
+    hosts = ()
+    headers = {}
+
+    @abstractmethod
+    def parse_car_id(self, url):
+        """Достаёт ID объявления из ссылки пользователя."""
+
+    @abstractmethod
+    def listing_url(self, car_id):
+        """Адрес, по которому загружается объявление."""
+
+    @abstractmethod
+    def parse(self, status_code, text, car_id):
+        """
+        Разбирает ответ площадки.
+
+        :param status_code: HTTP-статус ответа
+        :param text: Тело ответа
+        :param car_id: ID объявления
+        :return: Listing или None
+        """
+
+    def fetch(self, car_id):
+        try:
+            response = http_client.get(self.listing_url(car_id), headers=self.headers)
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Request error while fetching {self.name} data: {e}")
+            return None
+
+        return self.parse(response.status_code, response.text, car_id)
+
+
+class EncarAdapter(ListingAdapter):
+    """Encar: данные берутся из readside API."""
+
+    source = "encar"
+    name = "Encar"
+    hosts = ("fem.encar.com", "www.encar.com", "encar.com")
+
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
+        "Referer": "http://www.encar.com/",
+        "Accept": "application/json",
+        "Accept-Language": "ko-KR,ko;q=0.9,en-US;q=0.8,en;q=0.7",
+        "Cache-Control": "max-age=0",
+        "Connection": "keep-alive",
+    }
+
+    def parse_car_id(self, url):
+        parsed_url = urlparse(url)
+
+        # Старые ссылки www.encar.com: ...cardetailview.do?carid=<id>
+        car_id = parse_qs(parsed_url.query).get("carid", [None])[0]
+        if car_id:
+            return car_id
+
+        # fem.encar.com/cars/detail/<id>
+        match = re.search(r"\d+", parsed_url.path)
+        return match.group(0) if match else None
+
+    def listing_url(self, car_id):
+        return f"https://api.encar.com/v1/readside/vehicle/{car_id}"
+
+    def parse(self, status_code, text, car_id):
+        if status_code != 200:
+            logging.error(f"Encar API returned status code {status_code}")
+            logging.error(f"Response content: {text[:500]}")
+            return None
+
+        try:
+            response = json.loads(text)
+        except ValueError as e:
+            logging.error(
+                f"JSON decode error for Encar API. Response was: {text[:500]}"
+            )
+            logging.error(f"Error details: {e}")
+            return None
+
+        return parse_encar_vehicle(response, car_id)
+
+
+class KBChaChaAdapter(ListingAdapter):
+    """KBChaCha: данные берутся со страницы объявления."""
+
+    source = "kbchacha"
+    name = "KBChaCha"
+    hosts = ("www.kbchachacha.com", "kbchachacha.com", "m.kbchachacha.com")
+
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+        "Accept-Language": "en,ru;q=0.9,en-CA;q=0.8,la;q=0.7,fr;q=0.6,ko;q=0.5",
+        "Connection": "keep-alive",
+    }
+
+    def parse_car_id(self, url):
+        query_params = parse_qs(urlparse(url).query)
+
+        # Попытка 1: обычный carSeq в параметрах
+        car_id = query_params.get("carSeq", [None])[0]
+
+        # Попытка 2: если есть параметр `c=...`, надо выполнить редирект
+        if not car_id and query_params.get("c"):
+            car_id = kbchacha_short_links.get(url)
+            if car_id:
+                return car_id
+
+            try:
+                response = http_client.get(url, allow_redirects=True, timeout=5)
+                redirected_query = parse_qs(urlparse(response.url).query)
+                car_id = redirected_query.get("carSeq", [None])[0]
+            except requests.exceptions.RequestException as e:
+                logging.error(f"Ошибка при обработке редиректа KBChaCha: {e}")
+                return None
+
+            if car_id:
+                kbchacha_short_links.set(url, car_id)
+
+        return car_id
+
+    def listing_url(self, car_id):
+        return f"https://www.kbchachacha.com/public/car/detail.kbc?carSeq={car_id}"
+
+    def parse(self, status_code, text, car_id):
+        return parse_kbchacha_page(text, car_id)
+
+
+class ChutchaAdapter(ListingAdapter):
+    """Chutcha.net: данные берутся из JSON страницы Next.js."""
+
+    source = "chutcha"
+    name = "Chutcha"
+    hosts = ("web.chutcha.net", "chutcha.net")
+
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+        "Accept-Language": "en,ru;q=0.9,en-CA;q=0.8,la;q=0.7,fr;q=0.6,ko;q=0.5",
+        "Referer": "https://web.chutcha.net/bmc/search?brandGroup=1&modelTree=%7B%7D&priceRange=0%2C0&mileage=0%2C0&year=&saleType=&accident=&fuel=&transmission=&region=&color=&option=&cpo=&theme=&sort=1&currPage=&carType=",
+    }
+
+    def parse_car_id(self, url):
+        path_parts = urlparse(url).path.split("/")
+
+        # /bmc/detail/<id>
+        if len(path_parts) >= 4 and path_parts[-2] == "detail":
+            return path_parts[-1]
+        return None
+
+    def listing_url(self, car_id):
+        return f"https://web.chutcha.net/bmc/detail/{car_id}"
+
+    def parse(self, status_code, text, car_id):
+        return parse_chutcha_page(text, car_id)
+
+
+# Хост ссылки → адаптер площадки
+LISTING_ADAPTERS = {}
+
+
+def register_adapter(adapter):
+    """Подключает площадку: ссылки с её хостов будут разбираться этим адаптером."""
+    for host in adapter.hosts:
+        LISTING_ADAPTERS[host] = adapter
+    return adapter
+
+
+for _adapter in (EncarAdapter(), KBChaChaAdapter(), ChutchaAdapter()):
+    register_adapter(_adapter)
+
+
+def get_adapter(url):
+    """Возвращает адаптер площадки по ссылке или None, если площадка неизвестна."""
+    return LISTING_ADAPTERS.get((urlparse(url).hostname or "").lower())
+
+
+def get_listing(adapter, car_id):
+    """
+    Получает объявление, используя кеш разобранных объявлений.
+
+    :param adapter: Адаптер площадки
+    :param car_id: ID объявления на площадке
+    :return: Listing или None
+    """
+    listing = get_cached_listing(adapter.source, car_id)
+    if listing is not None:
+        print(f"Объявление {adapter.source}:{car_id} взято из кеша")
+        return listing
+
+    listing = adapter.fetch(car_id)
+    if listing is not None:
+        cache_listing(listing)
+    return listing
+
+
+# Ссылка в произвольном тексте: до пробела, запятой или кавычки (строки CSV)
+LISTING_URL_RE = re.compile(r"https?://[^\s,;\"'<>]+")
+
+
+def extract_listing_urls(text):
+    """
+    Находит в тексте ссылки на поддерживаемые площадки.
+    ID объявления здесь не разбирается: у KBChaCha для этого бывает нужен запрос.
+
+    :param text: Текст сообщения или содержимое файла
+    :return: Список ссылок без повторов в порядке появления
+    """
+    urls = []
+
+    for url in LISTING_URL_RE.findall(text):
+        if url not in urls and get_adapter(url) is not None:
+            urls.append(url)
+
+    return urls
@@ -0,0 +1,58 @@
+-- Исходная схема (ранее создавалась в create_tables)
+
+-- Таблица пользователей
+CREATE TABLE IF NOT EXISTS users (
+    user_id BIGINT PRIMARY KEY,
+    username TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    phone_number TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS orders (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    car_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    price TEXT,
+    link TEXT NOT NULL,
+    year TEXT,
+    month TEXT,
+    mileage TEXT,
+    engine_volume INT,
+    transmission TEXT,
+    user_name TEXT,
+    full_name TEXT,
+    phone_number TEXT,
+    images TEXT[],
+    status TEXT DEFAULT '🔄 Не заказано',
+    total_cost_usd FLOAT,
+    total_cost_krw FLOAT,
+    total_cost_rub FLOAT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Поле created_at для таблиц, созданных до его появления
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+-- Таблица расчётов
+CREATE TABLE IF NOT EXISTS calculations (
+    user_id BIGINT PRIMARY KEY,
+    count INT DEFAULT 0
+);
+
+-- Таблица подписок
+CREATE TABLE IF NOT EXISTS subscriptions (
+    user_id BIGINT PRIMARY KEY,
+    status BOOLEAN DEFAULT FALSE
+);
+
+-- Кеш file_id загруженных в Telegram фото
+CREATE TABLE IF NOT EXISTS photo_file_ids (
+    url TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS photo_file_ids_last_used_idx ON photo_file_ids (last_used);
@@ -0,0 +1,2 @@
+-- Выборка заказов менеджером по статусу в порядке создания
+CREATE INDEX IF NOT EXISTS orders_status_created_at_idx ON orders (status, created_at);
@@ -0,0 +1,52 @@
+-- Один автомобиль может быть в избранном пользователя только один раз.
+-- Уникальный индекс (user_id, car_id) также служит индексом для выборок
+-- по user_id (get_orders, update_user_phone, update_user_name, get_all_users).
+
+-- Из дубликатов оставляем запись, с которой уже работали: сначала со статусом
+-- не по умолчанию, затем с телефоном или ФИО клиента, затем самую позднюю.
+-- add_favorite записывает вместо неизвестных контактов 'Неизвестно' —
+-- такое значение считаем отсутствующим
+CREATE TEMP TABLE favorite_keepers ON COMMIT DROP AS
+SELECT DISTINCT ON (user_id, car_id) id, user_id, car_id
+FROM orders
+ORDER BY user_id,
+         car_id,
+         COALESCE(status, '🔄 Не заказано') <> '🔄 Не заказано' DESC,
+         (NULLIF(phone_number, 'Неизвестно') IS NOT NULL
+             OR NULLIF(full_name, 'Неизвестно') IS NOT NULL) DESC,
+         id DESC;
+
+-- Контакты клиента, которых нет в оставляемой записи, переносим из дубликатов;
+-- если настоящих нет ни в одной копии, запись остаётся как есть
+UPDATE orders o
+SET phone_number = COALESCE(NULLIF(o.phone_number, 'Неизвестно'),
+                            d.phone_number, o.phone_number),
+    full_name = COALESCE(NULLIF(o.full_name, 'Неизвестно'),
+                         d.full_name, o.full_name),
+    user_name = COALESCE(NULLIF(o.user_name, 'Неизвестно'),
+                         d.user_name, o.user_name)
+FROM favorite_keepers k,
+     LATERAL (
+         SELECT (array_agg(phone_number ORDER BY id DESC)
+                     FILTER (WHERE NULLIF(phone_number, 'Неизвестно') IS NOT NULL)
+                 )[1] AS phone_number,
+                (array_agg(full_name ORDER BY id DESC)
+                     FILTER (WHERE NULLIF(full_name, 'Неизвестно') IS NOT NULL)
+                 )[1] AS full_name,
+                (array_agg(user_name ORDER BY id DESC)
+                     FILTER (WHERE NULLIF(user_name, 'Неизвестно') IS NOT NULL)
+                 )[1] AS user_name,
+                COUNT(*) AS copies
+         FROM orders
+         WHERE user_id = k.user_id AND car_id = k.car_id
+     ) d
+WHERE o.id = k.id
+  AND d.copies > 1;
+
+DELETE FROM orders o
+USING favorite_keepers k
+WHERE o.user_id = k.user_id
+  AND o.car_id = k.car_id
+  AND o.id <> k.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS orders_user_id_car_id_key ON orders (user_id, car_id);
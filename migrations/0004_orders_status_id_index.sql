@@ -0,0 +1,3 @@
+-- Страница заказов менеджера с фильтром по статусу (get_orders_page):
+-- WHERE status = ... AND id > ... ORDER BY id LIMIT ... читается из индекса по порядку
+CREATE INDEX IF NOT EXISTS orders_status_id_idx ON orders (status, id);
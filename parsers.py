@@ -0,0 +1,313 @@
+import json
+import logging
+import re
+from dataclasses import dataclass
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from utils import generate_encar_photo_url
+
+
+@dataclass(frozen=True, slots=True)
+class Listing:
+    """Объявление с любой площадки в едином виде."""
+
+    source: str  # Площадка: "encar", "kbchacha", "chutcha"
+    car_id: str  # ID объявления на площадке
+    url: str  # Ссылка на объявление для пользователя
+    title: str
+    price_krw: int | None  # Цена в вонах
+    year: int | None  # Год выпуска (четыре цифры)
+    month: int | None  # Месяц выпуска
+    engine_volume: int | None  # Объём двигателя, см³
+    mileage_km: int | None
+    transmission: str  # "Автомат" или "Механика"
+    photo_urls: tuple = ()
+    vehicle_id: int | None = None  # Encar: ID для техотчёта и страховой истории
+    vehicle_no: str | None = None  # Госномер
+    own_damage_total: int | None = None  # Страховые выплаты по этому авто
+    other_damage_total: int | None = None  # Страховые выплаты другим авто
+
+    @property
+    def is_complete(self):
+        """Хватает ли данных для расчёта стоимости."""
+        return bool(self.price_krw and self.engine_volume and self.year and self.month)
+
+
+def _to_int(value):
+    """Достаёт целое число из значения вида 2000, "2,000cc" или "12,345km"."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    digits = re.sub(r"\D", "", str(value or ""))
+    return int(digits) if digits else None
+
+
+def _transmission(name):
+    return "Автомат" if "오토" in (name or "") else "Механика"
+
+
+def _script_pattern(script_type, script_id=None):
+    attrs = rf'\btype=["\']{re.escape(script_type)}["\']'
+    if script_id:
+        attrs = rf'(?=[^>]*\bid=["\']{re.escape(script_id)}["\'])[^>]*{attrs}'
+    return re.compile(
+        rf"<script\b[^>]*{attrs}[^>]*>(.*?)</script\s*>", re.DOTALL | re.IGNORECASE
+    )
+
+
+_LD_JSON_SCRIPT = _script_pattern("application/ld+json")
+_NEXT_DATA_SCRIPT = _script_pattern("application/json", "__NEXT_DATA__")
+_JSON_SCRIPT = _script_pattern("application/json")
+
+
+def extract_ld_json(html):
+    """
+    Находит содержимое первого <script type="application/ld+json"> без разбора
+    всей страницы.
+
+    :param html: Текст HTML-страницы
+    :return: Текст JSON или None, если скрипт не найден
+    """
+    match = _LD_JSON_SCRIPT.search(html)
+    return match.group(1).strip() if match else None
+
+
+def extract_next_data(html):
+    """
+    Находит JSON страницы Next.js (<script id="__NEXT_DATA__">).
+    Если такого id нет, берёт первый <script type="application/json">.
+
+    :param html: Текст HTML-страницы
+    :return: Текст JSON или None, если скрипт не найден
+    """
+    match = _NEXT_DATA_SCRIPT.search(html) or _JSON_SCRIPT.search(html)
+    return match.group(1).strip() if match else None
+
+
+def extract_table_fields(html, table_class):
+    """
+    Разбирает только таблицу с указанным классом и возвращает пары
+    заголовок (th) → значение (td).
+
+    :param html: Текст HTML-страницы
+    :param table_class: CSS-класс таблицы
+    :return: Словарь значений или None, если таблица не найдена
+    """
+    # Во время разбора class ещё не разбит на список — сравниваем по словам
+    strainer = SoupStrainer(
+        "table",
+        class_=lambda value: bool(value) and table_class in str(value).split(),
+    )
+    soup = BeautifulSoup(html, "lxml", parse_only=strainer)
+    table = soup.find("table")
+    if table is None:
+        return None
+
+    fields = {}
+    for row in table.find_all("tr"):
+        for th, td in zip(row.find_all("th"), row.find_all("td")):
+            fields[th.text.strip()] = td.text.strip()
+    return fields
+
+
+def parse_encar_vehicle(response, car_id):
+    """
+    Разбирает ответ Encar readside API (api.encar.com/v1/readside/vehicle/<id>).
+
+    :param response: Распарсенный JSON ответа
+    :param car_id: ID объявления
+    :return: Listing или None при ошибке
+    """
+    try:
+        category = response["category"]
+        spec = response["spec"]
+        car_date = category["yearMonth"]  # Например, "202105"
+
+        # Список фотографий (берем первые 10)
+        car_photos = [
+            generate_encar_photo_url(photo["path"])
+            for photo in response["photos"][:10]
+        ]
+
+        return Listing(
+            source="encar",
+            car_id=str(car_id),
+            url=f"https://fem.encar.com/cars/detail/{car_id}",
+            title=" ".join(
+                part
+                for part in (
+                    category["manufacturerEnglishName"],  # Марка
+                    category["modelGroupEnglishName"],  # Модель
+                    category["gradeDetailEnglishName"],  # Комплектация
+                )
+                if part
+            ),
+            # Encar указывает цену в десятках тысяч вон (만원)
+            price_krw=_to_int(response["advertisement"]["price"]) * 10000,
+            year=int(car_date[:4]),
+            month=int(car_date[4:6]),
+            engine_volume=_to_int(spec["displacement"]),
+            mileage_km=_to_int(spec["mileage"]),
+            transmission=_transmission(spec["transmissionName"]),
+            photo_urls=tuple(url for url in car_photos if url),
+            vehicle_id=response["vehicleId"],
+            vehicle_no=response["vehicleNo"],
+        )
+    except (KeyError, TypeError, IndexError, ValueError) as e:
+        logging.error(f"Error extracting car data from Encar response: {e}")
+        return None
+
+
+def parse_kbchacha_page(html, car_id):
+    """
+    Разбирает страницу объявления KBChaCha (detail.kbc).
+
+    :param html: Текст HTML-страницы
+    :param car_id: ID объявления (carSeq)
+    :return: Listing или None, если данные не найдены
+    """
+    # Находим JSON в <script type="application/ld+json">
+    json_script = extract_ld_json(html)
+    if not json_script:
+        logging.error(
+            "Не удалось найти JSON-данные в <script type='application/ld+json'>"
+        )
+        return None
+
+    try:
+        json_data = json.loads(json_script)
+    except json.JSONDecodeError as e:
+        logging.error(f"Ошибка разбора JSON KBChaCha: {e}")
+        return None
+
+    car_name = json_data.get("name", "Неизвестная модель")
+
+    # Находим таблицу с информацией
+    table = extract_table_fields(html, "detail-info-table")
+    if table is None:
+        logging.warning("Таблица информации KBChaCha не найдена")
+        table = {}
+
+    # Год выпуска в формате "21년05월"
+    year = month = None
+    date_match = re.search(r"(\d{2})년(\d{2})월", table.get("연식", ""))
+    if date_match:
+        year = 2000 + int(date_match.group(1))
+        month = int(date_match.group(2))
+
+    engine_volume = _to_int(table.get("배기량"))
+
+    # Если объем двигателя не найден или равен 0, пытаемся извлечь из названия
+    if not engine_volume:
+        # Ищем числа с точкой (например, 2.0) в названии автомобиля
+        engine_match = re.search(r"(\d+\.\d+)", car_name)
+        if engine_match:
+            # Преобразуем, например, 2.0 в 2000cc
+            engine_volume = int(float(engine_match.group(1)) * 1000)
+        else:
+            # Ищем просто числа (например, 2000) в названии
+            engine_match = re.search(r"(\d{3,4})", car_name)
+            if engine_match and 500 <= int(engine_match.group(1)) <= 9000:
+                engine_volume = int(engine_match.group(1))
+        if engine_volume:
+            logging.info(f"Извлечен объем двигателя из названия: {engine_volume}cc")
+
+    return Listing(
+        source="kbchacha",
+        car_id=str(car_id),
+        url=f"https://www.kbchachacha.com/public/car/detail.kbc?carSeq={car_id}",
+        title=car_name,
+        price_krw=_to_int(json_data.get("offers", {}).get("price")),  # Цена в вонах
+        year=year,
+        month=month,
+        engine_volume=engine_volume,
+        mileage_km=_to_int(table.get("주행거리")),
+        transmission="Автомат",
+        photo_urls=tuple(json_data.get("image", [])[:10]),  # Берем первые 10 фото
+        vehicle_no=table.get("차량정보"),
+    )
+
+
+def parse_chutcha_page(html, car_id):
+    """
+    Разбирает страницу объявления Chutcha.net (Next.js).
+
+    :param html: Текст HTML-страницы
+    :param car_id: ID объявления
+    :return: Listing или None, если данные не найдены
+    """
+    # Extract JSON data from <script id="__NEXT_DATA__" type="application/json">
+    script_text = extract_next_data(html)
+    if not script_text:
+        logging.error("Chutcha: JSON-данные страницы не найдены")
+        return None
+
+    try:
+        data = json.loads(script_text)
+        vehicle_data = (
+            data.get("props", {})
+            .get("pageProps", {})
+            .get("dehydratedState", {})
+            .get("queries", [])[0]
+            .get("state", {})
+            .get("data", {})
+        )
+    except (json.JSONDecodeError, IndexError, AttributeError) as e:
+        logging.error(f"Ошибка разбора JSON Chutcha: {e}")
+        return None
+
+    base_info = vehicle_data.get("base_info", {})
+
+    # Получение изображений
+    img_list = [
+        "https://imgsc.chutcha.kr"
+        f"{image.get('img_path', '').replace('.jpg', '_ori.jpg')}?s=1024x768&t=crop"
+        for image in vehicle_data.get("img_list", [])
+    ]
+
+    name = " ".join(
+        base_info.get(key, "")
+        for key in ("brand_name", "model_name", "sub_model_name", "grade_name")
+    )
+
+    # Список всех страховых выплат
+    car_history = (
+        vehicle_data.get("safe_info", {})
+        .get("carhistory_safe", {})
+        .get("insurance", {})
+        .get("list", [])
+    )
+
+    own_damage_total = None  # Выплаты по текущему авто
+    other_damage_total = None  # Выплаты по другим авто
+
+    if car_history:
+        own_damage_total = 0
+        other_damage_total = 0
+        for claim in car_history:
+            claim_price = _to_int(claim.get("price")) or 0
+
+            if claim.get("type") == "1":
+                own_damage_total += claim_price
+            elif claim.get("type") == "2":
+                other_damage_total += claim_price
+
+    price = _to_int(base_info.get("plain_price"))
+
+    return Listing(
+        source="chutcha",
+        car_id=str(car_id),
+        url=f"https://web.chutcha.net/bmc/detail/{car_id}",
+        title=name,
+        # Chutcha указывает цену в десятках тысяч вон (만원)
+        price_krw=price * 10000 if price else None,
+        year=_to_int(base_info.get("first_reg_year")),
+        month=_to_int(base_info.get("first_reg_month")),
+        engine_volume=_to_int(base_info.get("displacement")),
+        mileage_km=_to_int(base_info.get("plain_mileage")),
+        transmission=_transmission(base_info.get("transmission_name")),
+        photo_urls=tuple(img_list),
+        vehicle_no=base_info.get("number_plate") or None,
+        own_damage_total=own_damage_total,
+        other_damage_total=other_damage_total,
+    )
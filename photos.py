@@ -0,0 +1,455 @@
+import os
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+
+import http_client
+from database import delete_photo_file_ids, get_photo_file_ids, save_photo_file_ids
+from utils import TTLCache
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow не установлен — фото отправляются как есть
+    Image = None
+
+# Сколько фото одновременно загружается со всех площадок
+PHOTO_PARALLELISM = int(os.getenv("PHOTO_PARALLELISM", "8"))
+# Таймаут загрузки одного фото (секунды)
+PHOTO_TIMEOUT = float(os.getenv("PHOTO_TIMEOUT", "10"))
+# Фото загружаются потоково: до PHOTO_SPOOL_MEMORY байт в памяти, дальше — на диск
+PHOTO_CHUNK_SIZE = 64 * 1024
+PHOTO_SPOOL_MEMORY = int(os.getenv("PHOTO_SPOOL_MEMORY", str(1024 * 1024)))
+# Максимальный размер одного фото и всего альбома (байты)
+PHOTO_MAX_BYTES = int(os.getenv("PHOTO_MAX_BYTES", str(5 * 1024 * 1024)))
+PHOTO_ALBUM_MAX_BYTES = int(
+    os.getenv("PHOTO_ALBUM_MAX_BYTES", str(30 * 1024 * 1024))
+)
+
+# Telegram принимает не больше 10 фото в одном альбоме
+MEDIA_GROUP_LIMIT = 10
+
+# Уменьшение фото перед отправкой (Telegram всё равно показывает не больше 1280px)
+PHOTO_RESIZE = os.getenv("PHOTO_RESIZE", "1") == "1" and Image is not None
+PHOTO_MAX_SIDE = int(os.getenv("PHOTO_MAX_SIDE", "1280"))
+PHOTO_JPEG_QUALITY = int(os.getenv("PHOTO_JPEG_QUALITY", "85"))
+# Сколько памяти (байты) может занимать обработка фото одного альбома
+PHOTO_ALBUM_MEMORY_LIMIT = int(
+    os.getenv("PHOTO_ALBUM_MEMORY_LIMIT", str(64 * 1024 * 1024))
+)
+
+# Сколько file_id держать в памяти (в БД — PHOTO_FILE_ID_LIMIT, см. main.py)
+PHOTO_FILE_ID_CACHE_SIZE = int(os.getenv("PHOTO_FILE_ID_CACHE_SIZE", "5000"))
+PHOTO_FILE_ID_LIMIT = int(os.getenv("PHOTO_FILE_ID_LIMIT", "100000"))
+
+# URL фото → file_id в Telegram
+photo_file_ids = TTLCache(maxsize=PHOTO_FILE_ID_CACHE_SIZE)
+
+# Ответы Telegram на устаревший или чужой file_id
+FILE_ID_ERRORS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "file reference",
+    "wrong file_id",
+    "file_id_invalid",
+)
+
+_download_slots = threading.BoundedSemaphore(PHOTO_PARALLELISM)
+
+
+class BufferGauge:
+    """
+    Считает объём удерживаемых буферов фото и его пик.
+    У каждого альбома свой счётчик, изменения которого передаются
+    в общий счётчик процесса (parent).
+    """
+
+    def __init__(self, parent=None):
+        self.current = 0
+        self.peak = 0
+        self.parent = parent
+        self._lock = threading.Lock()
+
+    def add(self, size):
+        with self._lock:
+            self.current += size
+            self.peak = max(self.peak, self.current)
+        if self.parent is not None:
+            self.parent.add(size)
+
+    def release(self, size):
+        with self._lock:
+            self.current -= size
+        if self.parent is not None:
+            self.parent.release(size)
+
+    def stats(self):
+        return {"current": self.current, "peak": self.peak}
+
+
+photo_buffers = BufferGauge()
+
+
+def download_photo(photo_url, gauge):
+    """
+    Потоково загружает одно фото в SpooledTemporaryFile.
+    Загрузка прерывается, если фото больше PHOTO_MAX_BYTES.
+    :param gauge: Счётчик буферов, учитывает байты по мере загрузки
+    :return: (файл с фото, позиция в начале; размер в байтах) или None
+    """
+    buffer = SpooledTemporaryFile(max_size=PHOTO_SPOOL_MEMORY)
+    size = 0
+
+    try:
+        with _download_slots, http_client.get(
+            photo_url, timeout=PHOTO_TIMEOUT, stream=True
+        ) as response:
+            if response.status_code != 200:
+                print(f"Ошибка загрузки фото: {photo_url} - {response.status_code}")
+                buffer.close()
+                return None
+
+            if int(response.headers.get("Content-Length") or 0) > PHOTO_MAX_BYTES:
+                print(f"Фото слишком большое, пропускаем: {photo_url}")
+                buffer.close()
+                return None
+
+            for chunk in response.iter_content(PHOTO_CHUNK_SIZE):
+                if size + len(chunk) > PHOTO_MAX_BYTES:
+                    print(f"Фото слишком большое, загрузка прервана: {photo_url}")
+                    buffer.close()
+                    gauge.release(size)
+                    return None
+
+                buffer.write(chunk)
+                size += len(chunk)
+                gauge.add(len(chunk))
+    except Exception as e:
+        print(f"Ошибка при обработке фото {photo_url}: {e}")
+        buffer.close()
+        gauge.release(size)
+        return None
+
+    buffer.seek(0)
+    return buffer, size
+
+
+class MemoryBudget:
+    """Ограничивает объём памяти, одновременно занятой обработкой фото."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._used = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, size):
+        # Фото больше лимита обрабатывается, но только в одиночку
+        size = min(size, self.limit)
+
+        with self._condition:
+            self._condition.wait_for(lambda: self._used + size <= self.limit)
+            self._used += size
+
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._used -= size
+                self._condition.notify_all()
+
+
+def shrink_photo(photo, size, budget):
+    """
+    Уменьшает фото до PHOTO_MAX_SIDE по большей стороне и пережимает в JPEG.
+    Если обработка не дала выигрыша или не удалась, возвращает исходный файл.
+    :return: (файл для отправки, его размер)
+    """
+    if not PHOTO_RESIZE:
+        return photo, size
+
+    try:
+        with Image.open(photo) as image:
+            # JPEG декодируется сразу в уменьшенном масштабе
+            image.draft("RGB", (PHOTO_MAX_SIDE, PHOTO_MAX_SIDE))
+            decoded_size = image.width * image.height * len(image.getbands())
+
+            with budget.reserve(decoded_size):
+                if image.mode != "RGB":
+                    image = image.convert("RGB")
+                image.thumbnail((PHOTO_MAX_SIDE, PHOTO_MAX_SIDE))
+
+                output = BytesIO()
+                image.save(output, "JPEG", quality=PHOTO_JPEG_QUALITY, optimize=True)
+    except Exception as e:
+        print(f"Ошибка при уменьшении фото: {e}")
+        photo.seek(0)
+        return photo, size
+
+    if output.tell() >= size:
+        photo.seek(0)
+        return photo, size
+
+    photo.close()
+    output.seek(0)
+    return output, output.getbuffer().nbytes
+
+
+def fetch_photo(photo_url, budget, gauge):
+    """
+    Загружает и при необходимости уменьшает фото.
+    Исходное фото учитывается в gauge с начала загрузки, а после уменьшения
+    заменяется в нём уменьшенным.
+    :return: (файл для отправки, его размер, размер исходного фото) или None
+    """
+    downloaded = download_photo(photo_url, gauge)
+    if downloaded is None:
+        return None
+
+    original, original_size = downloaded
+    photo, size = shrink_photo(original, original_size, budget)
+    if photo is not original:
+        gauge.add(size)
+        gauge.release(original_size)
+
+    return photo, size, original_size
+
+
+def get_cached_file_ids(urls):
+    """Ищет file_id уже загруженных фото: сначала в памяти, затем в БД."""
+    found = {}
+    missing = []
+
+    for url in urls:
+        file_id = photo_file_ids.get(url)
+        if file_id:
+            found[url] = file_id
+        else:
+            missing.append(url)
+
+    if missing:
+        try:
+            stored = get_photo_file_ids(missing)
+        except Exception as e:
+            print(f"Ошибка при получении file_id фото из БД: {e}")
+            stored = {}
+
+        for url, file_id in stored.items():
+            photo_file_ids.set(url, file_id)
+        found.update(stored)
+
+    return found
+
+
+def remember_file_ids(sent_photos):
+    """
+    Запоминает file_id фото из сообщений, которые вернул Telegram.
+    :param sent_photos: Пары (URL фото, отправленное сообщение)
+    """
+    file_ids = {url: sent.photo[-1].file_id for url, sent in sent_photos if sent.photo}
+
+    for url, file_id in file_ids.items():
+        photo_file_ids.set(url, file_id)
+
+    try:
+        save_photo_file_ids(file_ids)
+    except Exception as e:
+        print(f"Ошибка при сохранении file_id фото: {e}")
+
+
+def is_file_id_error(error):
+    """Отклонил ли Telegram запрос из-за недействительного file_id."""
+    description = (error.description or "").lower()
+    return error.error_code == 400 and any(
+        text in description for text in FILE_ID_ERRORS
+    )
+
+
+def forget_file_ids(urls):
+    """Удаляет file_id, которые Telegram отказался принять."""
+    for url in urls:
+        photo_file_ids.pop(url)
+
+    try:
+        delete_photo_file_ids(urls)
+    except Exception as e:
+        print(f"Ошибка при удалении file_id фото: {e}")
+
+
+class PhotoAlbum:
+    """
+    Альбом фото автомобиля, загружаемый в фоне.
+    Фото, которые уже отправлялись в Telegram, берутся по file_id без загрузки.
+    Остальные начинают загружаться сразу при создании, порядок фото сохраняется.
+    """
+
+    def __init__(self, photo_urls, executor):
+        self.photo_urls = photo_urls
+        self.file_ids = get_cached_file_ids(photo_urls)
+        self.bytes_in = 0  # Загружено с площадки
+        self.bytes_out = 0  # Отправлено в Telegram
+        self.buffers = BufferGauge(parent=photo_buffers)  # Буферы этого альбома
+        self._executor = executor
+        self._budget = MemoryBudget(PHOTO_ALBUM_MEMORY_LIMIT)
+        self._fetched = []  # Загруженные файлы, закрываются после отправки
+        self._photos = {}  # URL → загруженный файл (для повторной отправки)
+        self._sizes = {}  # URL → размер загруженного файла
+        self._futures = {
+            photo_url: executor.submit(
+                fetch_photo, photo_url, self._budget, self.buffers
+            )
+            for photo_url in photo_urls
+            if photo_url not in self.file_ids
+        }
+
+    def media(self):
+        """
+        Дожидается загрузки и возвращает список (url, InputMediaPhoto) для альбома.
+        """
+        media_group = []
+        total_bytes = 0
+
+        for photo_url in self.photo_urls:
+            file_id = self.file_ids.get(photo_url)
+            if file_id:
+                media_group.append((photo_url, types.InputMediaPhoto(file_id)))
+                continue
+
+            photo = self._take(photo_url)
+            if photo is None:
+                continue
+
+            total_bytes += self._sizes[photo_url]
+            if total_bytes > PHOTO_ALBUM_MAX_BYTES:
+                print("Превышен лимит размера альбома, остальные фото не отправляются")
+                break
+
+            media_group.append((photo_url, types.InputMediaPhoto(photo)))
+
+        return media_group
+
+    def _take(self, photo_url):
+        """Дожидается загрузки одного фото. :return: файл с фото или None"""
+        fetched = self._futures.pop(photo_url).result()
+        if fetched is None:
+            return None
+
+        photo, size, original_size = fetched
+        self._fetched.append((photo, size))
+        self._photos[photo_url] = photo
+        self._sizes[photo_url] = size
+        self.bytes_in += original_size
+        self.bytes_out += size
+        return photo
+
+    def _refetch(self, chunk):
+        """
+        Пересобирает часть альбома, которую Telegram отклонил из-за file_id:
+        фото с сохранённым file_id загружаются заново, а уже отправленные
+        файлы перематываются в начало, чтобы загрузить их повторно.
+        """
+        for url, _ in chunk:
+            if url in self.file_ids:
+                del self.file_ids[url]
+                self._futures[url] = self._executor.submit(
+                    fetch_photo, url, self._budget, self.buffers
+                )
+
+        rebuilt = []
+        for url, _ in chunk:
+            if url in self._futures:
+                photo = self._take(url)
+                if photo is None:
+                    continue
+            else:
+                photo = self._photos[url]
+                photo.seek(0)
+            rebuilt.append((url, types.InputMediaPhoto(photo)))
+
+        return rebuilt
+
+    def close(self):
+        """
+        Освобождает буферы фото, в том числе не попавших в альбом.
+        Ещё не начатые загрузки отменяются, начатые — дожидаются и закрываются.
+        """
+        for future in self._futures.values():
+            if future.cancel():
+                continue
+            fetched = future.result()
+            if fetched is not None:
+                self._fetched.append(fetched[:2])
+        self._futures.clear()
+
+        for photo, size in self._fetched:
+            photo.close()
+            self.buffers.release(size)
+        self._fetched.clear()
+
+    def send(self, bot, chat_id):
+        """Отправляет фото альбомами по 10 штук и запоминает их file_id."""
+        try:
+            self._send(bot, chat_id)
+        finally:
+            self.close()
+
+    def _send(self, bot, chat_id):
+        media_group = self.media()
+
+        for start in range(0, len(media_group), MEDIA_GROUP_LIMIT):
+            chunk = media_group[start : start + MEDIA_GROUP_LIMIT]
+
+            try:
+                messages = bot.send_media_group(chat_id, [media for _, media in chunk])
+            except ApiTelegramException as e:
+                cached_urls = [url for url, _ in chunk if url in self.file_ids]
+                if not cached_urls or not is_file_id_error(e):
+                    raise
+
+                # Telegram не принял сохранённые file_id — загружаем фото заново
+                print(f"Ошибка отправки фото по file_id, загружаем заново: {e}")
+                forget_file_ids(cached_urls)
+                chunk = self._refetch(chunk)
+                messages = bot.send_media_group(chat_id, [media for _, media in chunk])
+
+            # Запоминаем file_id только что загруженных фото
+            remember_file_ids(
+                (url, sent)
+                for (url, _), sent in zip(chunk, messages)
+                if url not in self.file_ids
+            )
+
+        print(
+            f"📷 Фото: {len(media_group)} шт., из кеша {len(self.file_ids)}, "
+            f"загружено {self.bytes_in // 1024} КБ, "
+            f"отправлено {self.bytes_out // 1024} КБ, "
+            f"пик буферов альбома {self.buffers.peak // 1024} КБ, "
+            f"буферы фото {photo_buffers.stats()}"
+        )
+
+
+def send_local_photo(bot, chat_id, path):
+    """
+    Отправляет локальное фото (например, логотип), загружая его в Telegram
+    только один раз — дальше используется сохранённый file_id.
+    """
+    cache_key = f"file:{path}:{int(os.path.getmtime(path))}"
+
+    file_id = get_cached_file_ids([cache_key]).get(cache_key)
+    if file_id:
+        try:
+            return bot.send_photo(chat_id, photo=file_id)
+        except ApiTelegramException as e:
+            if not is_file_id_error(e):
+                raise
+            print(f"Ошибка отправки фото по file_id, загружаем заново: {e}")
+            forget_file_ids([cache_key])
+
+    with open(path, "rb") as photo_file:
+        sent = bot.send_photo(chat_id, photo=types.InputFile(photo_file))
+
+    remember_file_ids([(cache_key, sent)])
+    return sent
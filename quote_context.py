@@ -0,0 +1,32 @@
+import os
+from dataclasses import dataclass, field
+
+from utils import TTLCache
+
+# Сколько последних расчётов держать в памяти
+QUOTE_CONTEXT_LIMIT = int(os.getenv("QUOTE_CONTEXT_LIMIT", "5000"))
+QUOTE_CONTEXT_TTL = int(os.getenv("QUOTE_CONTEXT_TTL", str(24 * 60 * 60)))
+
+
+@dataclass(slots=True)
+class QuoteContext:
+    """
+    Данные одного расчёта автомобиля.
+    Создаётся на каждый запрос и хранится по (chat_id, car_id): кнопки
+    "Детали расчёта", "Технический отчёт", "Выплаты по ДТП" и "В избранное"
+    передают car_id и относятся к машине из своего сообщения, даже если
+    в чате уже посчитаны другие.
+    """
+
+    chat_id: int
+    link: str = ""
+    car_id: str = ""  # ID автомобиля на площадке (Encar, KBChaCha, Chutcha)
+    car_year: str | None = None  # Год выпуска (две последние цифры)
+    car_month: str | None = None  # Месяц выпуска (две цифры)
+    vehicle_id: int | None = None  # Encar: ID для техотчёта и страховой истории
+    vehicle_no: str | None = None  # Encar: госномер
+    car_data: dict = field(default_factory=dict)  # Результаты расчёта
+
+
+# Расчёты по ключу (chat_id, car_id)
+quote_contexts = TTLCache(maxsize=QUOTE_CONTEXT_LIMIT, ttl=QUOTE_CONTEXT_TTL)
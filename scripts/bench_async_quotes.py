@@ -0,0 +1,146 @@
+"""
+Нагрузочный замер: пачка одновременных расчётов в режимах BOT_MODE=sync и async.
+
+Каждое сообщение — ссылка на своё объявление Encar. В синхронном режиме
+обработчик в одном из BOT_NUM_THREADS потоков загружает объявление через
+http_client и затем считает таможню. В асинхронном режиме объявление сначала
+загружает async_bot.prefetch_listings (aiohttp), а потоку остаётся расчёт
+с объявлением из кеша. Площадку и calcus.ru заменяют локальные серверы
+с задержкой ответа; объявление — сохранённый ответ из tests/fixtures/listings.
+
+Запуск: python scripts/bench_async_quotes.py [--users 40] [--threads 8]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import math
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+import async_bot  # noqa: E402
+import http_client  # noqa: E402
+import marketplaces  # noqa: E402
+from standin import Route, StandIn  # noqa: E402
+
+FIXTURE = os.path.join(ROOT, "tests", "fixtures", "listings", "encar_38512345.json")
+CUSTOMS = '{"sbor": "4 269.00", "tax": "0.00", "util": "5 200.00"}'
+
+
+class Quotes:
+    """Обработчик расчёта, как в потоке синхронного бота; считает занятые потоки."""
+
+    def __init__(self, calcus_host):
+        self.calcus_host = calcus_host
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def handle(self, link, started):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            adapter = marketplaces.get_adapter(link)
+            car_id = adapter.parse_car_id(link)
+            listing = marketplaces.get_listing(adapter, car_id)
+            assert listing is not None
+            # Остальная часть расчёта — запрос к calcus.ru
+            http_client.post(self.calcus_host.url("/calculate/Customs")).json()
+        finally:
+            with self._lock:
+                self.running -= 1
+        return (time.perf_counter() - started) * 1000
+
+
+def run_sync(links, quotes, threads):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [pool.submit(quotes.handle, link, started) for link in links]
+        return [future.result() for future in futures]
+
+
+async def run_async(links, quotes, threads):
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+
+        async def dispatch(link):
+            await async_bot.prefetch_listings([link])
+            return await loop.run_in_executor(pool, quotes.handle, link, started)
+
+        try:
+            return await asyncio.gather(*(dispatch(link) for link in links))
+        finally:
+            await async_bot.close_session()
+
+
+def report(name, timings, quotes):
+    timings = sorted(timings)
+    print(
+        f"{name:<6} всего {timings[-1]:7.0f} мс   "
+        f"медиана {statistics.median(timings):6.0f} мс   "
+        f"p95 {timings[math.ceil(len(timings) * 0.95) - 1]:6.0f} мс   "
+        f"потоков с расчётом одновременно ≤ {quotes.max_running}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--threads", type=int, default=8, help="BOT_NUM_THREADS")
+    parser.add_argument("--listing-latency", type=float, default=0.5)
+    parser.add_argument("--customs-latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    if async_bot.aiohttp is None:
+        sys.exit("Для замера нужен пакет aiohttp")
+
+    with open(FIXTURE, encoding="utf-8") as f:
+        listing = Route(f.read(), "application/json")
+
+    # Свои объявления для каждого режима, чтобы второй не брал их из кеша
+    car_ids = range(1, 2 * args.users + 1)
+    listing_routes = {f"/v1/readside/vehicle/{car_id}": listing for car_id in car_ids}
+    calcus_routes = {"/calculate/Customs": Route(CUSTOMS, "application/json")}
+
+    with StandIn(listing_routes, args.listing_latency) as listing_host:
+        with StandIn(calcus_routes, args.customs_latency) as calcus_host:
+            # Площадка Encar — локальный сервер
+            marketplaces.EncarAdapter.listing_url = lambda self, car_id: (
+                listing_host.url(f"/v1/readside/vehicle/{car_id}")
+            )
+            links = [
+                f"https://fem.encar.com/cars/detail/{car_id}" for car_id in car_ids
+            ]
+
+            print(
+                f"{args.users} расчётов одновременно, {args.threads} потоков, "
+                f"объявление {args.listing_latency * 1000:.0f} мс, "
+                f"таможня {args.customs_latency * 1000:.0f} мс"
+            )
+            sync_quotes = Quotes(calcus_host)
+            async_quotes = Quotes(calcus_host)
+            # Журнал кеша объявлений на каждый расчёт замер не выводит
+            with contextlib.redirect_stdout(io.StringIO()):
+                sync_timings = run_sync(links[: args.users], sync_quotes, args.threads)
+                async_timings = asyncio.run(
+                    run_async(links[args.users :], async_quotes, args.threads)
+                )
+
+    report("sync", sync_timings, sync_quotes)
+    report("async", async_timings, async_quotes)
+
+
+if __name__ == "__main__":
+    main()
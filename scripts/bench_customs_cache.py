@@ -0,0 +1,103 @@
+"""
+Задержка расчёта таможни на одну котировку: холодный кеш против тёплого.
+
+calcus.ru заменяется локальным сервером с задержкой --latency, курсы ЦБ РФ
+фиксируются, поэтому скрипт работает без сети. Сравниваются два пути:
+локальные таблицы ставок (бензин/дизель/гибрид) и запрос к calcus.ru
+(электромобили) с настройками ограничителя частоты по умолчанию.
+
+Запуск: python scripts/bench_customs_cache.py [--quotes 200] [--latency 0.3]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+import customs  # noqa: E402
+import utils  # noqa: E402
+from standin import Route, StandIn  # noqa: E402
+
+CALCUS_RESPONSE = {
+    "sbor": "4 269.00",
+    "tax": "0.00",
+    "util": "5 200.00",
+    "total": "9 469.00",
+}
+
+# Популярные комбинации: (объём, цена ₩, возраст)
+POPULAR_CARS = [
+    (1598, 15000000, "3-5"),
+    (1999, 22000000, "3-5"),
+    (2199, 35000000, "0-3"),
+    (2497, 28000000, "5-7"),
+    (3342, 45000000, "0-3"),
+]
+
+
+def measure(quotes, engine_type, cold):
+    """Возвращает задержки (мс) для каждой котировки."""
+    if not cold:
+        # Прогрев: по одному расчёту на каждую популярную комбинацию
+        for volume, price, age in POPULAR_CARS:
+            utils.calculate_customs_fees(volume, price, age, engine_type)
+
+    timings = []
+    for number in range(quotes):
+        volume, price, age = POPULAR_CARS[number % len(POPULAR_CARS)]
+        if cold:
+            utils.customs_cache.clear()
+
+        started = time.perf_counter()
+        result = utils.calculate_customs_fees(volume, price, age, engine_type)
+        timings.append((time.perf_counter() - started) * 1000)
+
+        assert result is not None
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+    print(
+        f"{name:<32} n={len(timings):<4} "
+        f"медиана {statistics.median(timings):9.3f} мс   p95 {p95:9.3f} мс"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quotes", type=int, default=200)
+    parser.add_argument("--calcus-quotes", type=int, default=6)
+    parser.add_argument("--latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    # Курсы ЦБ РФ на сегодня — без обращения к сети
+    customs._cbr_rates = {"EUR": 95.0, "KRW": 0.068}
+    customs._cbr_rates_date = datetime.date.today()
+
+    routes = {
+        "/calculate/Customs": Route(json.dumps(CALCUS_RESPONSE), "application/json")
+    }
+    with StandIn(routes, latency=args.latency) as calcus:
+        utils.CALCUS_URL = calcus.url("/calculate/Customs")
+
+        print(f"calcus.ru: локальный сервер, задержка {args.latency * 1000:.0f} мс")
+        report("локальные ставки, холодный", measure(args.quotes, 1, cold=True))
+        report("локальные ставки, тёплый", measure(args.quotes, 1, cold=False))
+        report("calcus.ru, холодный", measure(args.calcus_quotes, 4, cold=True))
+        report("calcus.ru, тёплый", measure(args.quotes, 4, cold=False))
+
+    print(f"Кеш: {utils.customs_cache.stats()}")
+    print(f"Ограничитель calcus.ru: {utils.calcus_rate_limiter.stats()}")
+
+
+if __name__ == "__main__":
+    main()
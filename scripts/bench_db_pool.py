@@ -0,0 +1,117 @@
+"""
+Задержка запроса к Postgres: новое соединение на каждый запрос против пула.
+
+Старые функции database.py открывали psycopg2.connect на каждый вызов,
+теперь соединения берутся из пула через connect_db(). Скрипт меряет
+один запрос и «сообщение» из QUERIES_PER_MESSAGE запросов подряд
+(столько делал calculate_cost до пула), последовательно и из нескольких
+потоков.
+
+Запуск: python scripts/bench_db_pool.py --url postgresql://localhost/bot
+(по умолчанию TEST_DATABASE_URL или DATABASE_URL)
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import psycopg2  # noqa: E402
+
+import database  # noqa: E402
+
+QUERIES_PER_MESSAGE = 4
+QUERY = "SELECT count(*) FROM pg_class WHERE relkind = %s;"
+
+
+def direct_query():
+    """Прежний вариант: своё соединение на каждый запрос."""
+    conn = psycopg2.connect(database.DATABASE_URL)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(QUERY, ("r",))
+            cur.fetchone()
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def pooled_query():
+    with database.connect_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(QUERY, ("r",))
+            cur.fetchone()
+
+
+def message(query):
+    for _ in range(QUERIES_PER_MESSAGE):
+        query()
+
+
+def measure(action, count, threads):
+    """Возвращает задержки (мс) каждого вызова action."""
+
+    def timed(_):
+        started = time.perf_counter()
+        action()
+        return (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(timed, range(count)))
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+    print(
+        f"{name:<36} n={len(timings):<5} "
+        f"медиана {statistics.median(timings):8.2f} мс   p95 {p95:8.2f} мс"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--url", default=os.getenv("TEST_DATABASE_URL") or database.DATABASE_URL
+    )
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    if not args.url:
+        print("Укажите --url, TEST_DATABASE_URL или DATABASE_URL")
+        return 1
+
+    database.DATABASE_URL = args.url
+    # Прогрев: соединения пула и кеш каталога Postgres
+    measure(pooled_query, database.DB_POOL_MAX, database.DB_POOL_MAX)
+    measure(direct_query, 5, 1)
+
+    print(
+        f"Пул: DB_POOL_MIN={database.DB_POOL_MIN}, DB_POOL_MAX={database.DB_POOL_MAX}"
+    )
+    messages = args.queries // QUERIES_PER_MESSAGE
+    for threads in (1, args.threads):
+        suffix = "" if threads == 1 else f", {threads} потоков"
+        report(f"запрос, connect{suffix}", measure(direct_query, args.queries, threads))
+        report(f"запрос, пул{suffix}", measure(pooled_query, args.queries, threads))
+        report(
+            f"сообщение, connect{suffix}",
+            measure(lambda: message(direct_query), messages, threads),
+        )
+        report(
+            f"сообщение, пул{suffix}",
+            measure(lambda: message(pooled_query), messages, threads),
+        )
+
+    database.close_db_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Последовательные расчёты: отдельное соединение на каждый запрос против
+общих keep-alive сессий http_client.
+
+Один расчёт — запросы к трём хостам, как в calculate_cost: объявление
+(api.encar.com), отчёт об осмотре (тот же хост) и таможня (calcus.ru).
+Хосты заменяются локальными серверами; задержка нового соединения
+(--handshake) изображает TCP- и TLS-рукопожатие с удалённым хостом.
+
+Запуск: python scripts/bench_http_pooling.py [--quotes 30] [--handshake 0.1]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+import requests  # noqa: E402
+
+import http_client  # noqa: E402
+from standin import Route, StandIn  # noqa: E402
+
+LISTING = json.dumps({"vehicleId": 38512345, "category": {"manufacturerName": "현대"}})
+CUSTOMS = json.dumps({"sbor": "4 269.00", "tax": "0.00", "util": "5 200.00"})
+
+
+def quote_without_pooling(listing_host, calcus_host):
+    """Прежний вариант: голые requests.get/post без сессии."""
+    requests.get(listing_host.url("/v1/readside/vehicle/38512345")).json()
+    requests.get(listing_host.url("/v1/readside/inspection/vehicle/38512345")).json()
+    requests.post(calcus_host.url("/calculate/Customs"), data={"age": "3-5"}).json()
+
+
+def quote_with_pooling(listing_host, calcus_host):
+    http_client.get(listing_host.url("/v1/readside/vehicle/38512345")).json()
+    http_client.get(listing_host.url("/v1/readside/inspection/vehicle/38512345")).json()
+    http_client.post(calcus_host.url("/calculate/Customs"), data={"age": "3-5"}).json()
+
+
+def run(name, quotes, hosts, quote):
+    connections = sum(host.connections for host in hosts)
+    timings = []
+
+    for _ in range(quotes):
+        started = time.perf_counter()
+        quote(*hosts)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    print(
+        f"{name:<24} медиана {statistics.median(timings):7.1f} мс на расчёт   "
+        f"всего {sum(timings):8.1f} мс   "
+        f"TCP-соединений {sum(host.connections for host in hosts) - connections}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quotes", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--handshake", type=float, default=0.1)
+    args = parser.parse_args()
+
+    listing_routes = {
+        "/v1/readside/vehicle/38512345": Route(LISTING, "application/json"),
+        "/v1/readside/inspection/vehicle/38512345": Route(LISTING, "application/json"),
+    }
+    calcus_routes = {"/calculate/Customs": Route(CUSTOMS, "application/json")}
+
+    with StandIn(listing_routes, args.latency, args.handshake) as listing_host:
+        with StandIn(calcus_routes, args.latency, args.handshake) as calcus_host:
+            hosts = (listing_host, calcus_host)
+            print(
+                f"{args.quotes} расчётов подряд, ответ {args.latency * 1000:.0f} мс, "
+                f"новое соединение {args.handshake * 1000:.0f} мс"
+            )
+            run("без пула", args.quotes, hosts, quote_without_pooling)
+            run("http_client", args.quotes, hosts, quote_with_pooling)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Время и память разбора сохранённых страниц объявлений: весь DOM против
+точечного извлечения из parsers.py.
+
+Прежний вариант строил BeautifulSoup по всей странице (KBChaCha —
+html.parser, Chutcha — lxml) и искал в нём скрипт с JSON и таблицу.
+Страницы берутся из tests/fixtures/listings.
+
+Запуск: python scripts/bench_parsers.py [--rounds 50]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import parsers  # noqa: E402
+
+FIXTURES = os.path.join(ROOT, "tests", "fixtures", "listings")
+
+
+def old_kbchacha(html):
+    """Разбор KBChaCha до user-021: дерево всей страницы."""
+    soup = BeautifulSoup(html, "html.parser")
+    json_text = soup.find("script", {"type": "application/ld+json"}).text.strip()
+    table = soup.find("table", {"class": "detail-info-table"})
+    fields = {}
+    for row in table.find_all("tr"):
+        for th, td in zip(row.find_all("th"), row.find_all("td")):
+            fields[th.text.strip()] = td.text.strip()
+    return json_text, fields
+
+
+def new_kbchacha(html):
+    json_text = parsers.extract_ld_json(html)
+    return json_text, parsers.extract_table_fields(html, "detail-info-table")
+
+
+def old_chutcha(html):
+    """Разбор Chutcha до user-021: дерево всей страницы."""
+    soup = BeautifulSoup(html, "lxml")
+    return soup.find("script", {"type": "application/json"}).string
+
+
+def new_chutcha(html):
+    return parsers.extract_next_data(html)
+
+
+def measure(action, html, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        result = action(html)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    action(html)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(timings), peak, result
+
+
+def compare(name, filename, old, new, rounds):
+    with open(os.path.join(FIXTURES, filename), encoding="utf-8") as f:
+        html = f.read()
+
+    old_ms, old_peak, old_result = measure(old, html, rounds)
+    new_ms, new_peak, new_result = measure(new, html, rounds)
+    # Оба варианта должны извлекать одно и то же
+    assert old_result == new_result
+
+    print(
+        f"{name:<10} {len(html.encode()) // 1024:>4} КБ   "
+        f"DOM {old_ms:7.2f} мс {old_peak / 2**20:6.1f} МБ   "
+        f"точечно {new_ms:6.2f} мс {new_peak / 2**20:5.2f} МБ   "
+        f"×{old_ms / new_ms:.0f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"Медиана из {args.rounds} разборов, пик памяти по tracemalloc")
+    compare(
+        "KBChaCha", "kbchacha_26912345.html", old_kbchacha, new_kbchacha, args.rounds
+    )
+    compare("Chutcha", "chutcha_B12345678.html", old_chutcha, new_chutcha, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Загрузка альбома из 10 фото (~300 КБ): последовательный requests.get
+против PhotoAlbum (общие keep-alive сессии, параллельная загрузка).
+
+CDN заменяется локальным сервером с задержкой ответа --latency.
+Уменьшение фото отключено, чтобы мерить только загрузку.
+
+Запуск: python scripts/bench_photo_download.py [--rounds 5] [--latency 0.05]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+import requests  # noqa: E402
+
+import photos  # noqa: E402
+from standin import Route, StandIn, make_jpeg  # noqa: E402
+
+PHOTO_COUNT = 10
+
+
+def sequential_album(urls):
+    """Прежний вариант: по одному requests.get без сессии и таймаута."""
+    buffers = []
+    for url in urls:
+        response = requests.get(url)
+        buffers.append(BytesIO(response.content))
+    return buffers
+
+
+def pooled_album(urls, executor):
+    album = photos.PhotoAlbum(urls, executor)
+    try:
+        return album.media()
+    finally:
+        album.close()
+
+
+def run(name, rounds, server, album):
+    timings = []
+    connections = server.connections
+    for _ in range(rounds):
+        started = time.perf_counter()
+        result = album()
+        timings.append((time.perf_counter() - started) * 1000)
+        assert len(result) == PHOTO_COUNT
+
+    print(
+        f"{name:<28} медиана {statistics.median(timings):8.1f} мс   "
+        f"мин {min(timings):8.1f} мс   "
+        f"TCP-соединений {server.connections - connections:3d} за {rounds} альбомов"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    # Только загрузка: без уменьшения фото и без file_id из БД
+    photos.PHOTO_RESIZE = False
+    photos.get_photo_file_ids = lambda urls: {}
+
+    jpegs = [make_jpeg(660, 480, seed=number) for number in range(PHOTO_COUNT)]
+    routes = {
+        f"/carpicture/{number}.jpg": Route(jpeg, "image/jpeg")
+        for number, jpeg in enumerate(jpegs)
+    }
+    average_kb = statistics.mean(len(jpeg) for jpeg in jpegs) / 1024
+
+    with StandIn(routes, latency=args.latency) as server:
+        urls = [server.url(path) for path in routes]
+        print(
+            f"{PHOTO_COUNT} фото по ~{average_kb:.0f} КБ, "
+            f"задержка сервера {args.latency * 1000:.0f} мс"
+        )
+
+        run("последовательно", args.rounds, server, lambda: sequential_album(urls))
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            run(
+                "PhotoAlbum",
+                args.rounds,
+                server,
+                lambda: pooled_album(urls, executor),
+            )
+
+
+if __name__ == "__main__":
+    main()
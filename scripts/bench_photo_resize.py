@@ -0,0 +1,111 @@
+"""
+Уменьшение фото перед отправкой: байты с площадки против байтов в Telegram.
+
+Альбом из 10 полноразмерных фото (как оригиналы Encar и _ori.jpg Чутчи)
+отдаётся локальным сервером и загружается через PhotoAlbum с уменьшением
+и без него. Проверяются два вида изображений: плавные (ближе к настоящим
+фото) и шум (худший случай для JPEG).
+
+Запуск: python scripts/bench_photo_resize.py [--rounds 3] [--width 1920]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+from PIL import Image  # noqa: E402
+
+import photos  # noqa: E402
+from standin import Route, StandIn, make_jpeg  # noqa: E402
+
+PHOTO_COUNT = 10
+# Разных изображений меньше, чем фото в альбоме: генерация шума небыстрая
+DISTINCT_PHOTOS = 3
+
+
+def make_smooth_jpeg(width, height, seed=0):
+    """Шум в 1/16 разрешения, растянутый до полного — плавные переходы."""
+    small = make_jpeg(width // 16, height // 16, seed=seed)
+    with Image.open(BytesIO(small)) as image:
+        image = image.resize((width, height), Image.BICUBIC)
+        output = BytesIO()
+        image.save(output, "JPEG", quality=92)
+    return output.getvalue()
+
+
+def run(name, rounds, urls, executor, resize):
+    photos.PHOTO_RESIZE = resize
+    timings = []
+
+    for _ in range(rounds):
+        album = photos.PhotoAlbum(urls, executor)
+        started = time.perf_counter()
+        try:
+            media = album.media()
+        finally:
+            album.close()
+        timings.append((time.perf_counter() - started) * 1000)
+        assert len(media) == PHOTO_COUNT
+
+    saved = 100 * (1 - album.bytes_out / album.bytes_in)
+    print(
+        f"{name:<34} медиана {statistics.median(timings):7.1f} мс   "
+        f"с площадки {album.bytes_in / 1024:7.0f} КБ   "
+        f"в Telegram {album.bytes_out / 1024:7.0f} КБ   "
+        f"экономия {saved:4.0f}%"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1440)
+    args = parser.parse_args()
+
+    if photos.Image is None:
+        print("Pillow не установлен — уменьшение фото недоступно")
+        return
+
+    # Только загрузка и обработка, без file_id из БД
+    photos.get_photo_file_ids = lambda urls: {}
+
+    # (название, путь на сервере, функция генерации)
+    kinds = [
+        ("плавные", "smooth", make_smooth_jpeg),
+        ("шум", "noise", make_jpeg),
+    ]
+
+    print(
+        f"{PHOTO_COUNT} фото {args.width}×{args.height}, "
+        f"уменьшение до {photos.PHOTO_MAX_SIDE}px, качество {photos.PHOTO_JPEG_QUALITY}"
+    )
+
+    with ThreadPoolExecutor(max_workers=photos.PHOTO_PARALLELISM) as executor:
+        for name, kind, make in kinds:
+            jpegs = [
+                make(args.width, args.height, seed=number)
+                for number in range(DISTINCT_PHOTOS)
+            ]
+            routes = {
+                f"/{kind}/{number}.jpg": Route(jpegs[number % len(jpegs)], "image/jpeg")
+                for number in range(PHOTO_COUNT)
+            }
+            with StandIn(routes) as server:
+                urls = [server.url(path) for path in routes]
+                run(f"{name}, как есть", args.rounds, urls, executor, resize=False)
+                run(f"{name}, уменьшение", args.rounds, urls, executor, resize=True)
+
+    print(f"Пик буферов фото: {photos.photo_buffers.stats()['peak'] / 1024:.0f} КБ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Время выборки списков пользователей: коррелированные подзапросы против JOIN.
+
+Сравнивает прежние запросы get_all_users и get_all_bot_users (по подзапросу
+на каждую строку) с текущими функциями database.py. Базу удобно заполнить
+scripts/generate_synthetic_data.py.
+
+Запуск: python scripts/bench_user_listings.py --url postgresql://localhost/bot_bench
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+
+# Запросы до перехода на JOIN
+OLD_GET_ALL_USERS = """
+    SELECT DISTINCT ON (user_id) user_id, user_name, phone_number,
+           (SELECT count FROM calculations WHERE calculations.user_id = orders.user_id) as calc_count,
+           (SELECT status FROM subscriptions WHERE subscriptions.user_id = orders.user_id) as subscription,
+           (SELECT created_at FROM orders o WHERE o.user_id = orders.user_id ORDER BY id ASC LIMIT 1) as first_activity
+    FROM orders
+    ORDER BY user_id, id ASC
+"""
+OLD_GET_ALL_BOT_USERS = """
+    SELECT user_id, username, first_name, last_name, phone_number, created_at, last_activity,
+           (SELECT count FROM calculations WHERE calculations.user_id = users.user_id) as calc_count,
+           (SELECT status FROM subscriptions WHERE subscriptions.user_id = users.user_id) as subscription
+    FROM users
+    ORDER BY created_at DESC
+"""
+
+
+def old_query(query):
+    def run():
+        with database.connect_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query)
+                return cur.fetchall()
+
+    return run
+
+
+def measure(action, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        rows = action()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings, rows
+
+
+def compare(name, old, new, rounds):
+    old_timings, old_rows = measure(old, rounds)
+    new_timings, new_rows = measure(new, rounds)
+    # Новый запрос должен возвращать те же строки
+    assert len(old_rows) == len(new_rows)
+
+    old_median = statistics.median(old_timings)
+    new_median = statistics.median(new_timings)
+    print(
+        f"{name:<20} строк {len(new_rows):<7} "
+        f"подзапросы {old_median:9.1f} мс   JOIN {new_median:9.1f} мс   "
+        f"×{old_median / new_median:.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    database.DATABASE_URL = args.url
+    with database.connect_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT (SELECT count(*) FROM users) AS users, "
+                "(SELECT count(*) FROM orders) AS orders;"
+            )
+            sizes = cur.fetchone()
+    print(f"В базе {sizes['users']} пользователей и {sizes['orders']} заказов")
+
+    compare(
+        "get_all_users",
+        old_query(OLD_GET_ALL_USERS),
+        database.get_all_users,
+        args.rounds,
+    )
+    compare(
+        "get_all_bot_users",
+        old_query(OLD_GET_ALL_BOT_USERS),
+        database.get_all_bot_users,
+        args.rounds,
+    )
+    database.close_db_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Заполняет базу синтетическими пользователями, расчётами, подписками и заказами.
+
+Нужен для замеров запросов на объёме, близком к боевому (по умолчанию
+100 000 пользователей и 500 000 заказов). Синтетические user_id начинаются
+с SYNTHETIC_USER_ID_START, поэтому не пересекаются с настоящими и удаляются
+флагом --clean. Перед загрузкой применяются миграции.
+
+Запуск: python scripts/generate_synthetic_data.py --url postgresql://localhost/bot_bench
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+
+SYNTHETIC_USER_ID_START = 10**12
+STATUSES = (
+    "🔄 Не заказано",
+    "🕒 Ожидает подтверждения",
+    "🚗 Авто выкуплен",
+    "🚢 Отправлен в Россию",
+    "🛃 На таможне",
+    "📦 Доставлено клиенту",
+)
+
+
+def clean(cur):
+    for table in ("orders", "calculations", "subscriptions", "users"):
+        cur.execute(
+            f"DELETE FROM {table} WHERE user_id >= %s;", (SYNTHETIC_USER_ID_START,)
+        )
+
+
+def generate(cur, users, orders, subscribed):
+    params = {
+        "start": SYNTHETIC_USER_ID_START,
+        "users": users,
+        "orders": orders,
+        "subscribed": subscribed,
+        "statuses": list(STATUSES),
+    }
+
+    cur.execute(
+        """
+        INSERT INTO users (user_id, username, first_name, last_name,
+                           phone_number, created_at, last_activity)
+        SELECT %(start)s + n,
+               'user' || n,
+               'Имя ' || n,
+               'Фамилия ' || n,
+               CASE WHEN n %% 3 = 0 THEN '+7999' || lpad(n::TEXT, 7, '0') END,
+               NOW() - random() * INTERVAL '365 days',
+               NOW() - random() * INTERVAL '30 days'
+        FROM generate_series(0, %(users)s - 1) AS n;
+        """,
+        params,
+    )
+    cur.execute(
+        """
+        INSERT INTO calculations (user_id, count)
+        SELECT %(start)s + n, 1 + (random() * 20)::INT
+        FROM generate_series(0, %(users)s - 1) AS n
+        WHERE random() < 0.8;
+        """,
+        params,
+    )
+    cur.execute(
+        """
+        INSERT INTO subscriptions (user_id, status)
+        SELECT %(start)s + n, random() < %(subscribed)s
+        FROM generate_series(0, %(users)s - 1) AS n
+        WHERE random() < 0.3;
+        """,
+        params,
+    )
+    # Большинство заказов — избранное в статусе по умолчанию
+    cur.execute(
+        """
+        INSERT INTO orders (user_id, car_id, title, price, link, year, month,
+                            mileage, engine_volume, transmission, user_name,
+                            phone_number, status, total_cost_usd,
+                            total_cost_krw, total_cost_rub, created_at)
+        SELECT %(start)s + (random() * (%(users)s - 1))::BIGINT,
+               n::TEXT,
+               'Hyundai Sonata ' || n,
+               '25000000',
+               'https://fem.encar.com/cars/detail/' || n,
+               '2021',
+               '05',
+               '45 000 km',
+               1999,
+               'Автомат',
+               'user' || n,
+               NULL,
+               CASE WHEN random() < 0.9 THEN (%(statuses)s)[1]
+                    ELSE (%(statuses)s)[2 + (random() * 4)::INT] END,
+               18500,
+               25000000,
+               1650000,
+               NOW() - random() * INTERVAL '365 days'
+        FROM generate_series(1, %(orders)s) AS n;
+        """,
+        params,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    # URL обязателен: случайно заполнить боевую базу из DATABASE_URL нельзя
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--orders", type=int, default=500_000)
+    parser.add_argument("--subscribed", type=float, default=0.5)
+    parser.add_argument(
+        "--clean", action="store_true", help="только удалить синтетические данные"
+    )
+    args = parser.parse_args()
+
+    database.DATABASE_URL = args.url
+    database.run_migrations()
+
+    started = time.perf_counter()
+    with database.connect_db() as conn:
+        with conn.cursor() as cur:
+            clean(cur)
+            if not args.clean:
+                generate(cur, args.users, args.orders, args.subscribed)
+            cur.execute("ANALYZE users, orders, calculations, subscriptions;")
+
+    if args.clean:
+        print("Синтетические данные удалены")
+    else:
+        print(
+            f"Загружено {args.users} пользователей и {args.orders} заказов "
+            f"за {time.perf_counter() - started:.1f} с"
+        )
+    database.close_db_pool()
+
+
+if __name__ == "__main__":
+    main()
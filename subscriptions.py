@@ -0,0 +1,83 @@
+import os
+import threading
+
+from utils import TTLCache
+
+# Положительный результат проверки подписки живёт долго, отрицательный — недолго,
+# чтобы только что подписавшийся пользователь быстро получил доступ
+SUBSCRIPTION_CACHE_SIZE = int(os.getenv("SUBSCRIPTION_CACHE_SIZE", "10000"))
+SUBSCRIPTION_POSITIVE_TTL = int(os.getenv("SUBSCRIPTION_POSITIVE_TTL", "21600"))
+SUBSCRIPTION_NEGATIVE_TTL = int(os.getenv("SUBSCRIPTION_NEGATIVE_TTL", "60"))
+
+
+class SubscriptionCache:
+    """
+    Кеш результатов проверки подписки на канал.
+
+    Хранилища positive и negative должны поддерживать get/set/pop, как TTLCache.
+    По умолчанию используются кеши в памяти процесса; для нескольких экземпляров
+    бота их можно заменить общим хранилищем.
+    """
+
+    def __init__(self, checker, positive=None, negative=None):
+        """
+        :param checker: Функция user_id → bool, проверяющая подписку через Telegram
+        :param positive: Хранилище подписанных пользователей
+        :param negative: Хранилище неподписанных пользователей
+        """
+        self.checker = checker
+        self.positive = positive or TTLCache(
+            maxsize=SUBSCRIPTION_CACHE_SIZE, ttl=SUBSCRIPTION_POSITIVE_TTL
+        )
+        self.negative = negative or TTLCache(
+            maxsize=SUBSCRIPTION_CACHE_SIZE, ttl=SUBSCRIPTION_NEGATIVE_TTL
+        )
+        self.api_calls = 0
+        self.api_calls_saved = 0
+        self._lock = threading.Lock()
+
+    def is_subscribed(self, user_id):
+        """Проверяет подписку, обращаясь к Telegram только при промахе кеша."""
+        if self.positive.get(user_id):
+            self._count("api_calls_saved")
+            return True
+        if self.negative.get(user_id):
+            self._count("api_calls_saved")
+            return False
+
+        self._count("api_calls")
+        subscribed = bool(self.checker(user_id))
+        self.set(user_id, subscribed)
+        return subscribed
+
+    def set(self, user_id, subscribed):
+        """Запоминает известный результат проверки подписки."""
+        self.invalidate(user_id)
+        (self.positive if subscribed else self.negative).set(user_id, True)
+
+    def invalidate(self, user_id):
+        self.positive.pop(user_id)
+        self.negative.pop(user_id)
+
+    def stats(self):
+        with self._lock:
+            api_calls = self.api_calls
+            saved = self.api_calls_saved
+        total = api_calls + saved
+        return {
+            "api_calls": api_calls,
+            "api_calls_saved": saved,
+            "hit_ratio": saved / total if total else 0.0,
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        print(
+            f"Кеш подписок: запросов к Telegram {stats['api_calls']}, "
+            f"сэкономлено {stats['api_calls_saved']} "
+            f"({stats['hit_ratio']:.0%} попаданий)"
+        )
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
@@ -0,0 +1,75 @@
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from telebot import apihelper
+
+# Размер пула keep-alive соединений с api.telegram.org
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "16"))
+# Сколько раз повторять запрос, получивший 429 Too Many Requests
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+# Дольше этого (секунды) не ждём — отдаём ошибку вызывающему коду
+TELEGRAM_MAX_RETRY_AFTER = int(os.getenv("TELEGRAM_MAX_RETRY_AFTER", "30"))
+
+_session = None
+
+
+def get_session():
+    """Общая сессия для всех запросов к Telegram Bot API."""
+    global _session
+
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=TELEGRAM_POOL_SIZE, pool_block=True
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+    return _session
+
+
+def _rewind_files(files):
+    """Перематывает отправляемые файлы в начало перед повтором запроса."""
+    for value in (files or {}).values():
+        file = value[1] if isinstance(value, tuple) else value
+        if hasattr(file, "seek"):
+            file.seek(0)
+
+
+def _retry_after(response, attempt):
+    """Возвращает паузу перед повтором из ответа Telegram (parameters.retry_after)."""
+    try:
+        return int(response.json()["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        return 2**attempt
+
+
+def send_request(method, url, **kwargs):
+    """
+    Отправляет запрос к Bot API через общую сессию.
+    При ответе 429 ждёт указанное Telegram время и повторяет запрос.
+    """
+    session = get_session()
+
+    for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+        response = session.request(method, url, **kwargs)
+        if response.status_code != 429 or attempt == TELEGRAM_MAX_RETRIES:
+            return response
+
+        retry_after = _retry_after(response, attempt)
+        if retry_after > TELEGRAM_MAX_RETRY_AFTER:
+            return response
+
+        print(f"⏳ Telegram: слишком много запросов, повтор через {retry_after} с")
+        time.sleep(retry_after)
+        _rewind_files(kwargs.get("files"))
+
+    return response
+
+
+def setup_telegram_client():
+    """Направляет все запросы pyTelegramBotAPI через общую сессию с повторами."""
+    apihelper.session = get_session()
+    apihelper.CUSTOM_REQUEST_SENDER = send_request
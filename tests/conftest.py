@@ -0,0 +1,56 @@
+import os
+import uuid
+from urllib.parse import urlsplit, urlunsplit
+
+import psycopg2
+import pytest
+
+import database
+
+# Сервер Postgres для тестов с БД, например postgresql://postgres@localhost/postgres.
+# На нём создаётся и после тестов удаляется временная база.
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+TABLES = ("users", "orders", "calculations", "subscriptions", "photo_file_ids")
+
+
+def _admin_execute(query):
+    conn = psycopg2.connect(TEST_DATABASE_URL)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query)
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope="session")
+def database_url():
+    """Временная база с применёнными миграциями."""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL не задан")
+
+    name = f"bot_test_{uuid.uuid4().hex[:8]}"
+    _admin_execute(f"CREATE DATABASE {name};")
+    url = urlunsplit(urlsplit(TEST_DATABASE_URL)._replace(path=f"/{name}"))
+
+    previous_url = database.DATABASE_URL
+    database.DATABASE_URL = url
+    database._pool = None
+    try:
+        database.run_migrations()
+        yield url
+    finally:
+        database.close_db_pool()
+        database._pool = None
+        database.DATABASE_URL = previous_url
+        _admin_execute(f"DROP DATABASE IF EXISTS {name} WITH (FORCE);")
+
+
+@pytest.fixture
+def db(database_url):
+    """Пустые таблицы перед каждым тестом."""
+    with database.connect_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY;")
+    return database
@@ -0,0 +1,136 @@
+"""
+Локальный HTTP-сервер вместо площадок, calcus.ru и CDN с фотографиями.
+
+Используется тестами и скриптами в scripts/: отвечает заранее заданными
+ответами, умеет добавлять задержку и считает запросы и TCP-соединения.
+"""
+
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+
+class Route:
+    """Ответ на один путь: статус, тип содержимого, тело и другие заголовки."""
+
+    def __init__(
+        self, body, content_type="text/html; charset=utf-8", status=200, headers=None
+    ):
+        self.body = body if isinstance(body, bytes) else body.encode("utf-8")
+        self.content_type = content_type
+        self.status = status
+        self.headers = dict(headers or {})  # Например, Location для редиректа
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Клиент оборвал соединение (например, прервал загрузку большого фото)
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class StandIn:
+    """
+    Пример:
+        with StandIn({"/vehicle/1": Route(json_text, "application/json")}) as server:
+            requests.get(server.url("/vehicle/1"))
+    """
+
+    def __init__(self, routes=None, latency=0.0, handshake=0.0):
+        self.routes = dict(routes or {})
+        self.latency = latency  # Задержка ответа, секунды
+        # Задержка нового соединения — замена TCP- и TLS-рукопожатия, секунды
+        self.handshake = handshake
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def url(self, path="/"):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    def start(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1, чтобы клиенты могли держать keep-alive соединения
+            protocol_version = "HTTP/1.1"
+            # Заголовки и тело уходят разными send(): без TCP_NODELAY на
+            # keep-alive соединении каждый ответ ждал бы отложенного ACK (~40 мс)
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with standin._lock:
+                    standin.connections += 1
+                if standin.handshake:
+                    time.sleep(standin.handshake)
+
+            def do_GET(self):
+                self._respond()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                self._respond()
+
+            def _respond(self):
+                with standin._lock:
+                    standin.requests += 1
+
+                if standin.latency:
+                    time.sleep(standin.latency)
+
+                route = standin.routes.get(self.path.split("?")[0])
+                if route is None:
+                    route = Route("not found", "text/plain", status=404)
+
+                self.send_response(route.status)
+                self.send_header("Content-Type", route.content_type)
+                self.send_header("Content-Length", str(len(route.body)))
+                for name, value in route.headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(route.body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = _Server(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def make_jpeg(width, height, quality=90, seed=0):
+    """
+    JPEG с шумом — сжимается плохо, как настоящие фото авто.
+    Размер файла: примерно 1 байт на пиксель при quality=90.
+    """
+    from PIL import Image
+
+    rng = random.Random(seed)
+    pixels = bytes(rng.getrandbits(8) for _ in range(width * height * 3))
+    image = Image.frombytes("RGB", (width, height), pixels)
+
+    output = BytesIO()
+    image.save(output, "JPEG", quality=quality)
+    return output.getvalue()
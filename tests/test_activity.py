@@ -0,0 +1,101 @@
+import threading
+
+from activity import ActivityBuffer
+
+
+class FakeWriter:
+    """Запоминает пачки вместо записи в БД; может падать заданное число раз."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    def __call__(self, users):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("БД недоступна")
+        self.batches.append(users)
+
+
+def user(user_id, **fields):
+    return {"user_id": user_id, "username": f"user{user_id}", **fields}
+
+
+def test_messages_of_one_user_are_coalesced():
+    writer = FakeWriter()
+    buffer = ActivityBuffer(flush_size=100, writer=writer)
+
+    buffer.record(user(1, phone_number="+79990000000"))
+    buffer.record(user(1, username="renamed"))
+    buffer.record(user(2))
+
+    assert len(buffer) == 2
+    assert buffer.flush() == 2
+
+    (batch,) = writer.batches
+    first = next(entry for entry in batch if entry["user_id"] == 1)
+    assert first["username"] == "renamed"
+    # Телефон из предыдущего сообщения не теряется
+    assert first["phone_number"] == "+79990000000"
+    assert "last_activity" in first
+    assert len(buffer) == 0
+
+
+def test_full_buffer_is_flushed_without_timer():
+    writer = FakeWriter()
+    buffer = ActivityBuffer(flush_size=3, writer=writer)
+
+    for user_id in range(3):
+        buffer.record(user(user_id))
+
+    assert [len(batch) for batch in writer.batches] == [3]
+    assert len(buffer) == 0
+
+
+def test_failed_write_is_requeued():
+    writer = FakeWriter(failures=1)
+    buffer = ActivityBuffer(flush_size=100, writer=writer)
+
+    buffer.record(user(1, username="old"))
+    buffer.record(user(2))
+
+    assert buffer.flush() == 0
+    assert writer.batches == []
+    assert len(buffer) == 2
+
+    # Данные, пришедшие после неудачной записи, свежее возвращённых в буфер
+    buffer.record(user(1, username="new"))
+
+    assert buffer.flush() == 2
+    (batch,) = writer.batches
+    assert {entry["user_id"]: entry["username"] for entry in batch} == {
+        1: "new",
+        2: "user2",
+    }
+
+
+def test_concurrent_flush_does_not_wait_or_duplicate():
+    started = threading.Event()
+    release = threading.Event()
+    batches = []
+
+    def slow_writer(users):
+        batches.append(users)
+        started.set()
+        release.wait(5)
+
+    buffer = ActivityBuffer(flush_size=100, writer=slow_writer)
+    buffer.record(user(1))
+
+    flusher = threading.Thread(target=buffer.flush)
+    flusher.start()
+    assert started.wait(5)
+
+    # Сброс по размеру буфера не ждёт уже идущий сброс
+    buffer.record(user(2))
+    assert buffer.flush(wait=False) == 0
+
+    release.set()
+    flusher.join(5)
+    assert buffer.flush() == 1
+    assert [[entry["user_id"] for entry in batch] for batch in batches] == [[1], [2]]
@@ -0,0 +1,51 @@
+import asyncio
+
+from async_bot import in_chat_order
+
+
+def test_updates_of_one_chat_keep_their_order():
+    handled = []
+
+    async def update(chat_id, name, delay):
+        async def handle():
+            # Сообщение со ссылкой дольше ждёт загрузки объявления
+            await asyncio.sleep(delay)
+            handled.append(name)
+
+        await in_chat_order(tails, chat_id, handle)
+
+    async def main():
+        await asyncio.gather(
+            update(1, "ссылка", 0.05),
+            update(1, "ответ", 0),
+            update(2, "другой чат", 0),
+        )
+
+    tails = {}
+    asyncio.run(main())
+
+    assert handled == ["другой чат", "ссылка", "ответ"]
+    assert tails == {}
+
+
+def test_failed_update_does_not_block_the_chat():
+    handled = []
+
+    async def fail():
+        raise RuntimeError("ошибка обработчика")
+
+    async def handle():
+        handled.append("ответ")
+
+    async def main():
+        return await asyncio.gather(
+            in_chat_order(tails, 1, fail),
+            in_chat_order(tails, 1, handle),
+            return_exceptions=True,
+        )
+
+    tails = {}
+    results = asyncio.run(main())
+
+    assert isinstance(results[0], RuntimeError)
+    assert handled == ["ответ"]
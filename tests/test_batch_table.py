@@ -0,0 +1,66 @@
+import pytest
+
+from parsers import Listing
+from utils import display_width, fit_width, format_batch_table
+
+
+def listing(title, car_id):
+    return Listing(
+        source="encar",
+        car_id=car_id,
+        url=f"https://fem.encar.com/cars/detail/{car_id}",
+        title=title,
+        price_krw=21_500_000,
+        year=2021,
+        month=5,
+        engine_volume=1999,
+        mileage_km=45123,
+        transmission="Автомат",
+        photo_urls=(),
+    )
+
+
+@pytest.mark.parametrize(
+    "text, width",
+    [
+        ("Sonata", 6),
+        ("Автомобиль", 10),
+        ("기아 K5", 7),  # Слоги хангыля занимают по две позиции
+        ("제네시스", 8),
+        ("", 0),
+    ],
+)
+def test_display_width(text, width):
+    assert display_width(text) == width
+
+
+@pytest.mark.parametrize(
+    "text, width, expected",
+    [
+        ("K5", 5, "K5   "),
+        ("Hyundai Sonata", 8, "Hyundai…"),
+        ("기아 K5", 7, "기아 K5"),
+        # Широкий символ не помещается целиком — вместо него пробел
+        ("제네시스 G80", 6, "제네… "),
+        ("제네시스 G80", 7, "제네시…"),
+    ],
+)
+def test_fit_width(text, width, expected):
+    fitted = fit_width(text, width)
+    assert fitted == expected
+    assert display_width(fitted) == width
+
+
+def test_batch_table_rows_are_aligned():
+    quotes = [
+        (listing("Hyundai Sonata Premium", "38512345"), 2_345_678),
+        (listing("제네시스 G80 (RG3) 2.5 가솔린 터보 AWD", "38512346"), 6_543_210),
+    ]
+
+    text = format_batch_table(quotes)
+    table = text.split("<pre>")[1].split("</pre>")[0].split("\n")
+
+    assert len(table) == 3
+    assert len({display_width(row) for row in table}) == 1
+    assert "제네시스 G80 (RG3) 2.5 …" in table[2]
+    assert "<a href='https://fem.encar.com/cars/detail/38512346'>" in text
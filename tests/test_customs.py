@@ -0,0 +1,145 @@
+import datetime
+import threading
+
+import pytest
+import requests
+
+import customs
+import utils
+from customs import calculate_customs
+
+# Курсы, при которых границы таблиц считаются без погрешности:
+# 1 ₩ = 0.5 ₽, 1 € = 128 ₽ → 8 500 € = 2 176 000 ₩
+RATES = {"EUR": 128.0, "KRW": 0.5}
+ON_DATE = datetime.date(2025, 6, 1)
+
+
+def amount(value):
+    return float(value.replace(" ", ""))
+
+
+@pytest.mark.parametrize(
+    "age, volume, price_krw, sbor, tax, util",
+    [
+        # Сбор за оформление: граница 200 000 ₽
+        ("3-5", 1000, 400000, 1067, 192000, 5200),
+        ("3-5", 1000, 400001, 2134, 192000, 5200),
+        # До 3 лет: граница 8 500 €, пошлина — максимум из % и минимума за см³
+        ("0-3", 2000, 2176000, 4269, 640000, 3400),
+        ("0-3", 2000, 2176002, 4269, 896000, 3400),
+        ("0-3", 1000, 2176000, 4269, 587520, 3400),
+        # 3–5 лет: граница объёма 1 500 см³
+        ("3-5", 1500, 10000000, 21344, 326400, 5200),
+        ("3-5", 1501, 10000000, 21344, 480320, 5200),
+        # Старше 5 лет: граница объёма 3 000 см³
+        ("5-7", 3000, 10000000, 21344, 1920000, 5200),
+        ("7-0", 3001, 10000000, 21344, 2189529.6, 3296800),
+        # Утилизационный сбор: границы 3 000 и 3 500 см³
+        ("0-3", 3001, 2176000, 4269, 960320, 2153400),
+        ("7-0", 3500, 10000000, 21344, 2553600, 3296800),
+        ("7-0", 3501, 10000000, 21344, 2554329.6, 3604800),
+    ],
+)
+def test_bracket_boundaries(age, volume, price_krw, sbor, tax, util):
+    result = calculate_customs(volume, price_krw, age, rates=RATES, on_date=ON_DATE)
+
+    assert amount(result["sbor"]) == pytest.approx(sbor, abs=0.01)
+    assert amount(result["tax"]) == pytest.approx(tax, abs=0.01)
+    assert amount(result["util"]) == pytest.approx(util, abs=0.01)
+    assert amount(result["total"]) == pytest.approx(sbor + tax + util, abs=0.01)
+
+
+def test_result_has_calcus_shape():
+    result = calculate_customs(1598, 15000000, "3-5", rates=RATES, on_date=ON_DATE)
+
+    assert result == {
+        "sbor": "30 000.00",
+        "tax": "511 360.00",
+        "util": "5 200.00",
+        "total": "546 560.00",
+        "rates_version": "2025-01",
+    }
+
+
+def test_electric_cars_are_left_to_calcus():
+    assert calculate_customs(0, 30000000, "0-3", engine_type=4, rates=RATES) is None
+
+
+def test_customs_cache_keys_on_exact_price(monkeypatch):
+    # Курсы ЦБ РФ на сегодня, чтобы расчёт не обращался к сети
+    monkeypatch.setattr(customs, "_cbr_rates", RATES)
+    monkeypatch.setattr(customs, "_cbr_rates_date", datetime.date.today())
+    utils.customs_cache.clear()
+
+    # По обе стороны границы 8 500 € — разная пошлина
+    below = utils.calculate_customs_fees(2000, 2176000, "0-3")
+    above = utils.calculate_customs_fees(2000, 2176002, "0-3")
+
+    assert amount(below["tax"]) == pytest.approx(640000)
+    assert amount(above["tax"]) == pytest.approx(896000)
+    assert utils.calculate_customs_fees(2000, 2176000, "0-3") is below
+
+
+@pytest.fixture
+def cbr_state(monkeypatch):
+    monkeypatch.setattr(customs, "_cbr_rates", {})
+    monkeypatch.setattr(customs, "_cbr_rates_date", None)
+    monkeypatch.setattr(customs, "_cbr_failed_at", None)
+    monkeypatch.setattr(customs, "_cbr_refreshing", False)
+
+
+def test_cbr_failure_is_not_retried_immediately(cbr_state, monkeypatch):
+    calls = []
+
+    def failing_get(url, **kwargs):
+        calls.append(url)
+        raise requests.ConnectionError("ЦБ РФ недоступен")
+
+    monkeypatch.setattr(customs.http_client, "get", failing_get)
+
+    assert customs.get_cbr_rates() is None
+    assert customs.get_cbr_rates() is None
+    assert len(calls) == 1
+
+    monkeypatch.setattr(customs, "CBR_RETRY_INTERVAL", 0)
+    customs.get_cbr_rates()
+    assert len(calls) == 2
+
+
+def test_cbr_refresh_does_not_block_other_quotes(cbr_state, monkeypatch):
+    previous = {"EUR": 100.0, "KRW": 0.07}
+    monkeypatch.setattr(customs, "_cbr_rates", previous)
+    monkeypatch.setattr(customs, "_cbr_rates_date", ON_DATE)
+
+    started = threading.Event()
+    release = threading.Event()
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {
+                "Valute": {
+                    "EUR": {"Value": 95.0, "Nominal": 1},
+                    "KRW": {"Value": 68.0, "Nominal": 1000},
+                }
+            }
+
+    def slow_get(url, **kwargs):
+        started.set()
+        release.wait(5)
+        return Response()
+
+    monkeypatch.setattr(customs.http_client, "get", slow_get)
+
+    refresher = threading.Thread(target=customs.get_cbr_rates)
+    refresher.start()
+    assert started.wait(5)
+
+    # Пока один поток ждёт ЦБ РФ, остальные сразу получают вчерашние курсы
+    assert customs.get_cbr_rates() is previous
+
+    release.set()
+    refresher.join(5)
+    assert customs.get_cbr_rates() == {"EUR": 95.0, "KRW": 0.068}
@@ -0,0 +1,182 @@
+import os
+
+import pytest
+
+import database
+
+MIGRATIONS = sorted(
+    filename
+    for filename in os.listdir(database.MIGRATIONS_DIR)
+    if filename.endswith(".sql")
+)
+DEFAULT_STATUS = "🔄 Не заказано"
+
+
+def execute(db, query, params=None):
+    with db.connect_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            if cur.description:
+                return cur.fetchall()
+
+
+def add_order(db, user_id, car_id, **fields):
+    fields = {"title": "Hyundai Sonata", "link": "https://encar.com", **fields}
+    columns = ", ".join(["user_id", "car_id", *fields])
+    placeholders = ", ".join(["%s"] * (len(fields) + 2))
+    return execute(
+        db,
+        f"INSERT INTO orders ({columns}) VALUES ({placeholders}) RETURNING id;",
+        (user_id, car_id, *fields.values()),
+    )[0]["id"]
+
+
+def test_migrations_are_recorded_once(db):
+    rows = execute(db, "SELECT version, name FROM schema_migrations ORDER BY version;")
+    assert [row["name"] for row in rows] == MIGRATIONS
+
+    # Повторный запуск (например, второй экземпляр бота) ничего не применяет
+    db.run_migrations()
+    assert len(execute(db, "SELECT version FROM schema_migrations;")) == len(rows)
+
+
+def test_duplicate_favorites_keep_the_order_in_progress(db):
+    # Дубликаты, появившиеся до уникального индекса
+    execute(db, "DROP INDEX orders_user_id_car_id_key;")
+    try:
+        untouched = add_order(db, 1, "100")
+        ordered = add_order(db, 1, "100", status="🕒 Ожидает подтверждения")
+        add_order(db, 1, "100", phone_number="+79990000000", full_name="Иван Иванов")
+        # Все записи по умолчанию — остаётся одна, с контактами клиента
+        add_order(db, 2, "200", phone_number="+79991111111")
+        add_order(db, 2, "200")
+        # 'Неизвестно' от add_favorite — это не контакты клиента
+        with_contacts = add_order(
+            db, 3, "300", phone_number="+79992222222", user_name="client3"
+        )
+        add_order(db, 3, "300", phone_number="Неизвестно", user_name="Неизвестно")
+        waiting = add_order(
+            db,
+            4,
+            "400",
+            status="🕒 Ожидает подтверждения",
+            phone_number="Неизвестно",
+            user_name="Неизвестно",
+        )
+        add_order(db, 4, "400", phone_number="+79993333333", user_name="client4")
+
+        path = os.path.join(database.MIGRATIONS_DIR, "0003_unique_favorites.sql")
+        with open(path, encoding="utf-8") as f:
+            execute(db, f.read())
+    finally:
+        execute(
+            db,
+            "CREATE UNIQUE INDEX IF NOT EXISTS orders_user_id_car_id_key "
+            "ON orders (user_id, car_id);",
+        )
+
+    rows = execute(
+        db,
+        "SELECT id, user_id, status, phone_number, full_name, user_name "
+        "FROM orders ORDER BY id;",
+    )
+    assert len(rows) == 4
+
+    first, second, third, fourth = rows
+    assert first["id"] == ordered != untouched
+    assert first["status"] == "🕒 Ожидает подтверждения"
+    assert first["phone_number"] == "+79990000000"
+    assert first["full_name"] == "Иван Иванов"
+
+    assert second["user_id"] == 2
+    assert second["status"] == DEFAULT_STATUS
+    assert second["phone_number"] == "+79991111111"
+
+    assert third["id"] == with_contacts
+    assert third["phone_number"] == "+79992222222"
+    assert third["user_name"] == "client3"
+
+    # Заявку оставляем, а настоящие контакты переносим из дубликата
+    assert fourth["id"] == waiting
+    assert fourth["status"] == "🕒 Ожидает подтверждения"
+    assert fourth["phone_number"] == "+79993333333"
+    assert fourth["user_name"] == "client4"
+
+
+@pytest.fixture
+def many_orders(db):
+    """50 000 заказов: почти все в статусе по умолчанию, как в избранном."""
+    execute(
+        db,
+        """
+        INSERT INTO orders (user_id, car_id, title, link, status, created_at)
+        SELECT mod(n, 5000),
+               n::TEXT,
+               'Kia K5',
+               'https://encar.com',
+               CASE WHEN mod(n, 100) = 0 THEN '🕒 Ожидает подтверждения'
+                    ELSE %s END,
+               NOW() - n * INTERVAL '1 minute'
+        FROM generate_series(1, 50000) AS n;
+        """,
+        (DEFAULT_STATUS,),
+    )
+    execute(db, "ANALYZE orders;")
+    return db
+
+
+def plan(db, query, params):
+    rows = execute(db, f"EXPLAIN (FORMAT JSON) {query}", params)
+    return rows[0]["QUERY PLAN"][0]["Plan"]
+
+
+def used_indexes(node):
+    indexes = {node["Index Name"]} if "Index Name" in node else set()
+    for child in node.get("Plans", []):
+        indexes |= used_indexes(child)
+    return indexes
+
+
+@pytest.mark.parametrize(
+    "query, params, index",
+    [
+        # get_orders
+        (
+            "SELECT * FROM orders WHERE user_id = %s;",
+            (42,),
+            "orders_user_id_car_id_key",
+        ),
+        # update_user_phone
+        (
+            "UPDATE orders SET phone_number = '+7' WHERE user_id = %s AND car_id = %s;",
+            (42, "5042"),
+            "orders_user_id_car_id_key",
+        ),
+        # update_user_name
+        (
+            "UPDATE orders SET user_name = 'client' WHERE user_id = %s;",
+            (42,),
+            "orders_user_id_car_id_key",
+        ),
+        # get_orders_page со статусом: первая и следующая страницы
+        (
+            "SELECT * FROM orders WHERE status = %s ORDER BY id ASC LIMIT 11;",
+            ("🕒 Ожидает подтверждения",),
+            "orders_status_id_idx",
+        ),
+        (
+            "SELECT * FROM orders WHERE status = %s AND id > %s "
+            "ORDER BY id ASC LIMIT 11;",
+            ("🕒 Ожидает подтверждения", 20000),
+            "orders_status_id_idx",
+        ),
+        # Заказы по статусу в порядке создания
+        (
+            "SELECT * FROM orders WHERE status = %s ORDER BY created_at LIMIT 10;",
+            ("🕒 Ожидает подтверждения",),
+            "orders_status_created_at_idx",
+        ),
+    ],
+)
+def test_queries_use_indexes(many_orders, query, params, index):
+    assert index in used_indexes(plan(many_orders, query, params))
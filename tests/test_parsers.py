@@ -0,0 +1,197 @@
+import importlib.util
+import json
+import logging
+import os
+
+import pytest
+from standin import Route, StandIn
+
+import marketplaces
+from parsers import (
+    Listing,
+    parse_chutcha_page,
+    parse_encar_vehicle,
+    parse_kbchacha_page,
+)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "listings")
+
+
+def fixture_text(filename):
+    with open(os.path.join(FIXTURES, filename), encoding="utf-8") as f:
+        return f.read()
+
+
+ENCAR = Listing(
+    source="encar",
+    car_id="38512345",
+    url="https://fem.encar.com/cars/detail/38512345",
+    title="Hyundai Sonata Premium",
+    price_krw=21_500_000,
+    year=2021,
+    month=5,
+    engine_volume=1999,
+    mileage_km=45123,
+    transmission="Автомат",
+    photo_urls=tuple(
+        f"https://ci.encar.com/carpicture08/pic3851/38512345_{n:03d}.jpg"
+        for n in range(1, 11)
+    ),
+    vehicle_id=38512345,
+    vehicle_no="123가4567",
+)
+KBCHACHA = Listing(
+    source="kbchacha",
+    car_id="26912345",
+    url="https://www.kbchachacha.com/public/car/detail.kbc?carSeq=26912345",
+    title="기아 K5 3세대 2.0 가솔린 프레스티지",
+    price_krw=23_900_000,
+    year=2021,
+    month=5,
+    engine_volume=1999,
+    mileage_km=38512,
+    transmission="Автомат",
+    photo_urls=tuple(
+        "https://img.kbchachacha.com/IMG/carimg/l/img04/img2691/"
+        f"26912345_{n}.jpg?width=720"
+        for n in range(1, 11)
+    ),
+    vehicle_no="12가3456",
+)
+CHUTCHA = Listing(
+    source="chutcha",
+    car_id="B12345678",
+    url="https://web.chutcha.net/bmc/detail/B12345678",
+    title="제네시스 G80 (RG3) 2.5 가솔린 터보 AWD",
+    price_krw=54_900_000,
+    year=2022,
+    month=3,
+    engine_volume=2497,
+    mileage_km=31200,
+    transmission="Автомат",
+    photo_urls=tuple(
+        f"https://imgsc.chutcha.kr/img/car/2025/04/B12345678_{n:02d}_ori.jpg"
+        "?s=1024x768&t=crop"
+        for n in range(1, 13)
+    ),
+    vehicle_no="34나5678",
+    own_damage_total=1_650_000,
+    other_damage_total=830_000,
+)
+
+# Площадка, сохранённый ответ, его тип и ожидаемое объявление
+CASES = [
+    (
+        marketplaces.EncarAdapter,
+        "encar_38512345.json",
+        "application/json",
+        ENCAR,
+    ),
+    (
+        marketplaces.KBChaChaAdapter,
+        "kbchacha_26912345.html",
+        "text/html; charset=utf-8",
+        KBCHACHA,
+    ),
+    (
+        marketplaces.ChutchaAdapter,
+        "chutcha_B12345678.html",
+        "text/html; charset=utf-8",
+        CHUTCHA,
+    ),
+]
+
+
+def test_encar_vehicle():
+    response = json.loads(fixture_text("encar_38512345.json"))
+    assert parse_encar_vehicle(response, "38512345") == ENCAR
+
+
+def test_kbchacha_page():
+    html = fixture_text("kbchacha_26912345.html")
+    assert parse_kbchacha_page(html, "26912345") == KBCHACHA
+
+
+def test_chutcha_page():
+    html = fixture_text("chutcha_B12345678.html")
+    assert parse_chutcha_page(html, "B12345678") == CHUTCHA
+
+
+def test_kbchacha_engine_volume_falls_back_to_title():
+    html = fixture_text("kbchacha_26912345.html").replace(
+        "<th>배기량</th><td>1,999cc</td>", "<th>배기량</th><td>-</td>"
+    )
+    assert parse_kbchacha_page(html, "26912345").engine_volume == 2000
+
+
+@pytest.mark.parametrize(
+    "parse, text",
+    [
+        (parse_kbchacha_page, "<html><body>Страница не найдена</body></html>"),
+        (parse_chutcha_page, "<html><body>Страница не найдена</body></html>"),
+    ],
+)
+def test_page_without_data_is_logged(parse, text, caplog):
+    with caplog.at_level(logging.ERROR):
+        assert parse(text, "1") is None
+    assert "JSON-данные" in caplog.text
+
+
+@pytest.mark.parametrize("adapter_class, filename, content_type, expected", CASES)
+def test_adapter_fetches_listing(adapter_class, filename, content_type, expected):
+    path = f"/listing/{expected.car_id}"
+    routes = {path: Route(fixture_text(filename), content_type)}
+
+    with StandIn(routes) as server:
+        adapter = adapter_class()
+        adapter.listing_url = lambda car_id: server.url(f"/listing/{car_id}")
+        assert adapter.fetch(expected.car_id) == expected
+        assert server.requests == 1
+
+
+def test_encar_error_status():
+    routes = {"/listing/1": Route('{"message": "not found"}', "application/json", 404)}
+
+    with StandIn(routes) as server:
+        adapter = marketplaces.EncarAdapter()
+        adapter.listing_url = lambda car_id: server.url(f"/listing/{car_id}")
+        assert adapter.fetch("1") is None
+
+
+@pytest.mark.skipif(
+    importlib.util.find_spec("pytest_benchmark") is None,
+    reason="нужен pytest-benchmark",
+)
+@pytest.mark.parametrize("adapter_class, filename, content_type, expected", CASES)
+def test_parse_speed(benchmark, adapter_class, filename, content_type, expected):
+    text = fixture_text(filename)
+    adapter = adapter_class()
+    assert benchmark(adapter.parse, 200, text, expected.car_id) == expected
+
+
+def test_adapter_must_implement_parsing():
+    class NoParse(marketplaces.ListingAdapter):
+        def parse_car_id(self, url):
+            return "1"
+
+        def listing_url(self, car_id):
+            return f"https://example.com/{car_id}"
+
+    with pytest.raises(TypeError):
+        NoParse()
+
+
+def test_kbchacha_short_link_is_resolved_once():
+    location = "/public/car/detail.kbc?carSeq=26912345"
+    routes = {
+        "/short": Route("", status=302, headers={"Location": location}),
+        "/public/car/detail.kbc": Route(fixture_text("kbchacha_26912345.html")),
+    }
+
+    with StandIn(routes) as server:
+        adapter = marketplaces.KBChaChaAdapter()
+        link = server.url("/short?c=a1b2c3")
+        assert adapter.parse_car_id(link) == "26912345"
+        # Предзагрузка в BOT_MODE=async и расчёт разбирают одну и ту же ссылку
+        assert adapter.parse_car_id(link) == "26912345"
+        assert server.requests == 2  # Редирект и страница — только один раз
@@ -0,0 +1,163 @@
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from telebot.apihelper import ApiTelegramException
+
+import photos
+from standin import Route, StandIn, make_jpeg
+
+STALE_FILE_ID = ApiTelegramException(
+    "sendMediaGroup",
+    None,
+    {
+        "error_code": 400,
+        "description": "Bad Request: wrong file identifier/HTTP URL specified",
+    },
+)
+FLOOD = ApiTelegramException(
+    "sendMediaGroup",
+    None,
+    {"error_code": 429, "description": "Too Many Requests: retry after 5"},
+)
+
+
+class FakeBot:
+    """Читает отправленные файлы так же, как это делает telebot при загрузке."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.sent = []
+
+    def send_media_group(self, chat_id, media):
+        uploads = [
+            item.media if isinstance(item.media, str) else item.media.read()
+            for item in media
+        ]
+        self.sent.append(uploads)
+
+        if self.errors:
+            raise self.errors.pop(0)
+
+        return [
+            SimpleNamespace(photo=[SimpleNamespace(file_id=f"new-{number}")])
+            for number in range(len(media))
+        ]
+
+
+@pytest.fixture
+def album_env(monkeypatch):
+    forgotten = []
+    saved = {}
+
+    monkeypatch.setattr(photos, "PHOTO_RESIZE", False)
+    monkeypatch.setattr(photos, "photo_file_ids", photos.TTLCache(maxsize=100))
+    monkeypatch.setattr(photos, "get_photo_file_ids", lambda urls: {})
+    monkeypatch.setattr(photos, "save_photo_file_ids", saved.update)
+    monkeypatch.setattr(photos, "delete_photo_file_ids", forgotten.extend)
+
+    routes = {
+        f"/{number}.jpg": Route(b"jpeg-%d" % number, "image/jpeg")
+        for number in range(3)
+    }
+    with StandIn(routes) as server, ThreadPoolExecutor(max_workers=4) as executor:
+        urls = [server.url(path) for path in routes]
+        # Первое фото уже отправлялось — его file_id в кеше
+        photos.photo_file_ids.set(urls[0], "stale-file-id")
+        yield SimpleNamespace(
+            urls=urls, executor=executor, forgotten=forgotten, saved=saved
+        )
+
+
+def test_stale_file_id_in_mixed_chunk_is_refetched(album_env):
+    bot = FakeBot(errors=[STALE_FILE_ID])
+    album = photos.PhotoAlbum(album_env.urls, album_env.executor)
+
+    album.send(bot, chat_id=1)
+
+    first, retry = bot.sent
+    assert first == ["stale-file-id", b"jpeg-1", b"jpeg-2"]
+    # Загруженные фото отправлены повторно с начала файла, а не пустыми
+    assert retry == [b"jpeg-0", b"jpeg-1", b"jpeg-2"]
+
+    assert album_env.forgotten == [album_env.urls[0]]
+    assert set(album_env.saved) == set(album_env.urls)
+    assert photos.photo_buffers.stats()["current"] == 0
+
+
+def test_other_telegram_errors_keep_file_ids(album_env):
+    bot = FakeBot(errors=[FLOOD])
+    album = photos.PhotoAlbum(album_env.urls, album_env.executor)
+
+    with pytest.raises(ApiTelegramException):
+        album.send(bot, chat_id=1)
+
+    assert len(bot.sent) == 1
+    assert album_env.forgotten == []
+    assert photos.photo_file_ids.get(album_env.urls[0]) == "stale-file-id"
+
+
+CARS = 20
+PHOTOS_PER_CAR = 10
+
+
+def test_memory_of_20_concurrent_quotes_is_bounded(monkeypatch):
+    monkeypatch.setattr(photos, "PHOTO_RESIZE", photos.Image is not None)
+    monkeypatch.setattr(photos, "PHOTO_MAX_BYTES", 400 * 1024)
+    monkeypatch.setattr(photos, "photo_file_ids", photos.TTLCache(maxsize=100))
+    monkeypatch.setattr(photos, "get_photo_file_ids", lambda urls: {})
+    monkeypatch.setattr(photos, "photo_buffers", photos.BufferGauge())
+
+    photo = make_jpeg(660, 480)  # ~280 КБ
+    oversized = make_jpeg(800, 600)  # больше PHOTO_MAX_BYTES — не загружается
+    assert len(photo) < photos.PHOTO_MAX_BYTES < len(oversized)
+
+    routes = {}
+    for car in range(CARS):
+        for number in range(PHOTOS_PER_CAR):
+            body = oversized if number == PHOTOS_PER_CAR - 1 else photo
+            routes[f"/{car}/{number}.jpg"] = Route(body, "image/jpeg")
+
+    def quote(urls):
+        album = photos.PhotoAlbum(urls, photo_executor)
+        try:
+            media = album.media()
+        finally:
+            album.close()
+        return album, len(media)
+
+    with StandIn(routes) as server, ThreadPoolExecutor(
+        max_workers=photos.PHOTO_PARALLELISM
+    ) as photo_executor, ThreadPoolExecutor(max_workers=CARS) as quote_executor:
+        albums = [
+            [server.url(f"/{car}/{number}.jpg") for number in range(PHOTOS_PER_CAR)]
+            for car in range(CARS)
+        ]
+
+        tracemalloc.start()
+        try:
+            results = list(quote_executor.map(quote, albums))
+            _, traced_peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    album_limit = (PHOTOS_PER_CAR - 1) * len(photo) + photos.PHOTO_MAX_BYTES
+    for album, sent in results:
+        assert sent == PHOTOS_PER_CAR - 1
+        assert album.buffers.peak <= album_limit
+        assert album.buffers.current == 0
+        if photos.PHOTO_RESIZE:
+            # Исходное фото учитывается с начала загрузки, до уменьшения
+            assert album.bytes_out < album.bytes_in
+            assert album.buffers.peak > album.bytes_out
+
+    assert photos.photo_buffers.current == 0
+    assert photos.photo_buffers.peak <= CARS * album_limit
+    # Python-память всех расчётов укладывается в учтённые буферы
+    # с запасом на ответы HTTP и служебные объекты
+    assert traced_peak <= photos.photo_buffers.peak + 16 * 1024 * 1024
+    print(
+        f"\n{CARS} расчётов: пик буферов {photos.photo_buffers.peak // 1024} КБ, "
+        f"пик tracemalloc {traced_peak // 1024} КБ"
+    )
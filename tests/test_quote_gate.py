@@ -0,0 +1,79 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+PARALLEL_QUOTES = 20
+FREE_LIMIT = 2
+
+
+def consume_in_parallel(db, user_id, free_access=False):
+    """Запускает PARALLEL_QUOTES расчётов одного пользователя одновременно."""
+    barrier = threading.Barrier(PARALLEL_QUOTES)
+
+    def consume(_):
+        barrier.wait(5)
+        return db.consume_quote(
+            {"user_id": user_id, "username": "client"},
+            FREE_LIMIT,
+            free_access=free_access,
+        )
+
+    with ThreadPoolExecutor(max_workers=PARALLEL_QUOTES) as executor:
+        return list(executor.map(consume, range(PARALLEL_QUOTES)))
+
+
+def stored_count(db, user_id):
+    with db.connect_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT count FROM calculations WHERE user_id = %s;", (user_id,)
+            )
+            return cur.fetchone()["count"]
+
+
+@pytest.mark.parametrize("used", [0, 1])
+def test_parallel_quotes_stop_exactly_at_free_limit(db, used):
+    for _ in range(used):
+        assert db.consume_quote({"user_id": 1}, FREE_LIMIT)["allowed"]
+
+    results = consume_in_parallel(db, user_id=1)
+
+    allowed = [result for result in results if result["allowed"]]
+    assert len(allowed) == FREE_LIMIT - used
+    assert sorted(result["count"] for result in allowed) == list(
+        range(used + 1, FREE_LIMIT + 1)
+    )
+    assert all(not result["subscribed"] for result in results)
+    assert stored_count(db, 1) == FREE_LIMIT
+
+
+def test_subscribers_are_not_limited(db):
+    db.consume_quote({"user_id": 2}, FREE_LIMIT)
+    db.update_user_subscription(2, True)
+
+    results = consume_in_parallel(db, user_id=2)
+
+    assert all(result["allowed"] and result["subscribed"] for result in results)
+    assert stored_count(db, 2) == PARALLEL_QUOTES + 1
+
+
+def test_free_access_users_are_not_limited(db):
+    results = consume_in_parallel(db, user_id=3, free_access=True)
+
+    assert all(result["allowed"] for result in results)
+    assert stored_count(db, 3) == PARALLEL_QUOTES
+
+
+def test_quote_available_does_not_consume(db):
+    assert db.quote_available(4, FREE_LIMIT)
+
+    for _ in range(FREE_LIMIT):
+        assert db.quote_available(4, FREE_LIMIT)
+        assert db.consume_quote({"user_id": 4}, FREE_LIMIT)["allowed"]
+
+    assert not db.quote_available(4, FREE_LIMIT)
+    assert stored_count(db, 4) == FREE_LIMIT
+
+    db.update_user_subscription(4, True)
+    assert db.quote_available(4, FREE_LIMIT)
@@ -0,0 +1,40 @@
+import time
+
+import pytest
+
+from utils import TokenBucket
+
+
+def test_burst_passes_then_requests_are_spaced():
+    bucket = TokenBucket(rate=20, burst=2)
+
+    started = time.monotonic()
+    waits = [bucket.acquire() for _ in range(4)]
+    elapsed = time.monotonic() - started
+
+    # Первые два запроса проходят сразу, следующие ждут по 1/20 с
+    assert waits[:2] == [0.0, 0.0]
+    assert all(wait > 0 for wait in waits[2:])
+    assert elapsed >= 0.09
+
+    stats = bucket.stats()
+    assert stats["acquired"] == 4
+    assert stats["throttled"] == 2
+    assert stats["total_wait"] == pytest.approx(sum(waits))
+
+
+@pytest.mark.parametrize(
+    "waits, p95",
+    [
+        ([], 0.0),
+        ([0.5], 0.5),
+        # Ближайший ранг: ceil(0.95 * 20) = 19-е значение, а не максимум
+        ([float(n) for n in range(1, 21)], 19.0),
+        ([float(n) for n in range(1, 7)], 6.0),
+    ],
+)
+def test_p95_wait_uses_nearest_rank(waits, p95):
+    bucket = TokenBucket(rate=1, burst=1)
+    bucket._wait_times.extend(waits)
+
+    assert bucket.stats()["p95_wait"] == p95